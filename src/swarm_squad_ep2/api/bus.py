@@ -0,0 +1,327 @@
+"""
+Broadcast bus relaying published messages between API worker processes.
+
+With one worker, `LocalBus` hands every published message straight to the
+local room manager. With `uvicorn --workers N` each worker only knows its
+own WebSocket subscribers, so `UnixSocketBus` relays messages through a hub
+on a Unix domain socket, with no external broker:
+
+- The first worker to take an exclusive lock next to the socket path binds
+  the socket and becomes the hub; the others connect to it. If the hub's
+  worker exits, its lock is released and the others elect a new hub.
+- Every worker, the hub's own included, sends what it publishes to the hub
+  and delivers only what the hub sends back. All workers therefore see the
+  messages in the hub's order, so per-room sequence numbers agree across
+  workers as long as every worker remembers the room.
+- Past SWARM_SQUAD_WS_MAX_ROOMS rooms, each worker forgets its least
+  recently used rooms without subscribers of its own, so the same room may
+  be forgotten by some workers and not others. A forgotten room's seqs
+  restart at 1 in that worker only, and a subscriber resuming it with
+  `since` on another worker may be replayed the wrong messages or told of a
+  gap that is not there. Raise the limit above the number of rooms in use
+  to keep seqs aligned; `forgotten_rooms` in the room stats counts them.
+- While a worker is not connected it delivers its own messages locally, so
+  its subscribers keep receiving them. Those messages take seqs only in
+  that worker, so its per-room seqs stay ahead of the other workers' for
+  good: a subscriber resuming on another worker with `since` may be
+  replayed the wrong messages, or miss some. `local_fallbacks` in the
+  bus stats counts such messages; restart the workers to realign.
+- Publishing waits while the hub is slow to take frames, so a stuck hub
+  pushes back on publishers instead of growing the worker's memory.
+
+Frames on the socket are a 4-byte little-endian length and a JSON object
+`{"message": ..., "rooms": [...]}`.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import struct
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Type
+
+logger = logging.getLogger(__name__)
+
+# Bus implementation: "local" (single worker) or "unix"
+BUS = os.environ.get("SWARM_SQUAD_BUS", "local")
+
+# Unix domain socket of the hub, shared by all workers of one server
+BUS_PATH = os.environ.get(
+    "SWARM_SQUAD_BUS_PATH", os.path.join(tempfile.gettempdir(), "swarm-squad-bus.sock")
+)
+
+# Bytes a worker may lag behind the hub before it is dropped and reconnects
+BUS_MAX_BUFFER = int(os.environ.get("SWARM_SQUAD_BUS_MAX_BUFFER", str(8 << 20)))
+
+# Seconds between attempts to reach or become the hub
+BUS_RETRY_INTERVAL = 0.2
+
+_LENGTH = struct.Struct("<I")
+
+Deliver = Callable[[Dict[str, Any], List[str]], Awaitable[Any]]
+
+
+def encode_bus_frame(message: Dict[str, Any], rooms: List[str]) -> bytes:
+    """Encode a published message as a length-prefixed bus frame."""
+    body = json.dumps(
+        {"message": message, "rooms": rooms},
+        separators=(",", ":"),
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return _LENGTH.pack(len(body)) + body
+
+
+async def read_bus_frame(reader: asyncio.StreamReader) -> bytes:
+    """
+    Read the body of the next bus frame.
+
+    Raises:
+        asyncio.IncompleteReadError: If the stream ends
+    """
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+class BroadcastBus(ABC):
+    """Publishes messages to the subscribers of every worker process."""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+        self.published = 0
+        self.delivered = 0
+
+    async def start(self, deliver: Deliver) -> None:
+        """Start relaying; `deliver` broadcasts to this worker's subscribers."""
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        """Stop relaying."""
+
+    @abstractmethod
+    async def publish(self, message: Dict[str, Any], rooms: List[str]) -> None:
+        """Broadcast a message to the subscribers of `rooms` in every worker."""
+
+    async def _deliver_local(self, message: Dict[str, Any], rooms: List[str]):
+        if self._deliver is None:
+            logger.warning("Broadcast bus is not started; message dropped")
+            return
+        self.delivered += 1
+        await self._deliver(message, rooms)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "bus": type(self).__name__,
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+
+class LocalBus(BroadcastBus):
+    """Delivers published messages to this process only."""
+
+    async def publish(self, message: Dict[str, Any], rooms: List[str]) -> None:
+        self.published += 1
+        await self._deliver_local(message, rooms)
+
+
+class UnixSocketBus(BroadcastBus):
+    """
+    Relays published messages between workers through a Unix socket hub.
+
+    Args:
+        path: Socket path shared by all workers; the hub lock is `path.lock`
+        max_buffer: Bytes a worker may lag behind before the hub drops it
+    """
+
+    def __init__(self, path: str = BUS_PATH, max_buffer: int = BUS_MAX_BUFFER):
+        super().__init__()
+        self.path = path
+        self.max_buffer = max_buffer
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Set[asyncio.StreamWriter] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+        self.relayed = 0
+        self.local_fallbacks = 0
+        self.reconnects = 0
+        self.dropped_peers = 0
+
+    @property
+    def is_hub(self) -> bool:
+        return self._server is not None
+
+    async def start(self, deliver: Deliver) -> None:
+        await super().start(deliver)
+        self._task = asyncio.create_task(self._run())
+        # Give startup a moment to join, so early messages reach every worker
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=2.0)
+        except asyncio.TimeoutError:
+            logger.warning(f"Broadcast bus hub {self.path} not reachable yet")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._close_client()
+        await self._stop_hub()
+
+    async def publish(self, message: Dict[str, Any], rooms: List[str]) -> None:
+        self.published += 1
+        writer = self._writer
+        if writer is not None and not writer.is_closing():
+            writer.write(encode_bus_frame(message, rooms))
+            try:
+                await writer.drain()
+                return
+            except ConnectionError:
+                logger.warning("Lost broadcast bus hub while publishing")
+        # Not connected to the hub: this worker's subscribers still get it,
+        # numbered out of step with the other workers
+        if not self.local_fallbacks:
+            logger.warning(
+                "Delivering broadcasts locally; per-room seqs of this worker "
+                "now differ from the other workers'"
+            )
+        self.local_fallbacks += 1
+        await self._deliver_local(message, rooms)
+
+    async def _run(self) -> None:
+        """Keep a connection to the hub, becoming the hub when it is gone."""
+        while True:
+            if self._lock_fd is None and self._acquire_hub_lock():
+                await self._start_hub()
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(BUS_RETRY_INTERVAL)
+                continue
+            self._connected.set()
+            logger.info(
+                f"Joined broadcast bus {self.path}{' as hub' if self.is_hub else ''}"
+            )
+            try:
+                while True:
+                    body = await read_bus_frame(reader)
+                    frame = json.loads(body)
+                    try:
+                        await self._deliver_local(frame["message"], frame["rooms"])
+                    except Exception as e:
+                        logger.error(f"Error delivering bus message: {e}")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning("Lost broadcast bus hub; reconnecting")
+            finally:
+                self._connected.clear()
+                self._close_client()
+            self.reconnects += 1
+            await asyncio.sleep(BUS_RETRY_INTERVAL)
+
+    def _close_client(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _acquire_hub_lock(self) -> bool:
+        """Take the hub lock if no other worker holds it."""
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _start_hub(self) -> None:
+        # Only the lock holder binds, so a leftover socket file is stale
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._server = await asyncio.start_unix_server(self._serve_peer, self.path)
+        logger.info(f"Broadcast bus hub listening on {self.path}")
+
+    async def _stop_hub(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        for peer in list(self._peers):
+            peer.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _serve_peer(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Relay every frame a worker publishes to all workers, in hub order."""
+        self._peers.add(writer)
+        try:
+            while True:
+                body = await read_bus_frame(reader)
+                frame = _LENGTH.pack(len(body)) + body
+                self.relayed += 1
+                for peer in list(self._peers):
+                    if peer.transport.get_write_buffer_size() > self.max_buffer:
+                        # A stuck worker must not grow the hub's memory
+                        logger.warning("Dropping broadcast bus peer lagging behind")
+                        self.dropped_peers += 1
+                        self._peers.discard(peer)
+                        peer.close()
+                        continue
+                    peer.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "path": self.path,
+            "hub": self.is_hub,
+            "connected": self._connected.is_set(),
+            "peers": len(self._peers) if self.is_hub else None,
+            "relayed": self.relayed,
+            "local_fallbacks": self.local_fallbacks,
+            "reconnects": self.reconnects,
+            "dropped_peers": self.dropped_peers,
+        }
+
+
+# Buses selectable by name, e.g. through SWARM_SQUAD_BUS
+BUSES: Dict[str, Type[BroadcastBus]] = {
+    "local": LocalBus,
+    "unix": UnixSocketBus,
+}
+
+
+def create_bus(name: str = BUS) -> BroadcastBus:
+    """
+    Create a broadcast bus by name.
+
+    Raises:
+        ValueError: If no bus has that name
+    """
+    try:
+        return BUSES[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown broadcast bus {name!r}; expected one of {', '.join(BUSES)}"
+        ) from None
@@ -0,0 +1,1172 @@
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from fastapi import WebSocket
+
+from swarm_squad_ep2.api.wire import (
+    SUBPROTOCOL,
+    BinaryFrame,
+    InternTable,
+    encode_batch,
+    encode_state,
+)
+
+logger = logging.getLogger(__name__)
+
+# Frames queued per connection before the slow-consumer policy applies
+SEND_QUEUE_SIZE = int(os.environ.get("SWARM_SQUAD_WS_QUEUE_SIZE", "256"))
+
+# What to do when a connection's queue is full:
+#   "drop_oldest" - discard the oldest queued frame
+#   "conflate"    - replace a queued update of the same entity in the same room
+#                   with the newer one, else discard the oldest frame
+#   "disconnect"  - close the connection
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "conflate", "disconnect")
+SLOW_CONSUMER_POLICY = os.environ.get("SWARM_SQUAD_WS_SLOW_POLICY", "drop_oldest")
+
+# Close code sent to consumers disconnected for falling behind (Try Again Later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# Default micro-batching of connections: collect frames for up to this many
+# milliseconds (0 disables batching) or this many frames, then send one frame
+BATCH_MS = float(os.environ.get("SWARM_SQUAD_WS_BATCH_MS", "0"))
+BATCH_MAX = int(os.environ.get("SWARM_SQUAD_WS_BATCH_MAX", "64"))
+
+# Recent messages kept per room for subscribers resuming with `since`
+REPLAY_BUFFER_SIZE = int(os.environ.get("SWARM_SQUAD_WS_REPLAY_SIZE", "256"))
+
+# Rooms whose seq and replay buffer are remembered; beyond this many, the
+# least recently used rooms without subscribers are forgotten. Workers forget
+# rooms on their own, after which their seqs of those rooms disagree
+MAX_ROOMS = int(os.environ.get("SWARM_SQUAD_WS_MAX_ROOMS", "4096"))
+
+# Seconds a connection may stay silent before it is sent a "ping" (0 disables
+# heartbeats), and seconds it then has to send anything before it is closed
+HEARTBEAT_INTERVAL = float(os.environ.get("SWARM_SQUAD_WS_HEARTBEAT", "30"))
+HEARTBEAT_TIMEOUT = float(os.environ.get("SWARM_SQUAD_WS_HEARTBEAT_TIMEOUT", "10"))
+
+# Seconds between ticks of the heartbeat wheel
+HEARTBEAT_TICK = 1.0
+
+# Close code sent to connections that stopped answering pings (Going Away)
+HEARTBEAT_CLOSE_CODE = 1001
+
+# Marks the queue keys of control frames, which are never batched or dropped
+_CONTROL = object()
+
+
+def _is_control(key: Hashable) -> bool:
+    return isinstance(key, tuple) and key[0] is _CONTROL
+
+
+# A frame is a JSON-serializable dict, pre-encoded text such as "pong", or a
+# binary frame for connections using the binary subprotocol
+Frame = Union[Dict[str, Any], str, BinaryFrame]
+
+
+def encode_frame(message: Dict[str, Any]) -> str:
+    """Encode a message the way WebSocket.send_json() would."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_for_rooms(
+    message: Dict[str, Any],
+    rooms: List[str],
+    seqs: Optional[Dict[str, int]] = None,
+) -> Dict[str, str]:
+    """
+    Encode a message once and derive a frame per room from it.
+
+    Rooms only differ in `room_id` and `seq`, so the rest of the message is
+    encoded a single time and each room's fields are spliced in front of it.
+
+    Args:
+        message: Message to encode
+        rooms: Rooms to derive frames for
+        seqs: Sequence number of the message in each room, if any
+
+    Returns:
+        Dict mapping each room to its encoded frame
+    """
+    body = {k: v for k, v in message.items() if k not in ("room_id", "seq")}
+    encoded = encode_frame(body)
+    rest = "}" if encoded == "{}" else "," + encoded[1:]
+    if seqs is None:
+        return {room: '{"room_id":' + encode_frame(room) + rest for room in rooms}
+    return {
+        room: '{"room_id":' + encode_frame(room) + ',"seq":' + str(seqs[room]) + rest
+        for room in rooms
+    }
+
+
+def conflation_key(message: Dict[str, Any]) -> Optional[Hashable]:
+    """
+    Key under which newer messages may replace queued ones, or None.
+
+    Updates of one entity in one room supersede each other; alerts and
+    messages without an entity are never conflated.
+    """
+    entity_id = message.get("entity_id")
+    if entity_id is None or "alert" in (message.get("message_type") or ""):
+        return None
+    return (message.get("room_id"), entity_id)
+
+
+class ClientConnection:
+    """
+    A subscribed WebSocket with a bounded outbound queue.
+
+    Broadcasts only queue frames; a writer task per connection sends them, so
+    a slow client delays nobody but itself. When the queue is full, `policy`
+    decides what gives. Control frames such as acks and "ping" do not count
+    against `queue_size` and are never dropped to make room.
+
+    A subscription may carry a maximum delivery rate. Entity updates of its
+    rooms are then held per room, superseded by newer updates of the same
+    entity, and released at most `rate` times per second. Frames without a
+    conflation key, such as alerts, are never held.
+
+    With `batch_ms` set, the writer collects frames for up to that long, or
+    until `batch_max` are queued, and sends them as one frame: a JSON array
+    of the messages, or a binary BATCH frame. Control frames such as "pong"
+    and acks are always sent on their own, in queue order.
+
+    Args:
+        websocket: The accepted WebSocket
+        rooms: Rooms the connection is subscribed to
+        queue_size: Frames queued before the policy applies
+        policy: One of SLOW_CONSUMER_POLICIES
+        on_close: Called with the WebSocket once the writer stops
+        intern_table: Strings of binary frames, if the connection negotiated
+            the binary subprotocol
+        batch_ms: Milliseconds to collect frames for a batch, 0 to disable
+        batch_max: Most frames in a batch
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        rooms: List[str],
+        queue_size: int = SEND_QUEUE_SIZE,
+        policy: str = SLOW_CONSUMER_POLICY,
+        on_close: Optional[Callable[[WebSocket], None]] = None,
+        intern_table: Optional[InternTable] = None,
+        batch_ms: float = BATCH_MS,
+        batch_max: int = BATCH_MAX,
+    ):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(
+                f"Unknown slow-consumer policy {policy!r}; "
+                f"expected one of {', '.join(SLOW_CONSUMER_POLICIES)}"
+            )
+        self.id = next(self._ids)
+        self.websocket = websocket
+        self.rooms: Set[str] = set(rooms)
+        self.queue_size = max(1, queue_size)
+        self.policy = policy
+        self.on_close = on_close
+        self.intern_table = intern_table
+        self.binary = intern_table is not None
+        self._interned = 0
+        self.batch_delay = max(0.0, batch_ms) / 1000
+        self.batch_max = max(1, batch_max)
+        self._batch_full = asyncio.Event()
+        self.closed = False
+        self._pending: "OrderedDict[Hashable, Frame]" = OrderedDict()
+        self._controls = 0
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.rates: Dict[str, float] = {}
+        self._room_rates: Dict[str, Optional[float]] = {}
+        self._held: Dict[str, "OrderedDict[Hashable, Frame]"] = {}
+        self._flush_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._last_flush: Dict[str, float] = {}
+        # Heartbeat state, see HeartbeatWheel
+        self.last_seen = time.monotonic()
+        self.pinged_at: Optional[float] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def free(self) -> int:
+        """Broadcast frames that can be queued before the policy applies."""
+        return max(0, self.queue_size - (len(self._pending) - self._controls))
+
+    def start(self) -> None:
+        """Start the writer task on the running event loop."""
+        self._task = asyncio.create_task(self._run(), name=f"ws-writer-{self.id}")
+
+    def stop(self) -> None:
+        """Stop the writer and discard queued frames."""
+        self.closed = True
+        self._pending.clear()
+        self._controls = 0
+        self._held.clear()
+        for timer in self._flush_timers.values():
+            timer.cancel()
+        self._flush_timers.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def set_rate(self, subscription: str, max_rate: Optional[float]) -> None:
+        """Set or clear the maximum delivery rate of a subscription, in Hz."""
+        if max_rate is None:
+            self.rates.pop(subscription, None)
+        else:
+            self.rates[subscription] = max_rate
+        self._room_rates.clear()
+
+    def rate_for(self, room: str) -> Optional[float]:
+        """
+        Get the maximum delivery rate of a room, or None if unlimited.
+
+        An exact subscription to the room decides; otherwise the longest
+        matching pattern does.
+        """
+        if room in self._room_rates:
+            return self._room_rates[room]
+        if room in self.rooms:
+            rate = self.rates.get(room)
+        else:
+            rate = None
+            longest = -1
+            for subscription in self.rooms:
+                prefix = pattern_prefix(subscription)
+                if (
+                    prefix is not None
+                    and len(prefix) > longest
+                    and room.startswith(prefix)
+                ):
+                    longest = len(prefix)
+                    rate = self.rates.get(subscription)
+        self._room_rates[room] = rate
+        return rate
+
+    def offer(
+        self,
+        frame: Frame,
+        key: Optional[Hashable] = None,
+        control: bool = False,
+        room: Optional[str] = None,
+    ) -> bool:
+        """
+        Queue a frame without waiting.
+
+        Args:
+            frame: Frame to send
+            key: Conflation key of the frame, see conflation_key()
+            control: Queue even when full, e.g. for "pong"
+            room: Room the frame was broadcast to, for rate-limited rooms
+
+        Returns:
+            False if the connection is closed or must be disconnected
+        """
+        if self.closed:
+            return False
+        if room is not None and key is not None and not control and self.rates:
+            rate = self.rate_for(room)
+            if rate is not None:
+                self._hold(room, key, frame, rate)
+                return True
+        return self._enqueue(frame, key, control)
+
+    def _hold(self, room: str, key: Hashable, frame: Frame, rate: float) -> None:
+        """Keep the latest frame per key until the room's next release."""
+        held = self._held.setdefault(room, OrderedDict())
+        if key in held:
+            self.conflated += 1
+        held[key] = frame
+        if room not in self._flush_timers:
+            loop = asyncio.get_running_loop()
+            due = max(loop.time(), self._last_flush.get(room, 0.0) + 1.0 / rate)
+            self._flush_timers[room] = loop.call_at(due, self._flush, room)
+
+    def _flush(self, room: str) -> None:
+        """Release the frames held for a room into the send queue."""
+        self._flush_timers.pop(room, None)
+        held = self._held.pop(room, None)
+        if self.closed or not held:
+            return
+        self._last_flush[room] = asyncio.get_running_loop().time()
+        for key, frame in held.items():
+            if not self._enqueue(frame, key, False):
+                logger.warning(f"Disconnecting slow WebSocket consumer {self.id}")
+                asyncio.create_task(self.close(SLOW_CONSUMER_CLOSE_CODE))
+                return
+
+    def _enqueue(self, frame: Frame, key: Optional[Hashable], control: bool) -> bool:
+        if self.policy == "conflate" and key is not None and key in self._pending:
+            # Keeps the queued frame's position, so order across keys holds
+            self._pending[key] = frame
+            self.conflated += 1
+            return True
+        if not control and not self.free:
+            if self.policy == "disconnect":
+                return False
+            self._drop_oldest()
+        if control:
+            self._controls += 1
+            key = (_CONTROL, next(self._seq))
+        elif self.policy != "conflate" or key is None:
+            key = next(self._seq)
+        self._pending[key] = frame
+        self.max_depth = max(self.max_depth, len(self._pending))
+        self._wakeup.set()
+        if len(self._pending) >= self.batch_max:
+            self._batch_full.set()
+        return True
+
+    def _drop_oldest(self) -> None:
+        """Discard the oldest queued frame that is not a control frame."""
+        for key in self._pending:
+            if not _is_control(key):
+                del self._pending[key]
+                self.dropped += 1
+                return
+
+    def _pop(self) -> Tuple[Hashable, Frame]:
+        key, frame = self._pending.popitem(last=False)
+        if _is_control(key):
+            self._controls -= 1
+        return key, frame
+
+    async def close(self, code: int = 1000) -> None:
+        """Stop the writer and close the WebSocket."""
+        self.stop()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        client = self.websocket.client
+        return {
+            "id": self.id,
+            "client": f"{client.host}:{client.port}" if client else None,
+            "idle": round(time.monotonic() - self.last_seen, 3),
+            "rooms": sorted(self.rooms),
+            "policy": self.policy,
+            "binary": self.binary,
+            "batch_ms": self.batch_delay * 1000,
+            "batch_max": self.batch_max,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "queue_size": self.queue_size,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+            "batches": self.batches,
+            "held": sum(len(held) for held in self._held.values()),
+            "max_rates": self.rates,
+        }
+
+    def _definitions(self, max_id: int) -> Optional[bytes]:
+        """Get the INTERN frame this connection needs before `max_id`, if any."""
+        if max_id < self._interned:
+            return None
+        definitions = self.intern_table.encode_definitions(self._interned)
+        self._interned = len(self.intern_table)
+        return definitions
+
+    async def _send(self, frame: Frame) -> None:
+        if isinstance(frame, BinaryFrame):
+            # Define the interned strings this connection has not seen yet
+            definitions = self._definitions(frame.max_id)
+            if definitions is not None:
+                await self.websocket.send_bytes(definitions)
+            await self.websocket.send_bytes(frame.data)
+        elif isinstance(frame, str):
+            await self.websocket.send_text(frame)
+        else:
+            await self.websocket.send_json(frame)
+
+    async def _collect_batch(self) -> List[Any]:
+        """Wait for a batch to fill or time out and take it off the queue."""
+        if len(self._pending) < self.batch_max:
+            self._batch_full.clear()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.batch_delay)
+            except asyncio.TimeoutError:
+                pass
+        count = min(self.batch_max, len(self._pending))
+        return [self._pop() for _ in range(count)]
+
+    async def _send_batch(self, items: List[Any]) -> None:
+        """Send queued (key, frame) items, joining runs of broadcast frames."""
+        run: List[Frame] = []
+        for key, frame in items:
+            control = _is_control(key)
+            if run and (
+                control
+                or isinstance(frame, BinaryFrame) != isinstance(run[0], BinaryFrame)
+            ):
+                await self._send_run(run)
+                run = []
+            if control:
+                await self._send(frame)
+            else:
+                run.append(frame)
+            self.sent += 1
+        if run:
+            await self._send_run(run)
+
+    async def _send_run(self, run: List[Frame]) -> None:
+        if len(run) == 1:
+            await self._send(run[0])
+            return
+        self.batches += 1
+        if isinstance(run[0], BinaryFrame):
+            frames = [frame.data for frame in run]
+            definitions = self._definitions(max(frame.max_id for frame in run))
+            if definitions is not None:
+                frames.insert(0, definitions)
+            await self.websocket.send_bytes(encode_batch(frames))
+        else:
+            await self.websocket.send_text(
+                "["
+                + ",".join(
+                    frame if isinstance(frame, str) else encode_frame(frame)
+                    for frame in run
+                )
+                + "]"
+            )
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                while not self._pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                if self.batch_delay:
+                    await self._send_batch(await self._collect_batch())
+                    continue
+                _, frame = self._pop()
+                await self._send(frame)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"WebSocket writer {self.id} stopped: {e}")
+        finally:
+            self.closed = True
+            if self.on_close is not None:
+                self.on_close(self.websocket)
+
+
+class HeartbeatWheel:
+    """
+    Hashed timer wheel tracking the liveness of connections.
+
+    Each connection sits in the slot of the tick at which it is next due.
+    One task advances the wheel every `tick` seconds and only visits the
+    connections in the current slot, so a connection costs no timer of its
+    own and one visit per `interval` while it is idle; receiving a frame
+    only updates its `last_seen`.
+
+    A connection due with no frame received for `interval` is pinged and
+    checked again after `timeout`; if it still sent nothing, `on_dead` is
+    called with it. Pings of one tick are queued together.
+
+    Args:
+        interval: Seconds of silence before a connection is pinged
+        timeout: Seconds a pinged connection has to send anything
+        on_ping: Called with each connection to ping
+        on_dead: Called with each connection that did not answer
+        tick: Seconds per slot
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        timeout: float,
+        on_ping: Callable[[ClientConnection], None],
+        on_dead: Callable[[ClientConnection], None],
+        tick: float = HEARTBEAT_TICK,
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.tick = tick
+        self.on_ping = on_ping
+        self.on_dead = on_dead
+        slots = math.ceil(max(interval, timeout) / tick) + 1
+        self._slots: List[Set[ClientConnection]] = [set() for _ in range(slots)]
+        self._slot_of: Dict[ClientConnection, int] = {}
+        self._position = 0
+        self._task: Optional[asyncio.Task] = None
+        self.pings = 0
+        self.timeouts = 0
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def add(self, client: ClientConnection) -> None:
+        """Start tracking a connection, counting it as just heard from."""
+        client.last_seen = time.monotonic()
+        client.pinged_at = None
+        self._schedule(client, self.interval)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="ws-heartbeat")
+
+    def remove(self, client: ClientConnection) -> None:
+        """Stop tracking a connection."""
+        slot = self._slot_of.pop(client, None)
+        if slot is not None:
+            self._slots[slot].discard(client)
+
+    def _schedule(self, client: ClientConnection, delay: float) -> None:
+        ticks = min(len(self._slots) - 1, max(1, math.ceil(delay / self.tick)))
+        slot = (self._position + ticks) % len(self._slots)
+        self._slots[slot].add(client)
+        self._slot_of[client] = slot
+
+    def advance(self, now: float) -> None:
+        """Move to the next slot and check the connections due in it."""
+        self._position = (self._position + 1) % len(self._slots)
+        due = self._slots[self._position]
+        self._slots[self._position] = set()
+        for client in due:
+            del self._slot_of[client]
+            if client.pinged_at is not None and client.last_seen <= client.pinged_at:
+                self.timeouts += 1
+                self.on_dead(client)
+                continue
+            client.pinged_at = None
+            remaining = self.interval - (now - client.last_seen)
+            if remaining > self.tick / 2:
+                self._schedule(client, remaining)
+                continue
+            client.pinged_at = now
+            self.pings += 1
+            self.on_ping(client)
+            self._schedule(client, self.timeout)
+
+    async def _run(self) -> None:
+        try:
+            while self._slot_of:
+                await asyncio.sleep(self.tick)
+                self.advance(time.monotonic())
+        finally:
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "timeout": self.timeout,
+            "tracked": len(self._slot_of),
+            "pings": self.pings,
+            "timeouts": self.timeouts,
+        }
+
+
+# Room IDs may not contain the separators of `room:seq` lists or line
+# breaks, which would end a Server-Sent Events field
+_INVALID_ROOM = re.compile(r"[,:\r\n]")
+
+
+def check_room(room: Any) -> None:
+    """
+    Check that a room ID or pattern may be subscribed and broadcast to.
+
+    Raises:
+        ValueError: If it is empty, not a string, or contains `,`, `:` or a
+            line break
+    """
+    if not isinstance(room, str) or not room or _INVALID_ROOM.search(room):
+        raise ValueError(
+            f"Invalid room ID {room!r}; room IDs must not be empty or "
+            "contain ',', ':' or line breaks"
+        )
+
+
+def pattern_prefix(subscription: str) -> Optional[str]:
+    """
+    Get the prefix of a pattern subscription such as `v*`, or None for a room.
+
+    Raises:
+        ValueError: If the subscription is not a valid room ID, see
+            check_room(), or `*` appears anywhere but at the end
+    """
+    check_room(subscription)
+    if "*" not in subscription:
+        return None
+    if subscription.index("*") != len(subscription) - 1:
+        raise ValueError(
+            f"Invalid room pattern {subscription!r}; only a trailing * is supported"
+        )
+    return subscription[:-1]
+
+
+class _TrieNode:
+    __slots__ = ("children", "subscribers", "is_room")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.subscribers: Set[WebSocket] = set()
+        self.is_room = False
+
+
+class RoomTrie:
+    """
+    Prefix trie of pattern subscriptions and known rooms.
+
+    A node holds the sockets subscribed to its path followed by `*`, and
+    marks whether its path is a known room. Walking a room's characters
+    collects its pattern subscribers; the subtree below a prefix holds the
+    rooms a new pattern matches.
+    """
+
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def _node(self, key: str, create: bool = False) -> Optional[_TrieNode]:
+        node = self.root
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[char] = _TrieNode()
+            node = child
+        return node
+
+    def add_room(self, room: str) -> Set[WebSocket]:
+        """
+        Record a room and get the sockets whose patterns match it.
+        """
+        matched: Set[WebSocket] = set(self.root.subscribers)
+        node = self.root
+        for char in room:
+            node = node.children.setdefault(char, _TrieNode())
+            matched |= node.subscribers
+        node.is_room = True
+        return matched
+
+    def remove_room(self, room: str) -> None:
+        """Forget a room recorded with add_room()."""
+        path = self._path(room)
+        if path is not None:
+            path[-1].is_room = False
+            self._prune(path, room)
+
+    def add_pattern(self, prefix: str, websocket: WebSocket) -> None:
+        self._node(prefix, create=True).subscribers.add(websocket)
+
+    def remove_pattern(self, prefix: str, websocket: WebSocket) -> None:
+        path = self._path(prefix)
+        if path is not None:
+            path[-1].subscribers.discard(websocket)
+            self._prune(path, prefix)
+
+    def _path(self, key: str) -> Optional[List[_TrieNode]]:
+        path = [self.root]
+        for char in key:
+            child = path[-1].children.get(char)
+            if child is None:
+                return None
+            path.append(child)
+        return path
+
+    @staticmethod
+    def _prune(path: List[_TrieNode], key: str) -> None:
+        """Remove the nodes of a path that no longer hold a room, pattern or child."""
+        for depth in range(len(key), 0, -1):
+            node = path[depth]
+            if node.children or node.subscribers or node.is_room:
+                break
+            del path[depth - 1].children[key[depth - 1]]
+
+    def rooms_with_prefix(self, prefix: str) -> List[str]:
+        """Get the known rooms starting with `prefix`."""
+        start = self._node(prefix)
+        if start is None:
+            return []
+        rooms = []
+        stack = [(prefix, start)]
+        while stack:
+            path, node = stack.pop()
+            if node.is_room:
+                rooms.append(path)
+            for char, child in node.children.items():
+                stack.append((path + char, child))
+        return rooms
+
+
+def _check_rate(max_rate: Optional[float]) -> None:
+    if max_rate is not None and not max_rate > 0:
+        raise ValueError(f"max_rate must be positive, got {max_rate!r}")
+
+
+class RoomConnectionManager:
+    """
+    Room subscriptions of WebSocket clients and fan-out of room messages.
+
+    Subscriptions are indexed both ways: `active_connections` maps a room to
+    its sockets and each ClientConnection keeps its own rooms, so subscribing,
+    unsubscribing and disconnecting only touch the socket's own rooms.
+
+    A subscription ending in `*` (e.g. `v*`, `vl*`, `l1*`) is a prefix
+    pattern. Patterns are kept in a RoomTrie and resolved into
+    `active_connections` when a pattern is added or a room is first seen,
+    so broadcasting never matches patterns.
+
+    Every broadcast gets a sequence number per room, sent as `seq`, and the
+    last `replay_size` messages of each room are kept in memory. A
+    subscriber resuming after a disconnect passes the last `seq` it saw and
+    is replayed what it missed, see replay(). At most `max_rooms` rooms are
+    remembered: beyond that, the least recently used room without
+    subscribers loses its buffer and seq, and restarts from seq 1.
+
+    Liveness of all connections is tracked by one HeartbeatWheel: a
+    connection that sent nothing for `heartbeat_interval` seconds is queued
+    a "ping" text frame and closed with HEARTBEAT_CLOSE_CODE if it still
+    sent nothing `heartbeat_timeout` seconds later.
+
+    Args:
+        queue_size: Outbound frames queued per connection
+        policy: Default slow-consumer policy, see SLOW_CONSUMER_POLICIES
+        batch_ms: Default milliseconds to batch frames for, 0 to disable
+        batch_max: Default most frames in a batch
+        replay_size: Messages kept per room for replay
+        max_rooms: Rooms remembered before idle ones are forgotten
+        heartbeat_interval: Seconds of silence before a connection is pinged,
+            0 to disable heartbeats
+        heartbeat_timeout: Seconds a pinged connection has to answer
+    """
+
+    def __init__(
+        self,
+        queue_size: int = SEND_QUEUE_SIZE,
+        policy: str = SLOW_CONSUMER_POLICY,
+        batch_ms: float = BATCH_MS,
+        batch_max: int = BATCH_MAX,
+        replay_size: int = REPLAY_BUFFER_SIZE,
+        max_rooms: int = MAX_ROOMS,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL,
+        heartbeat_timeout: float = HEARTBEAT_TIMEOUT,
+    ):
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.queue_size = queue_size
+        self.policy = policy
+        self.batch_ms = batch_ms
+        self.batch_max = batch_max
+        self.slow_disconnects = 0
+        self._trie = RoomTrie()
+        # Known rooms, least recently used first
+        self._rooms: "OrderedDict[str, None]" = OrderedDict()
+        self.max_rooms = max(1, max_rooms)
+        self.forgotten_rooms = 0
+        self.intern_table = InternTable()
+        self.replay_size = max(0, replay_size)
+        self._seqs: Dict[str, int] = {}
+        self._replay: Dict[str, Deque[Tuple[int, Dict[str, Any]]]] = {}
+        self.heartbeat = (
+            HeartbeatWheel(
+                heartbeat_interval,
+                heartbeat_timeout,
+                self._ping,
+                self._heartbeat_expired,
+            )
+            if heartbeat_interval > 0
+            else None
+        )
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        rooms: List[str],
+        policy: Optional[str] = None,
+        max_rate: Optional[float] = None,
+        binary: bool = False,
+        batch_ms: Optional[float] = None,
+        batch_max: Optional[int] = None,
+        since: Optional[Dict[str, int]] = None,
+        heartbeat: bool = True,
+    ):
+        """
+        Accept and store a new WebSocket connection with room subscriptions
+
+        With `binary`, the connection is accepted with the binary
+        subprotocol and vehicle updates are sent as binary frames.
+        `batch_ms` and `batch_max` override the manager's batching defaults.
+        `since` resumes rooms after the last seq seen, see replay().
+        With `heartbeat`, the connection is pinged when silent and closed
+        when it stops answering; the endpoint must call touch() for every
+        frame it receives.
+
+        Raises:
+            ValueError: If the policy, a room pattern or the rate is invalid
+        """
+        for room in rooms:
+            pattern_prefix(room)
+        _check_rate(max_rate)
+        client = ClientConnection(
+            websocket,
+            [],
+            queue_size=self.queue_size,
+            policy=policy or self.policy,
+            on_close=self.disconnect,
+            intern_table=self.intern_table if binary else None,
+            batch_ms=self.batch_ms if batch_ms is None else batch_ms,
+            batch_max=batch_max or self.batch_max,
+        )
+        await websocket.accept(subprotocol=SUBPROTOCOL if binary else None)
+        self.clients[websocket] = client
+        client.start()
+        if heartbeat and self.heartbeat is not None:
+            self.heartbeat.add(client)
+        self.subscribe(websocket, rooms, max_rate)
+        if since:
+            self.replay(websocket, since)
+
+    def disconnect(self, websocket: WebSocket):
+        """Remove a WebSocket connection from all rooms"""
+        client = self.clients.pop(websocket, None)
+        if client is not None:
+            client.stop()
+            if self.heartbeat is not None:
+                self.heartbeat.remove(client)
+            self._unsubscribe(websocket, client, list(client.rooms))
+
+    def touch(self, websocket: WebSocket) -> None:
+        """Record that a frame was received from a connection."""
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.last_seen = time.monotonic()
+
+    def _ping(self, client: ClientConnection) -> None:
+        client.offer("ping", control=True)
+
+    def _heartbeat_expired(self, client: ClientConnection) -> None:
+        if client.websocket not in self.clients:
+            return
+        logger.info(f"Closing WebSocket {client.id} after unanswered ping")
+        self.disconnect(client.websocket)
+        asyncio.create_task(client.close(HEARTBEAT_CLOSE_CODE))
+
+    def subscribe(
+        self,
+        websocket: WebSocket,
+        rooms: List[str],
+        max_rate: Optional[float] = None,
+    ) -> List[str]:
+        """
+        Add rooms or room patterns to a connection's subscriptions.
+
+        `max_rate` limits how often per second entity updates of these rooms
+        are delivered; it replaces the rate of rooms already subscribed.
+
+        Returns:
+            The rooms and patterns that were newly subscribed
+
+        Raises:
+            ValueError: If a room pattern or the rate is invalid
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return []
+        _check_rate(max_rate)
+        rooms = list(dict.fromkeys(rooms))
+        added = [room for room in rooms if room not in client.rooms]
+        prefixes = [pattern_prefix(room) for room in added]
+        client.rooms.update(added)
+        for room in rooms:
+            client.set_rate(room, max_rate)
+        for room, prefix in zip(added, prefixes):
+            if prefix is None:
+                self._register_room(room)
+                matched = [room]
+            else:
+                self._trie.add_pattern(prefix, websocket)
+                matched = self._trie.rooms_with_prefix(prefix)
+            for matched_room in matched:
+                self.active_connections.setdefault(matched_room, set()).add(websocket)
+        return added
+
+    def unsubscribe(self, websocket: WebSocket, rooms: List[str]) -> List[str]:
+        """
+        Remove rooms or room patterns from a connection's subscriptions.
+
+        Returns:
+            The rooms and patterns that were subscribed and are no longer
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return []
+        removed = [room for room in dict.fromkeys(rooms) if room in client.rooms]
+        self._unsubscribe(websocket, client, removed)
+        return removed
+
+    def subscriptions(self, websocket: WebSocket) -> List[str]:
+        """Get the rooms and patterns a connection is subscribed to, sorted."""
+        client = self.clients.get(websocket)
+        return sorted(client.rooms) if client is not None else []
+
+    def subscription_rates(self, websocket: WebSocket) -> Dict[str, float]:
+        """Get the maximum delivery rates of a connection's subscriptions."""
+        client = self.clients.get(websocket)
+        return dict(client.rates) if client is not None else {}
+
+    def room_count(self, room: str) -> int:
+        """Get the number of connections receiving a room, patterns included."""
+        return len(self.active_connections.get(room, ()))
+
+    def _register_room(self, room: str) -> None:
+        """Record a room seen for the first time with its pattern subscribers."""
+        if room in self._rooms:
+            self._rooms.move_to_end(room)
+            return
+        self._rooms[room] = None
+        matched = self._trie.add_room(room)
+        if matched:
+            self.active_connections.setdefault(room, set()).update(matched)
+        if len(self._rooms) > self.max_rooms:
+            self._forget_idle_rooms()
+
+    def _forget_idle_rooms(self) -> None:
+        """Forget the least recently used rooms without subscribers."""
+        checked = 0
+        while len(self._rooms) > self.max_rooms and checked < len(self._rooms):
+            room = next(iter(self._rooms))
+            if self.active_connections.get(room):
+                self._rooms.move_to_end(room)
+                checked += 1
+                continue
+            del self._rooms[room]
+            self._seqs.pop(room, None)
+            self._replay.pop(room, None)
+            self._trie.remove_room(room)
+            self.forgotten_rooms += 1
+
+    def _unsubscribe(
+        self, websocket: WebSocket, client: ClientConnection, rooms: List[str]
+    ) -> None:
+        client.rooms.difference_update(rooms)
+        for room in rooms:
+            client.set_rate(room, None)
+        affected: Set[str] = set()
+        for room in rooms:
+            prefix = pattern_prefix(room)
+            if prefix is None:
+                affected.add(room)
+            else:
+                self._trie.remove_pattern(prefix, websocket)
+                affected.update(self._trie.rooms_with_prefix(prefix))
+
+        patterns = [
+            prefix for prefix in map(pattern_prefix, client.rooms) if prefix is not None
+        ]
+        for room in affected:
+            connections = self.active_connections.get(room)
+            if connections is None:
+                continue
+            # Still received through the exact room or another pattern
+            if room in client.rooms or any(map(room.startswith, patterns)):
+                continue
+            connections.discard(websocket)
+            # Clean up empty rooms
+            if not connections:
+                del self.active_connections[room]
+
+    async def send_personal_message(self, message: Frame, websocket: WebSocket):
+        """Queue a message for a specific client, ahead of the queue limit"""
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.offer(message, control=True)
+
+    async def broadcast_to_room(self, message: dict, room: str):
+        """Broadcast a message to all clients in a room"""
+        await self.broadcast_to_rooms(message, [room])
+
+    async def broadcast_to_rooms(self, message: dict, rooms: List[str]):
+        """
+        Broadcast a message to all clients of several rooms in one pass.
+
+        Each room's subscribers get the message with that room as `room_id`,
+        so clients watching several rooms can still tell them apart. The
+        message is JSON-encoded once per broadcast and every subscriber is
+        queued the same encoded frame; no client is awaited. Binary
+        subscribers share one binary frame per room instead, when the
+        message has one.
+        """
+        seqs = {}
+        for room in rooms:
+            self._register_room(room)
+            seq = seqs[room] = self._seqs.get(room, 0) + 1
+            self._seqs[room] = seq
+            buffer = self._replay.get(room)
+            if buffer is None:
+                buffer = self._replay[room] = deque(maxlen=self.replay_size)
+            buffer.append((seq, message))
+        targets = [room for room in rooms if self.active_connections.get(room)]
+        if not targets:
+            return
+        frames = encode_for_rooms(message, targets, seqs)
+        conflatable = conflation_key(message) is not None
+
+        slow_clients = []
+        for room in targets:
+            text_frame = frames[room]
+            binary_frame = None
+            binary_encoded = False
+            key = (room, message["entity_id"]) if conflatable else None
+            for connection in self.active_connections[room]:
+                client = self.clients.get(connection)
+                if client is None:
+                    continue
+                frame = text_frame
+                if client.binary:
+                    if not binary_encoded:
+                        binary_frame = encode_state(
+                            message, room, self.intern_table, seqs[room]
+                        )
+                        binary_encoded = True
+                    if binary_frame is not None:
+                        frame = binary_frame
+                if not client.offer(frame, key, room=room):
+                    slow_clients.append(client)
+
+        # Disconnect clients that fell too far behind
+        for client in slow_clients:
+            self._disconnect_slow(client)
+
+    def _disconnect_slow(self, client: ClientConnection) -> None:
+        if client.websocket not in self.clients:
+            return
+        self.slow_disconnects += 1
+        logger.warning(f"Disconnecting slow WebSocket consumer {client.id}")
+        self.disconnect(client.websocket)
+        asyncio.create_task(client.close(SLOW_CONSUMER_CLOSE_CODE))
+
+    def last_seqs(self, rooms: List[str]) -> Dict[str, int]:
+        """
+        Get the seq of the last message broadcast to each room, 0 if none.
+
+        Patterns stand for the known rooms they match.
+        """
+        seqs = {}
+        for room in rooms:
+            prefix = pattern_prefix(room)
+            matched = [room] if prefix is None else self._trie.rooms_with_prefix(prefix)
+            for matched_room in matched:
+                seqs[matched_room] = self._seqs.get(matched_room, 0)
+        return seqs
+
+    def replay(self, websocket: WebSocket, since: Dict[str, int]) -> Dict[str, int]:
+        """
+        Queue the buffered messages of rooms after the given sequence numbers.
+
+        For each room, messages with a `seq` above `since[room]` are queued
+        from memory, ahead of new broadcasts. If the buffer no longer holds
+        all of them, or the room's sequence restarted (e.g. after a server
+        restart), a `{"type": "gap"}` frame is queued first with the room,
+        `since`, the `first` seq replayed and the room's `last` seq; the
+        client should fetch the messages before `first` from
+        /messages/history. When the missed messages do not fit in the
+        connection's send queue, none are replayed and the gap frame has
+        `first` past `last`, so the client fetches them all.
+
+        Rooms the connection does not receive are skipped.
+
+        Returns:
+            Number of messages replayed per room
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return {}
+        replayed = {}
+        for room, after in since.items():
+            if websocket not in self.active_connections.get(room, ()):
+                continue
+            buffer = self._replay.get(room, ())
+            last = self._seqs.get(room, 0)
+            first = buffer[0][0] if buffer else last + 1
+            if after > last:
+                # Sequence restarted; everything buffered is new to the client
+                after = 0
+                gap = True
+            else:
+                gap = after + 1 < first
+            missed = [(seq, message) for seq, message in buffer if seq > after]
+            if len(missed) > client.free:
+                # Replaying would push out queued frames, or the connection
+                missed = []
+                first = last + 1
+                gap = True
+            if gap and not client.offer(
+                {
+                    "type": "gap",
+                    "room_id": room,
+                    "since": since[room],
+                    "first": first,
+                    "last": last,
+                },
+                control=True,
+            ):
+                break
+            count = 0
+            for seq, message in missed:
+                frame = None
+                if client.binary:
+                    frame = encode_state(message, room, self.intern_table, seq)
+                if frame is None:
+                    frame = encode_for_rooms(message, [room], {room: seq})[room]
+                if not client.offer(frame):
+                    self._disconnect_slow(client)
+                    break
+                count += 1
+            replayed[room] = count
+            if client.closed:
+                break
+        return replayed
+
+    def stats(self) -> Dict[str, Any]:
+        """Get per-connection queue depth and drop counters."""
+        connections = [client.stats() for client in self.clients.values()]
+        return {
+            "connections": len(connections),
+            "rooms": len(self.active_connections),
+            "known_rooms": len(self._rooms),
+            "forgotten_rooms": self.forgotten_rooms,
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "queued": sum(client["depth"] for client in connections),
+            "dropped": sum(client["dropped"] for client in connections),
+            "conflated": sum(client["conflated"] for client in connections),
+            "slow_disconnects": self.slow_disconnects,
+            "heartbeat": self.heartbeat.stats() if self.heartbeat else None,
+            "room_subscribers": {
+                room: len(connections)
+                for room, connections in self.active_connections.items()
+            },
+            "clients": connections,
+        }
@@ -1,287 +1,501 @@
-import json
 import logging
-import sqlite3
-from pathlib import Path
-from typing import Any, Dict, List, Optional
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from swarm_squad_ep2.api.storage import StorageBackend, create_storage
+from swarm_squad_ep2.api.storage.base import wants_messages
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Database file path
-DB_PATH = Path(__file__).parent / "vehicle_sim.db"
+# Storage engine used by the API: "sqlite" (durable, default) or "memory"
+STORAGE_BACKEND = os.environ.get("SWARM_SQUAD_STORAGE", "sqlite")
+
+# Active storage engine, created from STORAGE_BACKEND on first use
+_storage: Optional[StorageBackend] = None
+
+# Entries kept by the read cache; 0 disables it
+READ_CACHE_SIZE = int(os.environ.get("SWARM_SQUAD_READ_CACHE_SIZE", "1024"))
+
+Tag = Tuple[str, str]
+
+
+def _copy_result(value: Any) -> Any:
+    """Copy the dicts and lists of a JSON-like result so callers can mutate it."""
+    if isinstance(value, dict):
+        return {key: _copy_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_result(item) for item in value]
+    return value
+
+
+class ReadCache:
+    """
+    LRU cache of entity reads, invalidated by the writes in this module.
+
+    Every entry is tagged with what it was read from: an entity, or a whole
+    entity type for listings. A write drops the entries carrying its tags.
+    A read that overlapped a write to one of its tags is returned but not
+    stored, so a slow read never puts a stale result back into the cache.
+    Neither is a read that overlapped writes which returned before their
+    commit (relaxed durability), since it may predate them.
+
+    Args:
+        max_entries: Entries kept before the least recently used is evicted;
+            0 disables caching
+        uncommitted: Whether writes that returned are not committed yet
+    """
+
+    def __init__(
+        self, max_entries: int, uncommitted: Optional[Callable[[], bool]] = None
+    ):
+        self.max_entries = max(0, max_entries)
+        self._uncommitted = uncommitted or (lambda: False)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Tuple[Tag, ...]]]" = (
+            OrderedDict()
+        )
+        self._tagged: Dict[Tag, Set[Hashable]] = {}
+        self._versions: Dict[Tag, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    async def get(
+        self,
+        key: Hashable,
+        tags: Tuple[Tag, ...],
+        load: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Return the cached result for `key`, or load and cache it."""
+        if self.max_entries == 0:
+            return await load()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _copy_result(entry[0])
+
+        self.misses += 1
+        before = self._version_of(tags)
+        uncommitted = self._uncommitted()
+        value = await load()
+        if (
+            not uncommitted
+            and not self._uncommitted()
+            and self._version_of(tags) == before
+        ):
+            self._store(key, tags, value)
+        return _copy_result(value)
+
+    def peek(self, key: Hashable) -> Any:
+        """Return the cached result for `key` without copying it, or None."""
+        entry = self._entries.get(key)
+        return None if entry is None else entry[0]
+
+    def invalidate(self, *tags: Tag) -> None:
+        """Drop the entries read from any of `tags`."""
+        for tag in tags:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+            for key in self._tagged.pop(tag, ()):
+                if self._remove(key):
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every entry, e.g. after the whole store was cleared."""
+        self._epoch += 1
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tagged.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+    def _version_of(self, tags: Tuple[Tag, ...]) -> Tuple[int, ...]:
+        return (self._epoch, *(self._versions.get(tag, 0) for tag in tags))
+
+    def _store(self, key: Hashable, tags: Tuple[Tag, ...], value: Any) -> None:
+        self._remove(key)
+        self._entries[key] = (value, tags)
+        for tag in tags:
+            self._tagged.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[1]:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+        return True
+
 
-# Global database connection
-_connection: Optional[sqlite3.Connection] = None
+def _uncommitted_writes() -> bool:
+    return _storage is not None and _storage.has_uncommitted_writes()
 
 
-def get_db_connection() -> sqlite3.Connection:
-    """Get or create database connection."""
-    global _connection
-    if _connection is None:
-        _connection = sqlite3.connect(str(DB_PATH), check_same_thread=False)
-        _connection.row_factory = sqlite3.Row  # Enable dict-like access
-        _connection.execute("PRAGMA journal_mode=WAL")  # Enable WAL mode for better concurrency
-        logger.info(f"Connected to SQLite database: {DB_PATH}")
-    return _connection
+_cache = ReadCache(READ_CACHE_SIZE, _uncommitted_writes)
+
+
+def _entity_tag(entity_id: str) -> Tag:
+    return ("entity", entity_id)
+
+
+def _type_tag(entity_type: str) -> Tag:
+    return ("type", entity_type)
+
+
+def _entity_written(entity_type: str, entity_id: str) -> None:
+    """Invalidate what a write to one entity may have changed."""
+    _cache.invalidate(_entity_tag(entity_id), _type_tag(entity_type))
+    known_ids = _cache.peek(("ids", entity_type))
+    if known_ids is None or entity_id not in known_ids:
+        _cache.invalidate(("ids", entity_type))
+
+
+def get_storage() -> StorageBackend:
+    """Get the active storage engine, creating it from config if needed."""
+    global _storage
+    if _storage is None:
+        _storage = create_storage(STORAGE_BACKEND)
+        # Background retention changes what reads return
+        _storage.on_change = _cache.clear
+        logger.info(f"Using {_storage.name} storage backend")
+    return _storage
+
+
+def set_storage(storage: StorageBackend) -> None:
+    """Replace the active storage engine; call before connect_to_db()."""
+    global _storage
+    _storage = storage
+    _storage.on_change = _cache.clear
+    _cache.clear()
 
 
 async def connect_to_db() -> bool:
     """
-    Initialize SQLite database with required tables.
+    Open the configured storage engine.
 
     Returns:
         bool: True if connection was successful, False otherwise
     """
     try:
-        conn = get_db_connection()
-        
-        # Create tables if they don't exist
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS vehicles (
-                id TEXT PRIMARY KEY,
-                messages TEXT DEFAULT '[]',
-                status TEXT DEFAULT 'unknown',
-                last_seen TEXT DEFAULT '',
-                state TEXT DEFAULT '{}'
-            )
-        """)
-        
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS llms (
-                id TEXT PRIMARY KEY,
-                messages TEXT DEFAULT '[]',
-                status TEXT DEFAULT 'unknown',
-                last_seen TEXT DEFAULT '',
-                vehicle_id TEXT DEFAULT NULL
-            )
-        """)
-        
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS veh2llm (
-                vehicle_id TEXT PRIMARY KEY,
-                llm_id TEXT NOT NULL
-            )
-        """)
-        
-        conn.commit()
-        logger.info("SQLite database initialized successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to connect to SQLite database: {str(e)}")
+        storage = get_storage()
+    except ValueError as e:
+        logger.error(f"Failed to create storage backend: {e}")
         return False
+    return await storage.connect()
 
 
 async def close_db_connection() -> None:
-    """Close SQLite database connection."""
-    global _connection
-    if _connection is not None:
-        _connection.close()
-        _connection = None
-        logger.info("Closed SQLite database connection")
+    """Flush pending writes and close the storage engine."""
+    if _storage is not None:
+        await _storage.close()
 
 
 def is_db_connected() -> bool:
     """
-    Check if database connection is available.
+    Check if the storage engine is available.
 
     Returns:
         bool: True if connected, False otherwise
     """
-    return _connection is not None
+    return _storage is not None and _storage.is_connected()
+
+
+def get_db_stats() -> Dict[str, Any]:
+    """Get counters of the active storage engine and the read cache."""
+    return {**get_storage().stats(), "read_cache": _cache.stats()}
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Get hit, miss and eviction counters of the read cache."""
+    return _cache.stats()
+
+
+# Message history
+async def get_entity_messages(
+    entity_id: str, limit: Optional[int] = None, include_archived: bool = False
+) -> List[Dict[str, Any]]:
+    """Get the most recent messages of a vehicle or LLM, oldest first."""
+    if limit is None or include_archived:
+        # Full and archived histories are too large or change with retention
+        return await get_storage().get_entity_messages(
+            entity_id, limit, include_archived
+        )
+    return await _cache.get(
+        ("messages", entity_id, limit),
+        (_entity_tag(entity_id),),
+        lambda: get_storage().get_entity_messages(entity_id, limit),
+    )
+
+
+async def get_entities_messages(
+    entity_ids: List[str], limit: int
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Get the last `limit` messages of several vehicles or LLMs, oldest first."""
+    return await _cache.get(
+        ("entities_messages", tuple(entity_ids), limit),
+        tuple(_entity_tag(entity_id) for entity_id in entity_ids),
+        lambda: get_storage().get_entities_messages(entity_ids, limit),
+    )
+
+
+async def get_recent_messages(
+    entity_type: str, per_entity: int = 5
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Get the last `per_entity` messages of every vehicle or LLM."""
+    return await _cache.get(
+        ("recent", entity_type, per_entity),
+        (_type_tag(entity_type),),
+        lambda: get_storage().get_recent_messages(entity_type, per_entity),
+    )
+
+
+async def get_message_history(
+    room_id: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    start_ns: Optional[int] = None,
+    end_ns: Optional[int] = None,
+    limit: int = 1000,
+    after_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Get messages of a room and/or entity ingested in [start_ns, end_ns)."""
+    return await get_storage().get_message_history(
+        room_id, entity_id, start_ns, end_ns, limit, after_id
+    )
+
+
+async def search_messages(
+    query: str,
+    room_id: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    message_type: Optional[str] = None,
+    start_ns: Optional[int] = None,
+    end_ns: Optional[int] = None,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    """Full-text search over message text, newest first."""
+    return await get_storage().search_messages(
+        query, room_id, entity_id, message_type, start_ns, end_ns, limit
+    )
+
+
+async def get_archived_messages(
+    entity_id: str, limit: Optional[int] = None, message_type: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Get messages of a vehicle or LLM moved out of hot storage by retention."""
+    return await get_storage().get_archived_messages(entity_id, limit, message_type)
+
+
+async def compact_message_history() -> int:
+    """Apply retention now and return the number of archived messages."""
+    archived = await get_storage().compact_message_history()
+    if archived:
+        _cache.clear()
+    return archived
 
 
 # Vehicle operations
-async def get_all_vehicles() -> List[Dict[str, Any]]:
-    """Get all vehicles from database."""
-    try:
-        conn = get_db_connection()
-        cursor = conn.execute("SELECT * FROM vehicles")
-        vehicles = []
-        for row in cursor.fetchall():
-            vehicle = {
-                "_id": row["id"],
-                "messages": json.loads(row["messages"]) if row["messages"] else [],
-                "status": row["status"],
-                "last_seen": row["last_seen"],
-                "state": json.loads(row["state"]) if row["state"] else {}
-            }
-            vehicles.append(vehicle)
-        return vehicles
-    except Exception as e:
-        logger.error(f"Error getting vehicles: {e}")
-        return []
-
-
-async def find_vehicle(vehicle_id: str) -> Optional[Dict[str, Any]]:
+async def get_all_vehicles(
+    messages_limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Get all vehicles with their last `messages_limit` messages (all if None)."""
+    if messages_limit is None:
+        return await get_storage().get_all_vehicles()
+    return await _cache.get(
+        ("vehicles", messages_limit),
+        (_type_tag("vehicle"),),
+        lambda: get_storage().get_all_vehicles(messages_limit),
+    )
+
+
+async def find_vehicle(
+    vehicle_id: str, messages_limit: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
     """Find a specific vehicle by ID."""
-    try:
-        conn = get_db_connection()
-        cursor = conn.execute("SELECT * FROM vehicles WHERE id = ?", (vehicle_id,))
-        row = cursor.fetchone()
-        if row:
-            return {
-                "_id": row["id"],
-                "messages": json.loads(row["messages"]) if row["messages"] else [],
-                "status": row["status"],
-                "last_seen": row["last_seen"],
-                "state": json.loads(row["state"]) if row["state"] else {}
-            }
-        return None
-    except Exception as e:
-        logger.error(f"Error finding vehicle {vehicle_id}: {e}")
-        return None
-
-
-async def upsert_vehicle_message(vehicle_id: str, message: Dict[str, Any]) -> bool:
+    if messages_limit is None:
+        return await get_storage().find_vehicle(vehicle_id)
+    return await _cache.get(
+        ("vehicle", vehicle_id, messages_limit),
+        (_entity_tag(vehicle_id),),
+        lambda: get_storage().find_vehicle(vehicle_id, messages_limit),
+    )
+
+
+async def upsert_vehicle_message(
+    vehicle_id: str,
+    message: Dict[str, Any],
+    status: Optional[str] = None,
+    state: Optional[Dict[str, Any]] = None,
+) -> bool:
     """Add a message to a vehicle, creating the vehicle if it doesn't exist."""
-    try:
-        conn = get_db_connection()
-        
-        # Get existing vehicle or create new one
-        cursor = conn.execute("SELECT messages FROM vehicles WHERE id = ?", (vehicle_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            # Update existing vehicle
-            messages = json.loads(row["messages"]) if row["messages"] else []
-            messages.append(message)
-            conn.execute(
-                "UPDATE vehicles SET messages = ? WHERE id = ?",
-                (json.dumps(messages), vehicle_id)
-            )
-        else:
-            # Create new vehicle
-            messages = [message]
-            conn.execute(
-                "INSERT INTO vehicles (id, messages) VALUES (?, ?)",
-                (vehicle_id, json.dumps(messages))
-            )
-        
-        conn.commit()
-        return True
-    except Exception as e:
-        logger.error(f"Error upserting vehicle message for {vehicle_id}: {e}")
-        return False
+    success = await get_storage().upsert_vehicle_message(
+        vehicle_id, message, status, state
+    )
+    _entity_written("vehicle", vehicle_id)
+    return success
+
+
+async def get_latest_states(entity_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Get the latest state of several vehicles or LLMs."""
+    return await _cache.get(
+        ("states", tuple(entity_ids)),
+        tuple(_entity_tag(entity_id) for entity_id in entity_ids),
+        lambda: get_storage().get_latest_states(entity_ids),
+    )
+
+
+async def update_vehicle_state(vehicle_id: str, state: Dict[str, Any]) -> bool:
+    """Replace the latest state of a vehicle without adding a message."""
+    success = await get_storage().update_vehicle_state(vehicle_id, state)
+    _entity_written("vehicle", vehicle_id)
+    return success
 
 
 async def update_vehicle_status(vehicle_id: str, status: str) -> bool:
     """Update vehicle status."""
-    try:
-        conn = get_db_connection()
-        conn.execute(
-            "UPDATE vehicles SET status = ? WHERE id = ?",
-            (status, vehicle_id)
-        )
-        conn.commit()
-        return True
-    except Exception as e:
-        logger.error(f"Error updating vehicle status for {vehicle_id}: {e}")
-        return False
+    success = await get_storage().update_vehicle_status(vehicle_id, status)
+    _entity_written("vehicle", vehicle_id)
+    return success
 
 
 # LLM operations
-async def get_all_llms() -> List[Dict[str, Any]]:
-    """Get all LLMs from database."""
-    try:
-        conn = get_db_connection()
-        cursor = conn.execute("SELECT * FROM llms")
-        llms = []
-        for row in cursor.fetchall():
-            llm = {
-                "_id": row["id"],
-                "messages": json.loads(row["messages"]) if row["messages"] else [],
-                "status": row["status"],
-                "last_seen": row["last_seen"],
-                "vehicle_id": row["vehicle_id"]
-            }
-            llms.append(llm)
-        return llms
-    except Exception as e:
-        logger.error(f"Error getting LLMs: {e}")
-        return []
-
-
-async def find_llm(llm_id: str) -> Optional[Dict[str, Any]]:
+async def get_all_llms(messages_limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Get all LLMs with their last `messages_limit` messages (all if None)."""
+    if messages_limit is None:
+        return await get_storage().get_all_llms()
+    return await _cache.get(
+        ("llms", messages_limit),
+        (_type_tag("llm"),),
+        lambda: get_storage().get_all_llms(messages_limit),
+    )
+
+
+async def find_llm(
+    llm_id: str, messages_limit: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
     """Find a specific LLM by ID."""
-    try:
-        conn = get_db_connection()
-        cursor = conn.execute("SELECT * FROM llms WHERE id = ?", (llm_id,))
-        row = cursor.fetchone()
-        if row:
-            return {
-                "_id": row["id"],
-                "messages": json.loads(row["messages"]) if row["messages"] else [],
-                "status": row["status"],
-                "last_seen": row["last_seen"],
-                "vehicle_id": row["vehicle_id"]
-            }
-        return None
-    except Exception as e:
-        logger.error(f"Error finding LLM {llm_id}: {e}")
-        return None
-
-
-async def upsert_llm_message(llm_id: str, message: Dict[str, Any]) -> bool:
+    if messages_limit is None:
+        return await get_storage().find_llm(llm_id)
+    return await _cache.get(
+        ("llm", llm_id, messages_limit),
+        (_entity_tag(llm_id),),
+        lambda: get_storage().find_llm(llm_id, messages_limit),
+    )
+
+
+async def upsert_llm_message(
+    llm_id: str, message: Dict[str, Any], status: Optional[str] = None
+) -> bool:
     """Add a message to an LLM, creating the LLM if it doesn't exist."""
-    try:
-        conn = get_db_connection()
-        
-        # Get existing LLM or create new one
-        cursor = conn.execute("SELECT messages FROM llms WHERE id = ?", (llm_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            # Update existing LLM
-            messages = json.loads(row["messages"]) if row["messages"] else []
-            messages.append(message)
-            conn.execute(
-                "UPDATE llms SET messages = ? WHERE id = ?",
-                (json.dumps(messages), llm_id)
-            )
-        else:
-            # Create new LLM
-            messages = [message]
-            conn.execute(
-                "INSERT INTO llms (id, messages) VALUES (?, ?)",
-                (llm_id, json.dumps(messages))
-            )
-        
-        conn.commit()
-        return True
-    except Exception as e:
-        logger.error(f"Error upserting LLM message for {llm_id}: {e}")
-        return False
+    success = await get_storage().upsert_llm_message(llm_id, message, status)
+    _entity_written("llm", llm_id)
+    return success
 
 
 async def update_llm_status(llm_id: str, status: str) -> bool:
     """Update LLM status."""
-    try:
-        conn = get_db_connection()
-        conn.execute(
-            "UPDATE llms SET status = ? WHERE id = ?",
-            (status, llm_id)
-        )
-        conn.commit()
-        return True
-    except Exception as e:
-        logger.error(f"Error updating LLM status for {llm_id}: {e}")
-        return False
+    success = await get_storage().update_llm_status(llm_id, status)
+    _entity_written("llm", llm_id)
+    return success
+
+
+async def assign_llm_to_vehicle(vehicle_id: str, llm_id: str) -> bool:
+    """Map a vehicle to its LLM agent, replacing any previous mapping."""
+    success = await get_storage().assign_llm_to_vehicle(vehicle_id, llm_id)
+    _cache.invalidate(_entity_tag(llm_id), _type_tag("llm"), _type_tag("veh2llm"))
+    return success
 
 
 # Clear database operations
 async def clear_all_data() -> bool:
     """Clear all data from the database."""
-    try:
-        conn = get_db_connection()
-        conn.execute("DELETE FROM vehicles")
-        conn.execute("DELETE FROM llms")
-        conn.execute("DELETE FROM veh2llm")
-        conn.commit()
-        logger.info("All database data cleared")
-        return True
-    except Exception as e:
-        logger.error(f"Error clearing database: {e}")
-        return False
+    success = await get_storage().clear_all_data()
+    _cache.clear()
+    return success
+
+
+async def count_entities(entity_type: str) -> int:
+    """Count vehicles or LLMs without loading them."""
+    return await _cache.get(
+        ("count", entity_type),
+        (("ids", entity_type),),
+        lambda: get_storage().count_entities(entity_type),
+    )
+
+
+async def get_entity_ids(entity_type: str) -> List[str]:
+    """
+    Get the IDs of all vehicles or LLMs.
+
+    Cached until an entity of that type is created, so listing rooms does
+    not reload every entity on each request.
+    """
+    collection = "vehicles" if entity_type == "vehicle" else "llms"
+
+    async def load() -> List[str]:
+        docs = await get_storage().find_documents(collection, projection={"_id": 1})
+        return [doc["_id"] for doc in docs]
+
+    return await _cache.get(("ids", entity_type), (("ids", entity_type),), load)
+
+
+# Collections of the shim and the entity type their documents belong to
+_COLLECTION_TYPES = {"vehicles": "vehicle", "llms": "llm", "veh2llm": "veh2llm"}
+
+
+def _freeze(value: Any) -> Hashable:
+    """Turn a filter or projection into a hashable cache key."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+async def find_documents(
+    collection: str,
+    filter_dict: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Query a collection with a MongoDB-style filter and projection."""
+
+    def load() -> Awaitable[List[Dict[str, Any]]]:
+        return get_storage().find_documents(collection, filter_dict, projection, limit)
+
+    entity_type = _COLLECTION_TYPES.get(collection)
+    if entity_type is None or (entity_type != "veh2llm" and wants_messages(projection)):
+        # Documents with their full history are not cached
+        return await load()
+
+    entity_id = (filter_dict or {}).get("_id")
+    if isinstance(entity_id, str) and len(filter_dict) == 1:
+        # A lookup by ID only depends on that entity
+        tags = (_entity_tag(entity_id),)
+    else:
+        tags = (_type_tag(entity_type),)
+    key = ("find", collection, _freeze(filter_dict), _freeze(projection), limit)
+    return await _cache.get(key, tags, load)
 
 
 # Legacy compatibility functions (for existing code that expects MongoDB-style operations)
@@ -292,36 +506,39 @@ def get_collection(name: str):
 
 class MockCollection:
     """Mock collection object to maintain compatibility with existing MongoDB code."""
-    
+
     def __init__(self, name: str):
         self.name = name
-    
-    def find(self, filter_dict: Dict = None):
+
+    def find(self, filter_dict: Dict = None, projection: Dict = None):
         """Mock find operation - returns MockCursor that can be async iterated."""
-        return MockAsyncCursor(self.name, filter_dict)
-    
-    async def find_one(self, filter_dict: Dict):
+        return MockAsyncCursor(self.name, filter_dict, projection)
+
+    async def find_one(self, filter_dict: Dict, projection: Dict = None):
         """Mock find_one operation."""
-        entity_id = filter_dict.get("_id")
-        if self.name == "vehicles":
-            return await find_vehicle(entity_id)
-        elif self.name == "llms":
-            return await find_llm(entity_id)
-        return None
-    
-    async def update_one(self, filter_dict: Dict, update_dict: Dict, upsert: bool = False):
+        docs = await find_documents(self.name, filter_dict, projection, limit=1)
+        return docs[0] if docs else None
+
+    async def update_one(
+        self, filter_dict: Dict, update_dict: Dict, upsert: bool = False
+    ):
         """Mock update_one operation."""
         entity_id = filter_dict.get("_id")
-        
+
         if "$push" in update_dict and "messages" in update_dict["$push"]:
-            # Adding a message
+            # Adding a message, optionally with status and state changes in the
+            # same write
             message = update_dict["$push"]["messages"]
+            status = update_dict.get("$set", {}).get("status")
             if self.name == "vehicles":
-                success = await upsert_vehicle_message(entity_id, message)
+                state = update_dict.get("$set", {}).get("state")
+                success = await upsert_vehicle_message(
+                    entity_id, message, status, state
+                )
             elif self.name == "llms":
-                success = await upsert_llm_message(entity_id, message)
+                success = await upsert_llm_message(entity_id, message, status)
             return MockResult(success)
-        
+
         if "$set" in update_dict and "status" in update_dict["$set"]:
             # Updating status
             status = update_dict["$set"]["status"]
@@ -330,52 +547,56 @@ class MockCollection:
             elif self.name == "llms":
                 success = await update_llm_status(entity_id, status)
             return MockResult(success)
-        
+
+        if self.name == "veh2llm" and "llm_id" in update_dict.get("$set", {}):
+            # Mapping a vehicle to its LLM agent
+            success = await assign_llm_to_vehicle(
+                filter_dict.get("vehicle_id"), update_dict["$set"]["llm_id"]
+            )
+            return MockResult(success)
+
+        if "$set" in update_dict and "state" in update_dict["$set"]:
+            # Replacing the latest state
+            success = False
+            if self.name == "vehicles":
+                success = await update_vehicle_state(
+                    entity_id, update_dict["$set"]["state"]
+                )
+            return MockResult(success)
+
         return MockResult(True)
-    
+
     async def count_documents(self, filter_dict: Dict = None):
         """Mock count_documents operation."""
         if self.name == "vehicles":
-            vehicles = await get_all_vehicles()
-            return len(vehicles)
+            return await count_entities("vehicle")
         elif self.name == "llms":
-            llms = await get_all_llms()
-            return len(llms)
+            return await count_entities("llm")
         return 0
 
 
 class MockAsyncCursor:
     """Mock async cursor for iterating over results."""
-    
-    def __init__(self, collection_name: str, filter_dict: Dict = None):
+
+    def __init__(
+        self, collection_name: str, filter_dict: Dict = None, projection: Dict = None
+    ):
         self.collection_name = collection_name
         self.filter_dict = filter_dict or {}
+        self.projection = projection
         self.data = None
         self.index = 0
-    
-    async def _load_data(self):
-        """Load data from SQLite on first access."""
+
+    async def _load_data(self, limit: Optional[int] = None):
+        """Run the query on first access."""
         if self.data is None:
-            if self.collection_name == "vehicles":
-                self.data = await get_all_vehicles()
-            elif self.collection_name == "llms":
-                self.data = await get_all_llms()
-            else:
-                self.data = []
-            
-            # Apply filtering if needed
-            if "_id" in self.filter_dict and "$in" in str(self.filter_dict.get("_id", {})):
-                # Handle $in filter for batch operations
-                allowed_ids = self.filter_dict["_id"]["$in"]
-                self.data = [item for item in self.data if item["_id"] in allowed_ids]
-            elif "_id" in self.filter_dict and "$ne" in str(self.filter_dict.get("_id", {})):
-                # Handle $ne filter (not equal)
-                excluded_id = self.filter_dict["_id"]["$ne"]
-                self.data = [item for item in self.data if item["_id"] != excluded_id]
-    
+            self.data = await find_documents(
+                self.collection_name, self.filter_dict, self.projection, limit
+            )
+
     def __aiter__(self):
         return self
-    
+
     async def __anext__(self):
         await self._load_data()
         if self.index >= len(self.data):
@@ -383,10 +604,10 @@ class MockAsyncCursor:
         item = self.data[self.index]
         self.index += 1
         return item
-    
+
     async def to_list(self, length: int = None):
         """Convert cursor to list (MongoDB compatibility)."""
-        await self._load_data()
+        await self._load_data(length)
         if length is None:
             return self.data
         return self.data[:length]
@@ -394,14 +615,14 @@ class MockAsyncCursor:
 
 class MockCursor:
     """Mock cursor for iterating over results (legacy compatibility)."""
-    
+
     def __init__(self, data: List[Dict]):
         self.data = data
         self.index = 0
-    
+
     def __aiter__(self):
         return self
-    
+
     async def __anext__(self):
         if self.index >= len(self.data):
             raise StopAsyncIteration
@@ -412,8 +633,8 @@ class MockCursor:
 
 class MockResult:
     """Mock result object for update operations."""
-    
+
     def __init__(self, success: bool):
         self.matched_count = 1 if success else 0
         self.modified_count = 1 if success else 0
-        self.upserted_id = None if success else None
\ No newline at end of file
+        self.upserted_id = None if success else None
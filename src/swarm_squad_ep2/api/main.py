@@ -1,4 +1,5 @@
 import logging
+import os
 from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
@@ -19,11 +20,22 @@ from swarm_squad_ep2.api.database import (
     get_all_vehicles,
     is_db_connected,
 )
-from swarm_squad_ep2.api.routers import batch, llms, realtime, veh2llm, vehicles
+from swarm_squad_ep2.api.routers import (
+    batch,
+    llms,
+    realtime,
+    stats,
+    veh2llm,
+    vehicles,
+)
+from swarm_squad_ep2.api.utils import EventLoopBlockGuard
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Log event loop stalls longer than this many milliseconds (0 disables)
+LOOP_BLOCK_WARN_MS = float(os.environ.get("SWARM_SQUAD_LOOP_BLOCK_WARN_MS", "0"))
+
 # Configure paths
 STATIC_DIR = Path(__file__).parent / "static"
 TEMPLATES_DIR = Path(__file__).parent / "templates"
@@ -32,12 +44,23 @@ TEMPLATES_DIR = Path(__file__).parent / "templates"
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifecycle events."""
-    # Startup: Connect to SQLite database
+    # Startup: Open the configured storage backend (SWARM_SQUAD_STORAGE)
     connection_success = await connect_to_db()
     if not connection_success:
-        logger.warning("Failed to connect to SQLite database during startup")
+        logger.warning("Failed to connect to storage backend during startup")
+    loop_guard = None
+    if LOOP_BLOCK_WARN_MS > 0:
+        loop_guard = EventLoopBlockGuard(
+            threshold=LOOP_BLOCK_WARN_MS / 1000, raise_on_exit=False
+        )
+        await loop_guard.start()
+    # Relay broadcasts between workers (SWARM_SQUAD_BUS)
+    await realtime.bus.start(realtime.room_manager.broadcast_to_rooms)
     yield
-    # Shutdown: Close SQLite database connection
+    await realtime.bus.stop()
+    if loop_guard is not None:
+        await loop_guard.stop()
+    # Shutdown: Flush and close the storage backend
     await close_db_connection()
 
 
@@ -110,6 +133,7 @@ app.include_router(llms.router)
 app.include_router(veh2llm.router)
 app.include_router(realtime.router)
 app.include_router(batch.router)
+app.include_router(stats.router)
 
 
 @app.get("/")
@@ -128,8 +152,8 @@ async def root(request: Request):
             raise Exception("Database connection not available")
 
         # Get all vehicles and LLMs directly from SQLite
-        vehicles = await get_all_vehicles()
-        llms = await get_all_llms()
+        vehicles = await get_all_vehicles(messages_limit=5)
+        llms = await get_all_llms(messages_limit=5)
 
         # Get recent messages from both vehicles and LLMs
         recent_messages = []
@@ -141,6 +165,7 @@ async def root(request: Request):
                     recent_messages.append(
                         {
                             "timestamp": msg.get("timestamp"),
+                            "ingest_ns": msg.get("ingest_ns") or 0,
                             "source": f"Vehicle {vehicle['_id']}",
                             "message": msg.get("message"),
                         }
@@ -157,15 +182,15 @@ async def root(request: Request):
                     recent_messages.append(
                         {
                             "timestamp": msg.get("timestamp"),
+                            "ingest_ns": msg.get("ingest_ns") or 0,
                             "source": f"LLM {llm['_id']}",
                             "message": msg.get("message"),
                         }
                     )
 
-        # Sort messages by timestamp and get the 10 most recent
-        recent_messages.sort(
-            key=lambda x: x["timestamp"] if x["timestamp"] else 0, reverse=True
-        )
+        # Sort messages by ingest time (client timestamps mix formats) and
+        # get the 10 most recent
+        recent_messages.sort(key=lambda x: x["ingest_ns"], reverse=True)
         recent_messages = recent_messages[:10]
 
         # Return the template with data
@@ -71,7 +71,8 @@ class NearbyVehicle(BaseModel):
 
 
 class BatchStateResponse(BaseModel):
-    states: Dict[str, VehicleState]
+    # Latest state as ingested; simulators send flat dicts rather than VehicleState
+    states: Dict[str, Dict[str, Any]]
     timestamp: float = Field(default_factory=lambda: datetime.utcnow().timestamp())
 
 
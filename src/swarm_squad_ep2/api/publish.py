@@ -0,0 +1,189 @@
+"""
+Pipelined publishing of messages over a WebSocket.
+
+An authenticated `/ws` connection may send publish frames instead of one
+`POST /messages/` per message:
+
+    {"action": "publish", "id": 17, "entity_id": "v1", "content": "...",
+     "message_type": "vehicle_update", "state": {...}, "room_ids": [...]}
+
+or a JSON array of them. The fields are those of the POST body; `id` is
+assigned by the client. Frames are not answered one by one: each message is
+stored as soon as it is read, so many are in flight and share the storage
+engine's group commits, then broadcast in the order they were sent. Once a
+run of messages is stored, one ack names all of their IDs:
+
+    {"type": "ack", "action": "publish", "ids": [17, 18, 19]}
+
+A message that cannot be stored gets an error reply instead:
+
+    {"type": "error", "action": "publish", "id": 20, "detail": "..."}
+
+An acked message is stored and was broadcast; a client that reconnects
+should resend what was not acked. At most PUBLISH_MAX_INFLIGHT messages
+per connection are in flight; beyond that the connection's frames are not
+read until some are stored, which pushes back on the client.
+
+Publishing needs the SWARM_SQUAD_PUBLISH_TOKEN, as a bearer token in the
+Authorization header or the `token` query parameter. Without a configured
+token only clients on this host may publish. Publish frames of other
+connections get an error reply with `"status": 403`.
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Token publishers must present; unset allows loopback clients only
+PUBLISH_TOKEN = os.environ.get("SWARM_SQUAD_PUBLISH_TOKEN") or None
+
+# Messages of one connection being stored before its frames stop being read
+PUBLISH_MAX_INFLIGHT = int(os.environ.get("SWARM_SQUAD_PUBLISH_MAX_INFLIGHT", "1024"))
+
+# IDs acknowledged per ack frame at most
+PUBLISH_ACK_MAX = 512
+
+_LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+Reply = Callable[[Dict[str, Any]], Awaitable[None]]
+Store = Callable[[Dict[str, Any]], Awaitable[Tuple[Dict[str, Any], List[str]]]]
+Publish = Callable[[Dict[str, Any], List[str]], Awaitable[None]]
+
+
+def is_authorized(
+    token: Optional[str], host: Optional[str], expected: Optional[str] = PUBLISH_TOKEN
+) -> bool:
+    """
+    Whether a client may publish.
+
+    Args:
+        token: Token the client presented, if any
+        host: Address of the client
+        expected: Configured token; None allows loopback clients only
+    """
+    if expected is None:
+        return host in _LOOPBACK_HOSTS
+    return token is not None and hmac.compare_digest(
+        token.encode("utf-8"), expected.encode("utf-8")
+    )
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Get the token of an `Authorization: Bearer <token>` header."""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    return token.strip() if scheme.lower() == "bearer" else None
+
+
+class PublishPipeline:
+    """
+    Stores and broadcasts the publish frames of one connection, in order.
+
+    Args:
+        store: Validates and stores a publish frame, returning the message to
+            broadcast and its rooms; raises ValueError for invalid frames
+        publish: Broadcasts a stored message to its rooms
+        reply: Sends an ack or error frame to the publisher
+        max_inflight: Messages being stored before submit() waits
+    """
+
+    def __init__(
+        self,
+        store: Store,
+        publish: Publish,
+        reply: Reply,
+        max_inflight: int = PUBLISH_MAX_INFLIGHT,
+    ):
+        self._store = store
+        self._publish = publish
+        self._reply = reply
+        self._slots = asyncio.Semaphore(max(1, max_inflight))
+        self._inflight: Deque[Tuple[Any, asyncio.Task]] = deque()
+        self._ready = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.failed = 0
+        self.acks = 0
+
+    def start(self) -> None:
+        """Start the task that acks stored messages."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Finish the messages in flight and stop.
+
+        Messages already read are still stored and broadcast when the
+        publisher goes away; their acks are lost, so it may resend them.
+        """
+        if self._task is None:
+            return
+        if self._inflight and not self._task.done():
+            await self._drained.wait()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, frame: Dict[str, Any]) -> None:
+        """Start storing a publish frame, waiting while too many are in flight."""
+        await self._slots.acquire()
+        self._inflight.append(
+            (frame.get("id"), asyncio.create_task(self._store(frame)))
+        )
+        self._ready.set()
+
+    async def _run(self) -> None:
+        while True:
+            while not self._inflight:
+                self._drained.set()
+                self._ready.clear()
+                await self._ready.wait()
+            self._drained.clear()
+            ids: List[Any] = []
+            # Wait for the oldest message, then take every stored one behind it
+            await asyncio.wait([self._inflight[0][1]])
+            while (
+                self._inflight
+                and self._inflight[0][1].done()
+                and len(ids) < PUBLISH_ACK_MAX
+            ):
+                message_id, task = self._inflight.popleft()
+                self._slots.release()
+                if await self._finish(message_id, task) and message_id is not None:
+                    ids.append(message_id)
+            if ids:
+                self.acks += 1
+                await self._reply({"type": "ack", "action": "publish", "ids": ids})
+
+    async def _finish(self, message_id: Any, task: asyncio.Task) -> bool:
+        """Broadcast a stored message, or report why it was not stored."""
+        try:
+            message, rooms = task.result()
+        except ValueError as e:
+            detail = str(e)
+        except Exception as e:
+            logger.error(f"Error storing published message: {e}")
+            detail = f"Error storing message: {e}"
+        else:
+            self.published += 1
+            try:
+                await self._publish(message, rooms)
+            except Exception as e:
+                # Stored all the same; subscribers find it in the history
+                logger.error(f"Error broadcasting published message: {e}")
+            return True
+        self.failed += 1
+        await self._reply(
+            {"type": "error", "action": "publish", "id": message_id, "detail": detail}
+        )
+        return False
@@ -2,9 +2,16 @@
 FastAPI routers for the Swarm Squad Ep2 application.
 
 Contains routers for vehicles, LLMs, batch operations, real-time communication,
-and vehicle-to-LLM mappings.
+vehicle-to-LLM mappings and runtime statistics.
 """
 
-from swarm_squad_ep2.api.routers import batch, llms, realtime, veh2llm, vehicles
+from swarm_squad_ep2.api.routers import (
+    batch,
+    llms,
+    realtime,
+    stats,
+    veh2llm,
+    vehicles,
+)
 
-__all__ = ["batch", "llms", "realtime", "veh2llm", "vehicles"]
+__all__ = ["batch", "llms", "realtime", "stats", "veh2llm", "vehicles"]
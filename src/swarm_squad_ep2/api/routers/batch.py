@@ -3,7 +3,11 @@ from typing import List
 
 from fastapi import APIRouter, Query
 
-from swarm_squad_ep2.api.database import get_collection
+from swarm_squad_ep2.api.database import (
+    get_collection,
+    get_entities_messages,
+    get_latest_states,
+)
 from swarm_squad_ep2.api.models import BatchMessageResponse, BatchStateResponse
 
 router = APIRouter(
@@ -24,12 +28,7 @@ async def get_vehicles_states(
     ),
 ):
     """Batch fetch states for multiple vehicles"""
-    vehicles_collection = get_collection("vehicles")
-    states = {}
-    async for vehicle in vehicles_collection.find({"_id": {"$in": vehicle_ids}}):
-        if vehicle.get("state"):
-            states[vehicle["_id"]] = vehicle["state"]
-
+    states = await get_latest_states(vehicle_ids)
     return BatchStateResponse(states=states)
 
 
@@ -38,12 +37,7 @@ async def get_vehicles_messages(
     vehicle_ids: List[str] = Query(...), limit: int = Query(50, ge=1, le=100)
 ):
     """Batch fetch messages for multiple vehicles"""
-    vehicles_collection = get_collection("vehicles")
-    messages = {}
-    async for vehicle in vehicles_collection.find({"_id": {"$in": vehicle_ids}}):
-        if vehicle.get("messages"):
-            messages[vehicle["_id"]] = vehicle["messages"][-limit:]
-
+    messages = await get_entities_messages(vehicle_ids, limit)
     return BatchMessageResponse(messages=messages)
 
 
@@ -52,12 +46,7 @@ async def get_llms_messages(
     llm_ids: List[str] = Query(...), limit: int = Query(50, ge=1, le=100)
 ):
     """Batch fetch messages for multiple LLM agents"""
-    llms_collection = get_collection("llms")
-    messages = {}
-    async for llm in llms_collection.find({"_id": {"$in": llm_ids}}):
-        if llm.get("messages"):
-            messages[llm["_id"]] = llm["messages"][-limit:]
-
+    messages = await get_entities_messages(llm_ids, limit)
     return {"messages": messages}
 
 
@@ -65,9 +54,8 @@ async def get_llms_messages(
 async def get_nearby_llms_messages(llm_id: str, limit: int = Query(50, ge=1, le=100)):
     """Batch fetch messages from all nearby LLM agents"""
     vehicles_collection = get_collection("vehicles")
-    llms_collection = get_collection("llms")
     veh2llm_collection = get_collection("veh2llm")
-    
+
     # First get the vehicle associated with this LLM
     mapping = await veh2llm_collection.find_one({"llm_id": llm_id})
     if not mapping:
@@ -101,9 +89,5 @@ async def get_nearby_llms_messages(llm_id: str, limit: int = Query(50, ge=1, le=
         nearby_llm_ids.append(nearby_mapping["llm_id"])
 
     # Fetch messages for all nearby LLMs
-    messages = {}
-    async for llm in llms_collection.find({"_id": {"$in": nearby_llm_ids}}):
-        if llm.get("messages"):
-            messages[llm["_id"]] = llm["messages"][-limit:]
-
+    messages = await get_entities_messages(nearby_llm_ids, limit)
     return {"messages": messages}
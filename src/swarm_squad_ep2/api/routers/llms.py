@@ -3,7 +3,7 @@ from typing import List
 
 from fastapi import APIRouter, HTTPException
 
-from swarm_squad_ep2.api.database import get_collection
+from swarm_squad_ep2.api.database import find_llm, get_collection
 from swarm_squad_ep2.api.models import LLMAgent, LLMMessage
 
 router = APIRouter(
@@ -37,7 +37,7 @@ async def get_llm(agent_id: str):
 async def add_llm_message(agent_id: str, message: LLMMessage):
     """Add a new message for an LLM agent"""
     llms_collection = get_collection("llms")
-    llm = await llms_collection.find_one({"_id": agent_id})
+    llm = await find_llm(agent_id, messages_limit=0)
     if not llm:
         raise HTTPException(status_code=404, detail="LLM agent not found")
 
@@ -1,19 +1,40 @@
-import asyncio
+import json
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Tuple
 
 from fastapi import (
     APIRouter,
     Body,
+    Header,
     HTTPException,
     Query,
+    Request,
     WebSocket,
     WebSocketDisconnect,
 )
 
-from swarm_squad_ep2.api.database import get_collection
+from swarm_squad_ep2.api.bus import create_bus
+from swarm_squad_ep2.api.connections import RoomConnectionManager, check_room
+from swarm_squad_ep2.api.database import (
+    get_all_llms,
+    get_all_vehicles,
+    get_collection,
+    get_entity_ids,
+    get_entity_messages,
+    get_message_history,
+    get_recent_messages,
+    search_messages,
+)
+from swarm_squad_ep2.api.publish import PublishPipeline, bearer_token, is_authorized
+from swarm_squad_ep2.api.sse import (
+    EventStream,
+    EventStreamResponse,
+    StreamRegistry,
+    accepts_gzip,
+)
 from swarm_squad_ep2.api.utils import ConnectionManager
+from swarm_squad_ep2.api.wire import SUBPROTOCOL
 
 logger = logging.getLogger(__name__)
 
@@ -23,231 +44,315 @@ router = APIRouter(tags=["realtime"])
 manager = ConnectionManager()
 
 
-class RoomConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, rooms: List[str]):
-        """Accept and store a new WebSocket connection with room subscriptions"""
-        await websocket.accept()
-
-        # Add connection to each room
-        for room in rooms:
-            if room not in self.active_connections:
-                self.active_connections[room] = set()
-            self.active_connections[room].add(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        """Remove a WebSocket connection from all rooms"""
-        for room in list(self.active_connections.keys()):
-            if websocket in self.active_connections[room]:
-                self.active_connections[room].remove(websocket)
-                # Clean up empty rooms
-                if not self.active_connections[room]:
-                    del self.active_connections[room]
-
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
-        """Send a message to a specific client"""
-        await websocket.send_json(message)
-
-    async def broadcast_to_room(self, message: dict, room: str):
-        """Broadcast a message to all clients in a room"""
-        if room in self.active_connections:
-            disconnected_clients = set()
-            for connection in self.active_connections[room]:
-                try:
-                    await connection.send_json(message)
-                except Exception:
-                    # Mark for removal if sending fails
-                    disconnected_clients.add(connection)
-
-            # Remove any disconnected clients
-            for client in disconnected_clients:
-                self.disconnect(client)
-
-
 # Create a room connection manager instance
 room_manager = RoomConnectionManager()
 
+# Relays broadcasts to the subscribers of every worker (SWARM_SQUAD_BUS);
+# started by the app lifespan with room_manager.broadcast_to_rooms
+bus = create_bus()
+
+# /stream event streams, by the key in their event IDs
+event_streams = StreamRegistry()
+
+
+# Actions of control messages clients send over /ws, e.g.
+#   {"action": "subscribe", "rooms": ["v2", "vl2"], "id": 7}
+CONTROL_ACTIONS = ("subscribe", "unsubscribe", "list")
+
+
+def _parse_since(value, rooms: List[str]) -> Dict[str, int]:
+    """
+    Parse the last seq a client saw per room.
+
+    `value` is a number applying to every room in `rooms` except patterns,
+    a string of `room:seq` pairs such as "v1:12,vl1:40", or a dict.
+
+    Raises:
+        ValueError: If the value cannot be parsed
+    """
+    if isinstance(value, str) and ":" not in value:
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        since = {room: value for room in rooms if "*" not in room}
+    elif isinstance(value, str):
+        since = {}
+        for pair in value.split(","):
+            room, _, seq = pair.rpartition(":")
+            since[room] = int(seq)
+    elif isinstance(value, dict):
+        try:
+            since = {room: int(seq) for room, seq in value.items()}
+        except TypeError:
+            raise ValueError("since must map rooms to seqs")
+    else:
+        raise ValueError("since must be a seq or a mapping of rooms to seqs")
+    if any(seq < 0 for seq in since.values()):
+        raise ValueError("since must not be negative")
+    return since
+
+
+async def _handle_control(websocket: WebSocket, data: Dict) -> None:
+    """
+    Apply a subscribe/unsubscribe/list control message and acknowledge it.
+
+    The reply has `type` "ack" (or "error"), the `action`, the request `id`
+    if one was given, the `rooms` the action changed and the connection's
+    resulting `subscribed` rooms. It is queued behind frames already sent to
+    the connection, and frames of newly subscribed rooms follow it.
+
+    A subscribe message may set `max_rate`, the most entity updates per
+    second per entity and room to deliver for its rooms; "list" reports the
+    rates as `max_rates`. It may also set `since`, the last `seq` seen (per
+    room, see _parse_since()), to be replayed what was missed; replayed
+    frames are queued before the ack, which counts them in `replayed`.
+    """
+    action = data["action"]
+    reply = {"type": "ack", "action": action}
+    if "id" in data:
+        reply["id"] = data["id"]
+
+    if action != "list":
+        rooms = data.get("rooms")
+        if isinstance(rooms, str):
+            rooms = rooms.split(",")
+        if not isinstance(rooms, list) or not all(
+            isinstance(room, str) and room for room in rooms
+        ):
+            reply["type"] = "error"
+            reply["detail"] = "rooms must be a list of room IDs"
+            await room_manager.send_personal_message(reply, websocket)
+            return
+        try:
+            if action == "subscribe":
+                max_rate = data.get("max_rate")
+                if max_rate is not None and not isinstance(max_rate, (int, float)):
+                    raise ValueError("max_rate must be a number")
+                since = data.get("since")
+                since = _parse_since(since, rooms) if since is not None else None
+                reply["rooms"] = room_manager.subscribe(websocket, rooms, max_rate)
+                if since:
+                    reply["replayed"] = room_manager.replay(websocket, since)
+            else:
+                reply["rooms"] = room_manager.unsubscribe(websocket, rooms)
+        except ValueError as e:
+            reply["type"] = "error"
+            reply["detail"] = str(e)
+            await room_manager.send_personal_message(reply, websocket)
+            return
+
+    reply["subscribed"] = room_manager.subscriptions(websocket)
+    if action == "list":
+        reply["max_rates"] = room_manager.subscription_rates(websocket)
+    await room_manager.send_personal_message(reply, websocket)
+
+
+def _format_message(msg: Dict, entity_id: str, room_id: str, default_type: str) -> Dict:
+    """Shape a stored message for the /messages response."""
+    return {
+        "id": f"{entity_id}-{msg.get('timestamp', '')}",
+        "room_id": room_id,
+        "entity_id": entity_id,
+        "content": msg.get("message", ""),
+        "timestamp": msg.get("timestamp", ""),
+        "message_type": msg.get("message_type", default_type),
+        "state": msg.get("state", {}),
+        "ingest_ns": msg.get("ingest_ns"),
+        "rooms": msg.get("rooms") or [room_id],
+    }
+
 
 @router.get("/messages")
 async def get_messages(
     room_id: Optional[str] = Query(None),
     limit: int = Query(50, ge=1, le=100),
+    include_archived: bool = Query(False),
 ):
     """
     Get messages from the database.
 
     If room_id is provided, get messages for that specific room.
-    Otherwise, get recent messages from all entities.
+    Otherwise, get recent messages from all entities. For vehicle and LLM
+    rooms, include_archived also reads messages moved out by retention.
     """
     try:
-        vehicles_collection = get_collection("vehicles")
-        llms_collection = get_collection("llms")
-
-        if vehicles_collection is None or llms_collection is None:
-            raise HTTPException(
-                status_code=500, detail="Database collections not available"
-            )
-
         all_messages = []
 
         if room_id:
             # Get messages for specific room/entity
             if room_id.startswith("master-"):
-                # Master room - aggregate messages from all entities
+                # Master room - aggregate the last 5 messages of every entity
                 if room_id == "master-vehicles":
-                    # Get recent messages from all vehicles
-                    async for vehicle in vehicles_collection.find():
-                        if vehicle.get("messages"):
-                            for msg in vehicle["messages"][-5:]:  # Last 5 from each vehicle
-                                all_messages.append(
-                                    {
-                                        "id": f"{vehicle['_id']}-{msg.get('timestamp', '')}",
-                                        "room_id": room_id,
-                                        "entity_id": vehicle["_id"],
-                                        "content": msg.get("message", ""),
-                                        "timestamp": msg.get("timestamp", ""),
-                                        "message_type": msg.get("message_type", "vehicle_update"),
-                                        "state": msg.get("state", {}),
-                                    }
-                                )
+                    recent = await get_recent_messages("vehicle", per_entity=5)
+                    default_type = "vehicle_update"
                 elif room_id == "master-llms":
-                    # Get recent messages from all LLMs
-                    async for llm in llms_collection.find():
-                        if llm.get("messages"):
-                            for msg in llm["messages"][-5:]:  # Last 5 from each LLM
-                                all_messages.append(
-                                    {
-                                        "id": f"{llm['_id']}-{msg.get('timestamp', '')}",
-                                        "room_id": room_id,
-                                        "entity_id": llm["_id"],
-                                        "content": msg.get("message", ""),
-                                        "timestamp": msg.get("timestamp", ""),
-                                        "message_type": msg.get("message_type", "llm_response"),
-                                        "state": msg.get("state", {}),
-                                    }
-                                )
-            elif room_id.startswith("v"):
-                # Vehicle room
-                entity_id = room_id.replace(
-                    "vl", "v"
-                )  # Handle both 'v1' and 'vl1' formats
-                collection = vehicles_collection
-                
-                entity = await collection.find_one({"_id": entity_id})
-                if entity and entity.get("messages"):
-                    for msg in entity["messages"][-limit:]:
-                        all_messages.append(
-                            {
-                                "id": f"{entity_id}-{msg.get('timestamp', '')}",
-                                "room_id": room_id,
-                                "entity_id": entity_id,
-                                "content": msg.get("message", ""),
-                                "timestamp": msg.get("timestamp", ""),
-                                "message_type": msg.get("message_type", "update"),
-                                "state": msg.get("state", {}),
-                            }
-                        )
-            elif room_id.startswith("l"):
-                # LLM room
-                entity_id = room_id
-                collection = llms_collection
-                
-                entity = await collection.find_one({"_id": entity_id})
-                if entity and entity.get("messages"):
-                    for msg in entity["messages"][-limit:]:
+                    recent = await get_recent_messages("llm", per_entity=5)
+                    default_type = "llm_response"
+                else:
+                    recent = {}
+                    default_type = "update"
+                for entity_id, messages in recent.items():
+                    for msg in messages:
                         all_messages.append(
-                            {
-                                "id": f"{entity_id}-{msg.get('timestamp', '')}",
-                                "room_id": room_id,
-                                "entity_id": entity_id,
-                                "content": msg.get("message", ""),
-                                "timestamp": msg.get("timestamp", ""),
-                                "message_type": msg.get("message_type", "update"),
-                                "state": msg.get("state", {}),
-                            }
+                            _format_message(msg, entity_id, room_id, default_type)
                         )
+            elif room_id.startswith("v") or room_id.startswith("l"):
+                # Vehicle room ('v1' and 'vl1' formats) or LLM room
+                entity_id = (
+                    room_id.replace("vl", "v") if room_id.startswith("v") else room_id
+                )
+                messages = await get_entity_messages(
+                    entity_id, limit, include_archived=include_archived
+                )
+                for msg in messages:
+                    all_messages.append(
+                        _format_message(msg, entity_id, room_id, "update")
+                    )
             else:
                 raise HTTPException(status_code=400, detail="Invalid room_id format")
         else:
             # Get recent messages from all entities
-            async for vehicle in vehicles_collection.find():
-                if vehicle.get("messages"):
-                    for msg in vehicle["messages"][-5:]:  # Last 5 from each vehicle
+            for entity_type, default_type in (
+                ("vehicle", "vehicle_update"),
+                ("llm", "llm_response"),
+            ):
+                recent = await get_recent_messages(entity_type, per_entity=5)
+                for entity_id, messages in recent.items():
+                    for msg in messages:
                         all_messages.append(
-                            {
-                                "id": f"{vehicle['_id']}-{msg.get('timestamp', '')}",
-                                "room_id": vehicle["_id"],
-                                "entity_id": vehicle["_id"],
-                                "content": msg.get("message", ""),
-                                "timestamp": msg.get("timestamp", ""),
-                                "message_type": msg.get(
-                                    "message_type", "vehicle_update"
-                                ),
-                                "state": msg.get("state", {}),
-                            }
+                            _format_message(msg, entity_id, entity_id, default_type)
                         )
 
-            async for llm in llms_collection.find():
-                if llm.get("messages"):
-                    for msg in llm["messages"][-5:]:  # Last 5 from each LLM
-                        all_messages.append(
-                            {
-                                "id": f"{llm['_id']}-{msg.get('timestamp', '')}",
-                                "room_id": llm["_id"],
-                                "entity_id": llm["_id"],
-                                "content": msg.get("message", ""),
-                                "timestamp": msg.get("timestamp", ""),
-                                "message_type": msg.get("message_type", "llm_response"),
-                                "state": msg.get("state", {}),
-                            }
-                        )
-
-        # Sort by timestamp and limit results
-        all_messages.sort(key=lambda x: x["timestamp"] or "", reverse=True)
+        # Sort by ingest time and limit results; client timestamps mix ISO
+        # strings and epoch numbers so they cannot be compared reliably
+        all_messages.sort(key=lambda x: x["ingest_ns"] or 0, reverse=True)
         return all_messages[:limit]
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error fetching messages: {str(e)}"
         )
 
 
+@router.get("/messages/history")
+async def get_messages_history(
+    room_id: Optional[str] = Query(None),
+    entity_id: Optional[str] = Query(None),
+    start_ns: Optional[int] = Query(None, alias="from", ge=0),
+    end_ns: Optional[int] = Query(None, alias="to", ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = Query(None),
+):
+    """
+    Get the messages of a room or entity in a window of ingest time.
+
+    `from` (inclusive) and `to` (exclusive) are epoch nanoseconds matching the
+    `ingest_ns` of returned messages. Messages come oldest first; when the
+    page is full, `next` is the `after` value that continues after it. It
+    names the page's last message as `ingest_ns:message_id`, since messages
+    ingested by different workers may share an ingest_ns; `after` takes
+    the place of `from`.
+    """
+    if room_id is None and entity_id is None:
+        raise HTTPException(
+            status_code=400, detail="Either room_id or entity_id is required"
+        )
+    after_id = None
+    if after is not None:
+        try:
+            start_ns, after_id = (int(part) for part in after.split(":"))
+        except ValueError:
+            raise HTTPException(
+                status_code=400, detail="after must be an ingest_ns:message_id cursor"
+            )
+    try:
+        messages = await get_message_history(
+            room_id, entity_id, start_ns, end_ns, limit, after_id
+        )
+        return {
+            "messages": [
+                _format_message(
+                    msg, msg["entity_id"], msg.get("room_id", room_id), "update"
+                )
+                for msg in messages
+            ],
+            "next": (
+                f"{messages[-1]['ingest_ns']}:{messages[-1]['message_id']}"
+                if len(messages) == limit
+                else None
+            ),
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error fetching message history: {str(e)}"
+        )
+
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1),
+    room_id: Optional[str] = Query(None),
+    entity_id: Optional[str] = Query(None),
+    message_type: Optional[str] = Query(None),
+    start_ns: Optional[int] = Query(None, alias="from", ge=0),
+    end_ns: Optional[int] = Query(None, alias="to", ge=0),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    Find messages by content, newest first.
+
+    Every word of `q` must appear in the message text; a trailing `*` matches
+    a prefix (e.g. `batt*`). `from`/`to` bound the ingest time in epoch
+    nanoseconds. Only messages still in hot storage are searched.
+    """
+    try:
+        messages = await search_messages(
+            q, room_id, entity_id, message_type, start_ns, end_ns, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error searching messages: {str(e)}"
+        )
+    return {
+        "messages": [
+            _format_message(msg, msg["entity_id"], msg.get("room_id"), "update")
+            for msg in messages
+        ],
+    }
+
+
 @router.get("/rooms")
 async def get_rooms():
     """Get available rooms/entities with dynamic structure based on active vehicles."""
     try:
-        vehicles_collection = get_collection("vehicles")
-        llms_collection = get_collection("llms")
-
-        if vehicles_collection is None or llms_collection is None:
-            raise HTTPException(
-                status_code=500, detail="Database collections not available"
-            )
-
         rooms = []
         vehicle_ids = []
         llm_ids = []
 
         # Add master rooms (always present) - add them first
-        rooms.append({
-            "id": "master-vehicles",
-            "name": "🚗 All Vehicles",
-            "type": "master-vehicle",
-            "messages": [],
-        })
-        
-        rooms.append({
-            "id": "master-llms",
-            "name": "🤖 All LLMs", 
-            "type": "master-llm",
-            "messages": [],
-        })
-
-        # Get all active vehicles
-        async for vehicle in vehicles_collection.find():
-            vehicle_id = vehicle["_id"]
+        rooms.append(
+            {
+                "id": "master-vehicles",
+                "name": "🚗 All Vehicles",
+                "type": "master-vehicle",
+                "messages": [],
+            }
+        )
+
+        rooms.append(
+            {
+                "id": "master-llms",
+                "name": "🤖 All LLMs",
+                "type": "master-llm",
+                "messages": [],
+            }
+        )
+
+        # Get all active vehicles; only their IDs are needed
+        for vehicle_id in await get_entity_ids("vehicle"):
             vehicle_ids.append(vehicle_id)
             rooms.append(
                 {
@@ -259,8 +364,7 @@ async def get_rooms():
             )
 
         # Get all active LLMs
-        async for llm in llms_collection.find():
-            llm_id = llm["_id"]
+        for llm_id in await get_entity_ids("llm"):
             llm_ids.append(llm_id)
             rooms.append(
                 {
@@ -273,41 +377,56 @@ async def get_rooms():
 
         # If no vehicles/LLMs found in database, add some default ones for testing
         if len(vehicle_ids) == 0 and len(llm_ids) == 0:
-            logger.warning("No vehicles or LLMs found in database, adding default rooms")
+            logger.warning(
+                "No vehicles or LLMs found in database, adding default rooms"
+            )
             for i in range(1, 4):  # Add default v1, v2, v3 and l1, l2, l3
                 vehicle_ids.append(f"v{i}")
                 llm_ids.append(f"l{i}")
-                rooms.append({
-                    "id": f"v{i}",
-                    "name": f"Vehicle {i}",
-                    "type": "vehicle", 
-                    "messages": [],
-                })
-                rooms.append({
-                    "id": f"l{i}",
-                    "name": f"LLM {i}",
-                    "type": "llm",
-                    "messages": [],
-                })
+                rooms.append(
+                    {
+                        "id": f"v{i}",
+                        "name": f"Vehicle {i}",
+                        "type": "vehicle",
+                        "messages": [],
+                    }
+                )
+                rooms.append(
+                    {
+                        "id": f"l{i}",
+                        "name": f"LLM {i}",
+                        "type": "llm",
+                        "messages": [],
+                    }
+                )
 
         # Add vehicle-to-LLM rooms for each vehicle (more robust pairing)
         for vehicle_id in vehicle_ids:
             # Extract number from vehicle ID (e.g., "v1" -> "1")
-            vehicle_num = vehicle_id.replace('v', '') if vehicle_id.startswith('v') else vehicle_id
+            vehicle_num = (
+                vehicle_id.replace("v", "")
+                if vehicle_id.startswith("v")
+                else vehicle_id
+            )
             expected_llm_id = f"l{vehicle_num}"
-            
+
             # Check if corresponding LLM exists
             llm_exists = expected_llm_id in llm_ids
-            
-            rooms.append({
-                "id": f"vl{vehicle_num}",
-                "name": f"Veh{vehicle_num} - LLM{vehicle_num}" + ("" if llm_exists else " (LLM pending)"),
-                "type": "vl",
-                "messages": [],
-                "llm_ready": llm_exists,
-            })
 
-        logger.info(f"Generated {len(rooms)} rooms for {len(vehicle_ids)} vehicles and {len(llm_ids)} LLMs")
+            rooms.append(
+                {
+                    "id": f"vl{vehicle_num}",
+                    "name": f"Veh{vehicle_num} - LLM{vehicle_num}"
+                    + ("" if llm_exists else " (LLM pending)"),
+                    "type": "vl",
+                    "messages": [],
+                    "llm_ready": llm_exists,
+                }
+            )
+
+        logger.info(
+            f"Generated {len(rooms)} rooms for {len(vehicle_ids)} vehicles and {len(llm_ids)} LLMs"
+        )
         return rooms
 
     except Exception as e:
@@ -319,18 +438,10 @@ async def get_rooms():
 async def get_entities(room_id: Optional[str] = Query(None)):
     """Get entities, optionally filtered by room."""
     try:
-        vehicles_collection = get_collection("vehicles")
-        llms_collection = get_collection("llms")
-
-        if vehicles_collection is None or llms_collection is None:
-            raise HTTPException(
-                status_code=500, detail="Database collections not available"
-            )
-
         entities = []
 
         # Add vehicles
-        async for vehicle in vehicles_collection.find():
+        for vehicle in await get_all_vehicles(messages_limit=0):
             if not room_id or vehicle["_id"] == room_id:
                 entities.append(
                     {
@@ -344,7 +455,7 @@ async def get_entities(room_id: Optional[str] = Query(None)):
                 )
 
         # Add LLMs
-        async for llm in llms_collection.find():
+        for llm in await get_all_llms(messages_limit=0):
             if not room_id or llm["_id"] == room_id:
                 entities.append(
                     {
@@ -366,25 +477,133 @@ async def get_entities(room_id: Optional[str] = Query(None)):
 
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, rooms: str = Query(None)):
-    """WebSocket endpoint for real-time updates with room support"""
+async def websocket_endpoint(
+    websocket: WebSocket,
+    rooms: str = Query(None),
+    policy: Optional[str] = Query(None),
+    max_rate: Optional[float] = Query(None, gt=0),
+    batch_ms: Optional[float] = Query(None, ge=0, le=1000),
+    batch_max: Optional[int] = Query(None, ge=1, le=1024),
+    since: Optional[str] = Query(None),
+    token: Optional[str] = Query(None),
+):
+    """
+    WebSocket endpoint for real-time updates with room support
+
+    `rooms` are the initial subscriptions; an entry ending in `*` subscribes
+    to every room with that prefix, e.g. `v*`. They can be changed on the open
+    connection with control messages, see _handle_control():
+    `{"action": "subscribe" | "unsubscribe", "rooms": [...]}` or
+    `{"action": "list"}`, each with an optional `id` echoed in the ack.
+
+    `policy` overrides the server's slow-consumer policy for this connection:
+    drop_oldest, conflate or disconnect.
+
+    `max_rate` caps the initial rooms at that many updates per second per
+    entity; superseded states are dropped, alerts are always delivered.
+
+    Clients offering the `swarm.v1` subprotocol receive vehicle updates as
+    compact binary frames, see swarm_squad_ep2.api.wire.
+
+    `batch_ms` > 0 collects messages for up to that many milliseconds, or
+    `batch_max` messages, and sends them as one JSON array (or binary BATCH)
+    frame; acks and "pong" are never batched.
+
+    Every message carries `seq`, its sequence number in the room. A client
+    reconnecting with `since` (the last seq it saw, or `room:seq` pairs) is
+    first replayed the messages it missed from memory, with a "gap" frame if
+    some are no longer buffered.
+
+    Connections silent for a while are sent "ping" and must answer (with
+    "pong", or any frame) before the heartbeat timeout, see
+    RoomConnectionManager; a client's own "ping" is answered with "pong".
+
+    Connections authorized to publish (a `token` or bearer token, see
+    swarm_squad_ep2.api.publish) may send pipelined `{"action": "publish"}`
+    frames, which are stored like POST /messages/ and acked in batches.
+    """
     # Parse room list
     room_list = rooms.split(",") if rooms else []
 
     # Connect to all requested rooms
-    await room_manager.connect(websocket, room_list)
+    try:
+        await room_manager.connect(
+            websocket,
+            room_list,
+            policy,
+            max_rate,
+            binary=SUBPROTOCOL in websocket.scope.get("subprotocols", []),
+            batch_ms=batch_ms,
+            batch_max=batch_max,
+            since=_parse_since(since, room_list) if since is not None else None,
+        )
+    except ValueError as e:
+        logger.warning(f"Rejected WebSocket connection: {e}")
+        await websocket.close(code=1008)
+        return
+
+    publisher = None
+    if is_authorized(
+        token or bearer_token(websocket.headers.get("authorization")),
+        websocket.client.host if websocket.client else None,
+    ):
+
+        async def reply(frame: Dict) -> None:
+            await room_manager.send_personal_message(frame, websocket)
+
+        publisher = PublishPipeline(_store_published, bus.publish, reply)
+        publisher.start()
 
     try:
         while True:
             try:
-                # Use a timeout to prevent indefinite blocking
-                data = await asyncio.wait_for(websocket.receive_json(), timeout=30.0)
-                
-                # Handle heartbeat/ping messages
-                if isinstance(data, str) and data == "ping":
-                    await websocket.send_text("pong")
+                # Liveness is checked by the room manager's heartbeat wheel;
+                # any frame counts as a sign of life
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    logger.info("WebSocket client disconnected normally")
+                    break
+                room_manager.touch(websocket)
+                text = message.get("text")
+                if text is None:
+                    continue
+
+                # Handle heartbeats: answer the client's pings, and take its
+                # answers to the server's
+                if text in ("ping", '"ping"'):
+                    await room_manager.send_personal_message("pong", websocket)
+                    continue
+                if text in ("pong", '"pong"'):
+                    continue
+                data = json.loads(text)
+
+                # Handle subscription changes
+                if isinstance(data, dict) and data.get("action") in CONTROL_ACTIONS:
+                    await _handle_control(websocket, data)
                     continue
-                
+
+                # Handle published messages, alone or in an array
+                frames = data if isinstance(data, list) else [data]
+                if frames and all(
+                    isinstance(frame, dict) and frame.get("action") == "publish"
+                    for frame in frames
+                ):
+                    for frame in frames:
+                        if publisher is not None:
+                            await publisher.submit(frame)
+                        else:
+                            await room_manager.send_personal_message(
+                                {
+                                    "type": "error",
+                                    "action": "publish",
+                                    "id": frame.get("id"),
+                                    "detail": "Not authorized to publish",
+                                    "status": 403,
+                                },
+                                websocket,
+                            )
+                    continue
+
                 # Handle regular messages
                 if isinstance(data, dict):
                     # Check if message has a target room
@@ -392,19 +611,26 @@ async def websocket_endpoint(websocket: WebSocket, rooms: str = Query(None)):
 
                     if target_room:
                         # Broadcast to specific room
-                        await room_manager.broadcast_to_room(data, target_room)
+                        try:
+                            check_room(target_room)
+                        except ValueError as e:
+                            logger.warning(f"Ignoring WebSocket message: {e}")
+                            continue
+                        await bus.publish(data, [target_room])
                     else:
-                        # Broadcast to all rooms this client is connected to
-                        for room in room_list:
-                            await room_manager.broadcast_to_room(data, room)
-                            
-            except asyncio.TimeoutError:
-                # Send ping to check if client is still alive
-                try:
-                    await websocket.ping()
-                except Exception:
-                    # Client is not responding to ping, disconnect
-                    break
+                        # Broadcast to all rooms this client is connected to,
+                        # leaving out its pattern subscriptions
+                        await bus.publish(
+                            data,
+                            [
+                                room
+                                for room in room_manager.subscriptions(websocket)
+                                if "*" not in room
+                            ],
+                        )
+
+            except json.JSONDecodeError:
+                logger.warning(f"Ignoring invalid JSON WebSocket message: {text[:50]}")
             except WebSocketDisconnect:
                 # Handle disconnect within the loop
                 logger.info("WebSocket client disconnected during receive")
@@ -416,82 +642,238 @@ async def websocket_endpoint(websocket: WebSocket, rooms: str = Query(None)):
                 if "disconnect" in str(e).lower():
                     break
                 continue
-                
+
     except WebSocketDisconnect:
         logger.info("WebSocket client disconnected normally")
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
+        if publisher is not None:
+            await publisher.stop()
         room_manager.disconnect(websocket)
 
 
+@router.get("/stream")
+async def stream_endpoint(
+    request: Request,
+    rooms: str = Query(...),
+    policy: Optional[str] = Query(None),
+    max_rate: Optional[float] = Query(None, gt=0),
+    since: Optional[str] = Query(None),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-Sent Events stream of room messages for read-only clients
+
+    Takes the `rooms` (patterns included), `policy`, `max_rate` and `since`
+    of /ws, without the WebSocket handshake or ping/pong; see
+    swarm_squad_ep2.api.sse for the event format. Subscriptions are fixed
+    for the life of the stream.
+
+    Clients resume after a reconnect by sending the `id` of the last event
+    they received back as the `Last-Event-ID` header, which browsers'
+    EventSource does by itself; it takes precedence over `since`. An ID
+    this worker no longer knows, e.g. after a restart, cannot be resumed
+    from: the stream starts with a "gap" event with a null `since` for
+    each room, and the client should fetch what it missed from
+    /messages/history.
+    """
+    room_list = rooms.split(",")
+    lost = False
+    try:
+        if last_event_id:
+            since_seqs = event_streams.resume(last_event_id)
+            lost = since_seqs is None
+        else:
+            since_seqs = _parse_since(since, room_list) if since else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid resume point: {e}")
+
+    try:
+        seqs = room_manager.last_seqs(room_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stream = EventStream(request.client, {**seqs, **(since_seqs or {})})
+    try:
+        await room_manager.connect(
+            stream,
+            room_list,
+            policy,
+            max_rate,
+            batch_ms=0,
+            since=since_seqs,
+            heartbeat=False,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if lost:
+        for room, last in seqs.items():
+            await room_manager.send_personal_message(
+                {
+                    "type": "gap",
+                    "room_id": room,
+                    "since": None,
+                    "first": last + 1,
+                    "last": last,
+                },
+                stream,
+            )
+    event_streams.add(stream)
+
+    def on_close(stream: EventStream) -> None:
+        room_manager.disconnect(stream)
+        event_streams.close(stream)
+
+    return EventStreamResponse(
+        stream,
+        on_close,
+        gzip=accepts_gzip(request.headers.get("accept-encoding")),
+    )
+
+
+async def _store_message(
+    entity_id: str,
+    content: str,
+    message_type: str,
+    timestamp: Optional[str] = None,
+    state: Optional[Dict] = None,
+    room_id: Optional[str] = None,
+    room_ids: Optional[List[str]] = None,
+) -> Tuple[Dict, List[str]]:
+    """
+    Store a message once with its target rooms.
+
+    Target rooms are `room_id` followed by `room_ids`.
+
+    Returns:
+        The message to broadcast and its rooms
+
+    Raises:
+        ValueError: If there is no target room or the entity ID is invalid
+        RuntimeError: If the message could not be stored
+    """
+    rooms = list(dict.fromkeys(([room_id] if room_id else []) + (room_ids or [])))
+    if not rooms:
+        raise ValueError("Either room_id or room_ids is required")
+    for room in rooms:
+        check_room(room)
+    room_id = rooms[0]
+
+    message_data = {
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "entity_id": entity_id,
+        "room_id": room_id,
+        "message": content,
+        "message_type": message_type,
+        "state": state or {},
+    }
+    if len(rooms) > 1:
+        message_data["rooms"] = rooms
+
+    # Determine which collection to update based on the entity_id prefix
+    # v* for vehicles, l* for LLMs
+    if entity_id.startswith("v"):
+        collection = get_collection("vehicles")
+    elif entity_id.startswith("l"):
+        collection = get_collection("llms")
+    else:
+        raise ValueError("Invalid entity_id")
+
+    if collection is None:
+        logger.error(f"Collection not available for entity {entity_id}")
+        raise RuntimeError("Database collection not available")
+
+    stored_message = {
+        "timestamp": message_data["timestamp"],
+        "room_id": room_id,
+        "message": content,
+        "message_type": message_type,
+        "state": state or {},
+    }
+    if len(rooms) > 1:
+        stored_message["rooms"] = rooms
+    update = {"$push": {"messages": stored_message}}
+    # Also update the entity's status if it's in the state; it is applied
+    # in the same write (and commit) as the message
+    if state and "status" in state:
+        update["$set"] = {"status": state["status"]}
+
+    # Store the message in the database
+    logger.debug(f"Storing message for entity {entity_id} in rooms {rooms}")
+    result = await collection.update_one({"_id": entity_id}, update, upsert=True)
+    logger.debug(
+        f"Database update result: matched={result.matched_count}, modified={result.modified_count}, upserted={result.upserted_id}"
+    )
+    # The storage layer reports failed writes in the result rather than
+    # raising; a message that was not stored must not be broadcast or acked
+    if not result.matched_count and result.upserted_id is None:
+        raise RuntimeError(f"Message of {entity_id} was not stored")
+    return message_data, rooms
+
+
+async def _store_published(frame: Dict) -> Tuple[Dict, List[str]]:
+    """
+    Validate and store a publish frame sent over /ws, see api.publish.
+
+    Raises:
+        ValueError: If a field is missing or has the wrong type
+    """
+    for field in ("entity_id", "content", "message_type"):
+        if not isinstance(frame.get(field), str):
+            raise ValueError(f"{field} must be a string")
+    for field in ("timestamp", "room_id"):
+        if not isinstance(frame.get(field), (str, type(None))):
+            raise ValueError(f"{field} must be a string")
+    state = frame.get("state")
+    if state is not None and not isinstance(state, dict):
+        raise ValueError("state must be an object")
+    room_ids = frame.get("room_ids")
+    if room_ids is not None and not (
+        isinstance(room_ids, list) and all(isinstance(r, str) and r for r in room_ids)
+    ):
+        raise ValueError("room_ids must be a list of room IDs")
+    return await _store_message(
+        frame["entity_id"],
+        frame["content"],
+        frame["message_type"],
+        frame.get("timestamp"),
+        state,
+        frame.get("room_id"),
+        room_ids,
+    )
+
+
 @router.post("/messages/")
 async def send_message(
-    room_id: str = Body(...),
     entity_id: str = Body(...),
     content: str = Body(...),
     message_type: str = Body(...),
     timestamp: Optional[str] = Body(None),
     state: Optional[Dict] = Body(None),
+    room_id: Optional[str] = Body(None),
+    room_ids: Optional[List[str]] = Body(None),
 ):
     """
-    Send a message to a room and store it in the database
+    Send a message to one or more rooms and store it in the database
 
-    This endpoint:
-    1. Adds the message to the appropriate collection
-    2. Broadcasts the message to all clients in the specified room
+    Target rooms are `room_id` followed by `room_ids`. This endpoint:
+    1. Adds the message once to the appropriate collection, with its rooms
+    2. Broadcasts the message to all clients in every target room
+
+    Publishers sending many messages can stream them over /ws instead, see
+    swarm_squad_ep2.api.publish.
     """
     try:
-        message_data = {
-            "timestamp": timestamp or datetime.now().isoformat(),
-            "entity_id": entity_id,
-            "room_id": room_id,
-            "message": content,
-            "message_type": message_type,
-            "state": state or {},
-        }
-
-        # Determine which collection to update based on the entity_id prefix
-        # v* for vehicles, l* for LLMs
-        if entity_id.startswith("v"):
-            collection = get_collection("vehicles")
-        elif entity_id.startswith("l"):
-            collection = get_collection("llms")
-        else:
-            raise HTTPException(status_code=400, detail="Invalid entity_id")
-
-        if collection is None:
-            logger.error(f"Collection not available for entity {entity_id}")
-            raise HTTPException(status_code=500, detail="Database collection not available")
-
-        # Store the message in the database
-        logger.debug(f"Storing message for entity {entity_id} in room {room_id}")
-        result = await collection.update_one(
-            {"_id": entity_id},
-            {
-                "$push": {
-                    "messages": {
-                        "timestamp": message_data["timestamp"],
-                        "message": content,
-                        "message_type": message_type,
-                        "state": state or {},
-                    }
-                }
-            },
-            upsert=True,
+        message_data, rooms = await _store_message(
+            entity_id, content, message_type, timestamp, state, room_id, room_ids
         )
-        logger.debug(f"Database update result: matched={result.matched_count}, modified={result.modified_count}, upserted={result.upserted_id}")
-
-        # Also update the entity's status if it's in the state
-        if state and "status" in state:
-            await collection.update_one(
-                {"_id": entity_id}, {"$set": {"status": state["status"]}}, upsert=True
-            )
 
         # Broadcast to WebSocket clients
-        await room_manager.broadcast_to_room(message_data, room_id)
+        await bus.publish(message_data, rooms)
 
-        return {"status": "success", "message": "Message sent"}
+        return {"status": "success", "message": "Message sent", "rooms": rooms}
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error sending message: {str(e)}")
@@ -0,0 +1,27 @@
+from fastapi import APIRouter
+
+from swarm_squad_ep2.api.database import get_db_stats
+from swarm_squad_ep2.api.routers.realtime import bus, room_manager
+
+router = APIRouter(
+    prefix="/stats",
+    tags=["stats"],
+)
+
+
+@router.get("/db")
+async def get_storage_stats():
+    """Get counters of the active storage backend"""
+    return get_db_stats()
+
+
+@router.get("/ws")
+async def get_websocket_stats():
+    """Get queue depth and drop counters of WebSocket connections"""
+    return room_manager.stats()
+
+
+@router.get("/bus")
+async def get_bus_stats():
+    """Get relay counters of the broadcast bus between workers"""
+    return bus.stats()
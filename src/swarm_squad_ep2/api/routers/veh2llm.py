@@ -28,13 +28,13 @@ async def assign_llm_to_vehicle(vehicle_id: str, llm_id: str):
     llms_collection = get_collection("llms")
     veh2llm_collection = get_collection("veh2llm")
     
-    # Check if vehicle exists
-    vehicle = await vehicles_collection.find_one({"_id": vehicle_id})
+    # Check if vehicle exists; only its ID is needed, not its history
+    vehicle = await vehicles_collection.find_one({"_id": vehicle_id}, {"_id": 1})
     if not vehicle:
         raise HTTPException(status_code=404, detail="Vehicle not found")
 
     # Check if LLM exists
-    llm = await llms_collection.find_one({"_id": llm_id})
+    llm = await llms_collection.find_one({"_id": llm_id}, {"_id": 1})
     if not llm:
         raise HTTPException(status_code=404, detail="LLM agent not found")
 
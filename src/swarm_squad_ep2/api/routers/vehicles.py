@@ -4,7 +4,12 @@ from typing import Any, Dict
 
 from fastapi import APIRouter, HTTPException
 
-from swarm_squad_ep2.api.database import get_collection, is_db_connected
+from swarm_squad_ep2.api.database import (
+    find_vehicle,
+    get_all_vehicles,
+    get_collection,
+    is_db_connected,
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -38,23 +43,9 @@ async def get_vehicles():
             status_code=503, detail="Database connection is not available"
         )
 
-    vehicles_collection = get_collection("vehicles")
-    if vehicles_collection is None:
-        raise HTTPException(
-            status_code=503, detail="Vehicles collection is not available"
-        )
-
     try:
-        # Get all vehicles
-        vehicles = await vehicles_collection.find().to_list(None)
-
-        # Process each vehicle to only include the latest message
-        for vehicle in vehicles:
-            if "messages" in vehicle and vehicle["messages"]:
-                # Keep only the latest message
-                vehicle["messages"] = [vehicle["messages"][-1]]
-
-        return vehicles
+        # Get all vehicles with only their latest message
+        return await get_all_vehicles(messages_limit=1)
     except HTTPException:
         raise
     except Exception as e:
@@ -70,26 +61,17 @@ async def get_vehicle(vehicle_id: str):
             status_code=503, detail="Database connection is not available"
         )
 
-    vehicles_collection = get_collection("vehicles")
-    if vehicles_collection is None:
-        raise HTTPException(
-            status_code=503, detail="Vehicles collection is not available"
-        )
-
     # Normalize the vehicle ID
     normalized_id = normalize_vehicle_id(vehicle_id)
 
     try:
-        vehicle = await vehicles_collection.find_one({"_id": normalized_id})
+        # Fetch the vehicle with only its latest message
+        vehicle = await find_vehicle(normalized_id, messages_limit=1)
         if vehicle is None:
             raise HTTPException(
                 status_code=404, detail=f"Vehicle {vehicle_id} not found"
             )
 
-        # Keep only the latest message
-        if "messages" in vehicle and vehicle["messages"]:
-            vehicle["messages"] = [vehicle["messages"][-1]]
-
         return vehicle
     except HTTPException:
         raise
@@ -117,17 +99,12 @@ async def update_vehicle_state(vehicle_id: str, state: Dict[str, Any]):
 
     try:
         # First check if the vehicle exists
-        vehicle = await vehicles_collection.find_one({"_id": normalized_id})
+        vehicle = await find_vehicle(normalized_id, messages_limit=0)
         if vehicle is None:
             raise HTTPException(
                 status_code=404, detail=f"Vehicle {vehicle_id} not found"
             )
 
-        # Update the vehicle state
-        await vehicles_collection.update_one(
-            {"_id": normalized_id}, {"$set": {"state": state}}
-        )
-
         # Create a message for the update
         message = {
             "message": "State updated",
@@ -135,9 +112,10 @@ async def update_vehicle_state(vehicle_id: str, state: Dict[str, Any]):
             "state": state,
         }
 
-        # Add message to vehicle's messages
+        # Update the vehicle state and add the message in one write
         await vehicles_collection.update_one(
-            {"_id": normalized_id}, {"$push": {"messages": message}}
+            {"_id": normalized_id},
+            {"$set": {"state": state}, "$push": {"messages": message}},
         )
 
         # Return only the updated state and minimal metadata
@@ -162,30 +140,24 @@ async def get_vehicle_state(vehicle_id: str):
             status_code=503, detail="Database connection is not available"
         )
 
-    vehicles_collection = get_collection("vehicles")
-    if vehicles_collection is None:
-        raise HTTPException(
-            status_code=503, detail="Vehicles collection is not available"
-        )
-
     # Normalize the vehicle ID
     normalized_id = normalize_vehicle_id(vehicle_id)
 
     try:
-        vehicle = await vehicles_collection.find_one({"_id": normalized_id})
+        # The latest state is kept up to date on ingest; no history is read
+        vehicle = await find_vehicle(normalized_id, messages_limit=0)
         if vehicle is None:
             raise HTTPException(
                 status_code=404, detail=f"Vehicle {vehicle_id} not found"
             )
 
         # Get the latest state either from state field or from the last message
-        state = vehicle.get("state", {})
-
-        # If state is empty and we have messages, try to get state from the last message
-        if not state and "messages" in vehicle and vehicle["messages"]:
-            last_message = vehicle["messages"][-1]
-            if "state" in last_message:
-                state = last_message["state"]
+        state = vehicle.get("state") or {}
+        if not state:
+            vehicle = await find_vehicle(normalized_id, messages_limit=1)
+            messages = (vehicle or {}).get("messages") or []
+            if messages:
+                state = messages[-1].get("state") or {}
 
         return state
     except HTTPException:
@@ -0,0 +1,270 @@
+"""
+Server-Sent Events delivery of room broadcasts for read-only clients.
+
+An `EventStream` stands in for a WebSocket in the RoomConnectionManager, so
+SSE subscribers share the broadcast path of WebSocket ones: frames encoded
+once per broadcast, bounded queues with the slow-consumer policy, rate
+limits and replay. Its writer task hands every frame to the HTTP response
+as an event:
+
+    id: 3f9a0c2e71d45b86:57
+    data: {"room_id":"v1","seq":12,...}
+
+Broadcasts are unnamed events; control frames such as "gap" are events
+named after their `type`. The `id` of an event is the stream's key and its
+count of broadcast events, a few bytes however many rooms the stream
+receives. Browsers send it back as `Last-Event-ID` when they reconnect;
+the server keeps the last seq per room each recent event ID stood for
+(see StreamRegistry), so the stream resumes in every room at once. A
+comment line is sent when the stream has been idle for SSE_KEEPALIVE
+seconds, which keeps proxies from closing it and reveals closed clients.
+
+Streams are gzip-compressed when the client accepts it; each event is
+flushed, so compression never delays delivery.
+"""
+
+import asyncio
+import json
+import os
+import re
+import secrets
+import zlib
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# Seconds without events after which a keep-alive comment is sent
+SSE_KEEPALIVE = float(os.environ.get("SWARM_SQUAD_SSE_KEEPALIVE", "15"))
+
+# gzip level of event streams (0 disables compression)
+SSE_GZIP_LEVEL = int(os.environ.get("SWARM_SQUAD_SSE_GZIP_LEVEL", "6"))
+
+# Milliseconds browsers wait before reconnecting a dropped stream
+SSE_RETRY_MS = 3000
+
+# Closed streams whose event IDs can still be resumed from
+SSE_RESUME_STREAMS = int(os.environ.get("SWARM_SQUAD_SSE_RESUME_STREAMS", "256"))
+
+# Most recent events of a stream whose IDs can be resumed from; must exceed
+# the events a client may not have received yet, i.e. its send queue
+SSE_RESUME_EVENTS = 512
+
+# The fields encode_for_rooms() puts in front of every broadcast frame
+_BROADCAST_PREFIX = re.compile(r'\{"room_id":("(?:[^"\\]|\\.)*"),"seq":(\d+),')
+
+_KEEPALIVE = b": keep-alive\n\n"
+
+_CLOSED = object()
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether an Accept-Encoding header allows gzip."""
+    if not accept_encoding or SSE_GZIP_LEVEL <= 0:
+        return False
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00")
+    return False
+
+
+class EventStream:
+    """
+    WebSocket stand-in that turns a room subscriber's frames into SSE events.
+
+    Args:
+        client: Address of the HTTP client, for logging
+        seqs: Last seq per room the stream starts after, including the
+            rooms its patterns match
+    """
+
+    def __init__(self, client: Any = None, seqs: Optional[Dict[str, int]] = None):
+        self.client = client
+        self.key = secrets.token_hex(8)
+        self.count = 0
+        self.seqs: Dict[str, int] = dict(seqs or {})
+        # (count, room, seq before the event) of recent events, to rewind
+        # `seqs` to the event a client resumes from
+        self._changes: Deque[Tuple[int, str, Optional[int]]] = deque(
+            maxlen=SSE_RESUME_EVENTS
+        )
+        # One event in flight: a stalled client backs up into the
+        # connection's queue, where the slow-consumer policy applies
+        self._events: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=1)
+        self.closed = False
+        self.close_code: Optional[int] = None
+
+    async def accept(self, subprotocol: Optional[str] = None) -> None:
+        pass
+
+    async def send_text(self, data: str) -> None:
+        match = _BROADCAST_PREFIX.match(data)
+        if match is None:
+            await self._put(f"data: {data}\n\n")
+            return
+        room = json.loads(match.group(1))
+        self.count += 1
+        self._changes.append((self.count, room, self.seqs.get(room)))
+        self.seqs[room] = int(match.group(2))
+        await self._put(f"id: {self.event_id()}\ndata: {data}\n\n")
+
+    async def send_json(self, data: Any) -> None:
+        event = data.get("type") if isinstance(data, dict) else None
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        if event:
+            await self._put(f"event: {event}\ndata: {text}\n\n")
+        else:
+            await self._put(f"data: {text}\n\n")
+
+    async def send_bytes(self, data: bytes) -> None:
+        raise TypeError("Event streams only carry text frames")
+
+    async def close(self, code: int = 1000) -> None:
+        """End the stream, e.g. when the slow-consumer policy disconnects it."""
+        if self.closed:
+            return
+        self.closed = True
+        self.close_code = code
+        # Never wait on a stalled client here; the response stops at the
+        # next event it takes either way
+        while not self._events.empty():
+            self._events.get_nowait()
+        self._events.put_nowait(_CLOSED)
+
+    def event_id(self) -> str:
+        """The ID of the last broadcast event, `key:count`."""
+        return f"{self.key}:{self.count}"
+
+    def seqs_at(self, count: int) -> Optional[Dict[str, int]]:
+        """
+        Get the last seq per room as of the `count`th broadcast event.
+
+        Returns:
+            The seqs, or None if the event is too old or was never sent
+        """
+        if not 0 <= count <= self.count or self.count - count > len(self._changes):
+            return None
+        seqs = dict(self.seqs)
+        for changed, room, previous in reversed(self._changes):
+            if changed <= count:
+                break
+            # A room first delivered after the event was new to the client
+            seqs[room] = 0 if previous is None else previous
+        return seqs
+
+    async def _put(self, event: str) -> None:
+        if not self.closed:
+            await self._events.put(event)
+
+    async def events(self, gzip: bool = False) -> AsyncIterator[bytes]:
+        """
+        Iterate the encoded response body until the stream is closed.
+
+        Args:
+            gzip: Compress the body, flushing after every event
+        """
+        compressor = (
+            zlib.compressobj(SSE_GZIP_LEVEL, zlib.DEFLATED, 31) if gzip else None
+        )
+
+        def encode(chunk: bytes) -> bytes:
+            if compressor is None:
+                return chunk
+            return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        yield encode(f"retry: {SSE_RETRY_MS}\n\n".encode())
+        while True:
+            try:
+                event = await asyncio.wait_for(self._events.get(), SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield encode(_KEEPALIVE)
+                continue
+            if event is _CLOSED:
+                break
+            yield encode(event.encode("utf-8"))
+        if compressor is not None:
+            yield compressor.flush()
+
+
+class StreamRegistry:
+    """
+    Event streams by key, so a reconnecting client can resume from the ID of
+    the last event it received.
+
+    Live streams are all kept, since a client may reconnect before its old
+    stream is noticed to be closed; of the closed ones, the last
+    `size` are.
+
+    Args:
+        size: Closed streams kept
+    """
+
+    def __init__(self, size: int = SSE_RESUME_STREAMS):
+        self.size = size
+        self._live: Dict[str, EventStream] = {}
+        self._closed: "OrderedDict[str, EventStream]" = OrderedDict()
+
+    def add(self, stream: EventStream) -> None:
+        self._live[stream.key] = stream
+
+    def close(self, stream: EventStream) -> None:
+        if self._live.pop(stream.key, None) is None:
+            return
+        self._closed[stream.key] = stream
+        while len(self._closed) > self.size:
+            self._closed.popitem(last=False)
+
+    def resume(self, event_id: str) -> Optional[Dict[str, int]]:
+        """
+        Get the last seq per room as of an event ID.
+
+        Returns:
+            The seqs, or None if the event is unknown or too old, e.g. it
+            was sent by another worker or before a restart
+        """
+        key, _, count = event_id.partition(":")
+        stream = self._live.get(key) or self._closed.get(key)
+        if stream is None or not count.isdigit():
+            return None
+        return stream.seqs_at(int(count))
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    Streams an EventStream's events and calls `on_close` when it ends.
+
+    The response ends when the stream is closed, or when sending fails
+    because the client went away, which a keep-alive reveals at the latest.
+
+    Args:
+        stream: Stream to send
+        on_close: Called with the stream once the response is over, e.g. to
+            remove it from the room manager
+        gzip: Compress the response body
+    """
+
+    def __init__(
+        self,
+        stream: EventStream,
+        on_close: Callable[[EventStream], Any],
+        gzip: bool = False,
+    ):
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        if gzip:
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+        super().__init__(
+            stream.events(gzip), media_type="text/event-stream", headers=headers
+        )
+        self.stream = stream
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.stream.closed = True
+            self.on_close(self.stream)
+            await self.body_iterator.aclose()
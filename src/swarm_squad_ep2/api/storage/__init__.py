@@ -0,0 +1,43 @@
+"""
+Storage engines for Swarm Squad Ep2.
+
+Contains the storage interface, the durable SQLite engine and the in-memory
+engine for simulations and benchmarks that don't need durability.
+"""
+
+from typing import Dict, Type
+
+from swarm_squad_ep2.api.storage.base import StorageBackend
+from swarm_squad_ep2.api.storage.memory import MemoryStorage
+from swarm_squad_ep2.api.storage.sqlite import SQLiteStorage
+
+# Engines selectable by name, e.g. through SWARM_SQUAD_STORAGE
+STORAGE_BACKENDS: Dict[str, Type[StorageBackend]] = {
+    "sqlite": SQLiteStorage,
+    "memory": MemoryStorage,
+}
+
+
+def create_storage(name: str) -> StorageBackend:
+    """
+    Create a storage engine by name.
+
+    Raises:
+        ValueError: If no engine has that name
+    """
+    try:
+        return STORAGE_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown storage backend {name!r}; "
+            f"expected one of {', '.join(STORAGE_BACKENDS)}"
+        ) from None
+
+
+__all__ = [
+    "STORAGE_BACKENDS",
+    "MemoryStorage",
+    "SQLiteStorage",
+    "StorageBackend",
+    "create_storage",
+]
@@ -0,0 +1,319 @@
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class IngestClock:
+    """
+    Strictly increasing epoch-nanosecond timestamps for ingested messages.
+
+    Follows the wall clock but never repeats or goes backwards, so ingest
+    time orders messages exactly like arrival order.
+    """
+
+    def __init__(self):
+        self.last = 0
+        self._lock = threading.Lock()
+
+    def tick(self) -> int:
+        """Return the ingest time for the next message."""
+        with self._lock:
+            now = time.time_ns()
+            self.last = now if now > self.last else self.last + 1
+            return self.last
+
+    def advance_to(self, value: int) -> None:
+        """Never hand out times at or below `value`, e.g. after a restart."""
+        with self._lock:
+            self.last = max(self.last, value)
+
+
+class StorageBackend(ABC):
+    """
+    Interface of a storage engine for vehicles, LLMs, their mappings and
+    message history.
+
+    Entity types are "vehicle" and "llm". Messages are plain dicts as posted
+    by clients plus the server-assigned `ingest_ns`, returned oldest first.
+    A message published to several rooms is stored once; its `rooms` key
+    lists them all and room queries match any of them.
+    Write methods return False instead of raising when the write fails.
+    """
+
+    name = "base"
+
+    # Called when the engine changed stored data outside a write call, e.g.
+    # by background retention, so cached reads can be dropped
+    on_change: Optional[Callable[[], None]] = None
+
+    # Lifecycle
+    @abstractmethod
+    async def connect(self) -> bool:
+        """Open the engine; returns True on success."""
+
+    @abstractmethod
+    async def close(self) -> None:
+        """Flush pending writes and release resources."""
+
+    @abstractmethod
+    def is_connected(self) -> bool:
+        """Whether the engine is open."""
+
+    def has_uncommitted_writes(self) -> bool:
+        """Whether writes that already returned may not be visible to reads yet."""
+        return False
+
+    # Message history
+    @abstractmethod
+    async def get_entity_messages(
+        self,
+        entity_id: str,
+        limit: Optional[int] = None,
+        include_archived: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Get the last `limit` messages of an entity (all if None)."""
+
+    @abstractmethod
+    async def get_recent_messages(
+        self, entity_type: str, per_entity: int = 5
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Get the last `per_entity` messages of every entity of a type."""
+
+    @abstractmethod
+    async def get_entities_messages(
+        self, entity_ids: List[str], limit: int
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Get the last `limit` messages of several entities."""
+
+    @abstractmethod
+    async def get_message_history(
+        self,
+        room_id: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        start_ns: Optional[int] = None,
+        end_ns: Optional[int] = None,
+        limit: int = 1000,
+        after_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the first `limit` messages of a room or entity ingested in
+        [start_ns, end_ns), oldest first, including archived ones. Each
+        message also carries its `entity_id` and its `message_id`, which
+        orders messages ingested at the same time.
+
+        With `after_id`, only messages after the position (start_ns,
+        after_id) are returned, so a page ending at a message continues
+        after it even if others share its ingest_ns, e.g. ingested by
+        other workers.
+        """
+
+    @abstractmethod
+    async def search_messages(
+        self,
+        query: str,
+        room_id: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        message_type: Optional[str] = None,
+        start_ns: Optional[int] = None,
+        end_ns: Optional[int] = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the newest `limit` hot messages whose text contains every term of
+        `query`, newest first. Each message also carries its `entity_id`.
+
+        Raises:
+            ValueError: If the query has no searchable terms
+        """
+
+    @abstractmethod
+    async def get_archived_messages(
+        self,
+        entity_id: str,
+        limit: Optional[int] = None,
+        message_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Get messages moved out of hot storage by retention."""
+
+    @abstractmethod
+    async def compact_message_history(self) -> int:
+        """Apply retention now; returns the number of archived messages."""
+
+    # Vehicles
+    @abstractmethod
+    async def get_all_vehicles(
+        self, messages_limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all vehicles with their last `messages_limit` messages."""
+
+    @abstractmethod
+    async def find_vehicle(
+        self, vehicle_id: str, messages_limit: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get one vehicle, or None if it doesn't exist."""
+
+    @abstractmethod
+    async def upsert_vehicle_message(
+        self,
+        vehicle_id: str,
+        message: Dict[str, Any],
+        status: Optional[str] = None,
+        state: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """Append a message, creating the vehicle and updating its state."""
+
+    @abstractmethod
+    async def get_latest_states(
+        self, entity_ids: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Get the latest state of several entities."""
+
+    @abstractmethod
+    async def update_vehicle_state(
+        self, vehicle_id: str, state: Dict[str, Any]
+    ) -> bool:
+        """Replace the latest state of a vehicle."""
+
+    @abstractmethod
+    async def update_vehicle_status(self, vehicle_id: str, status: str) -> bool:
+        """Update the status of a vehicle."""
+
+    # LLMs
+    @abstractmethod
+    async def get_all_llms(
+        self, messages_limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Get all LLMs with their last `messages_limit` messages."""
+
+    @abstractmethod
+    async def find_llm(
+        self, llm_id: str, messages_limit: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get one LLM, or None if it doesn't exist."""
+
+    @abstractmethod
+    async def upsert_llm_message(
+        self, llm_id: str, message: Dict[str, Any], status: Optional[str] = None
+    ) -> bool:
+        """Append a message, creating the LLM if it doesn't exist."""
+
+    @abstractmethod
+    async def update_llm_status(self, llm_id: str, status: str) -> bool:
+        """Update the status of an LLM."""
+
+    @abstractmethod
+    async def assign_llm_to_vehicle(self, vehicle_id: str, llm_id: str) -> bool:
+        """Map a vehicle to its LLM agent."""
+
+    # Whole-store operations
+    @abstractmethod
+    async def clear_all_data(self) -> bool:
+        """Delete all entities, mappings and messages."""
+
+    @abstractmethod
+    async def count_entities(self, entity_type: str) -> int:
+        """Count vehicles or LLMs."""
+
+    @abstractmethod
+    async def find_documents(
+        self,
+        collection: str,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        projection: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Query "vehicles", "llms" or "veh2llm" with a MongoDB-style filter."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Get engine counters for monitoring."""
+
+
+# Document helpers shared by the engines
+_SEARCH_TERM = re.compile(r"(\w+)(\*?)")
+
+
+def search_terms(query: str) -> List[Tuple[str, bool]]:
+    """
+    Split a search query into lowercase (term, is_prefix) pairs.
+
+    Terms are runs of letters and digits; a trailing `*` makes a term match
+    as a prefix (e.g. "batt*"). Everything else separates terms.
+
+    Raises:
+        ValueError: If the query has no terms
+    """
+    terms = [(term, bool(star)) for term, star in _SEARCH_TERM.findall(query.lower())]
+    if not terms:
+        raise ValueError("Search query has no searchable terms")
+    return terms
+
+
+def matches_filter(doc: Dict[str, Any], filter_dict: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluate a MongoDB-style filter (equality, $in, $nin, $ne) on a document.
+
+    Raises:
+        ValueError: If the filter uses an unsupported operator
+    """
+    for field, condition in (filter_dict or {}).items():
+        value = doc.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for operator, operand in condition.items():
+            if operator == "$in":
+                matched = value in operand
+            elif operator == "$nin":
+                matched = value not in operand
+            elif operator == "$ne":
+                matched = value != operand
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            if not matched:
+                return False
+    return True
+
+
+def apply_projection(doc: Dict[str, Any], projection: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply a MongoDB-style inclusion or exclusion projection to a document."""
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+
+    # {"_id": 1} alone keeps only the ID
+    if all(fields.values()) if fields else include_id:
+        projected: Dict[str, Any] = {}
+        for path in fields:
+            source, target = doc, projected
+            *parents, leaf = path.split(".")
+            for key in parents:
+                if not isinstance(source.get(key), dict):
+                    break
+                source = source[key]
+                target = target.setdefault(key, {})
+            else:
+                if leaf in source:
+                    target[leaf] = source[leaf]
+    else:
+        projected = {key: value for key, value in doc.items() if key not in fields}
+
+    if include_id and "_id" in doc:
+        projected["_id"] = doc["_id"]
+    elif not include_id:
+        projected.pop("_id", None)
+    return projected
+
+
+def wants_messages(projection: Optional[Dict[str, Any]]) -> bool:
+    """Whether a projection keeps the messages field."""
+    if not projection:
+        return True
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if not fields:
+        return not projection.get("_id", 1)
+    if all(fields.values()):
+        return any(key.split(".")[0] == "messages" for key in fields)
+    return "messages" not in fields
@@ -0,0 +1,503 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from swarm_squad_ep2.api.storage.base import (
+    IngestClock,
+    StorageBackend,
+    apply_projection,
+    matches_filter,
+    search_terms,
+    wants_messages,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Messages kept per entity; older ones are dropped as new ones arrive
+MEMORY_MAX_MESSAGES = int(os.environ.get("SWARM_SQUAD_MEMORY_MAX_MESSAGES", "1000"))
+
+# Optional JSON snapshot file, loaded on connect and rewritten periodically
+MEMORY_SNAPSHOT_PATH = os.environ.get("SWARM_SQUAD_MEMORY_SNAPSHOT")
+MEMORY_SNAPSHOT_INTERVAL = float(
+    os.environ.get("SWARM_SQUAD_MEMORY_SNAPSHOT_INTERVAL", "30")
+)
+
+
+def _normalize_message(message: Dict[str, Any], ingest_ns: int) -> Dict[str, Any]:
+    """Give a message the same shape the SQLite engine returns."""
+    normalized = dict(message)
+    normalized["ingest_ns"] = ingest_ns
+    normalized.setdefault("timestamp", None)
+    normalized.setdefault("message", None)
+    normalized.setdefault("message_type", None)
+    normalized["state"] = message.get("state") or {}
+    if normalized.get("room_id") is None:
+        normalized.pop("room_id", None)
+    return normalized
+
+
+def _in_room(message: Dict[str, Any], room_id: str) -> bool:
+    """Whether a message was published to a room, as its room or an extra one."""
+    return message.get("room_id") == room_id or room_id in message.get("rooms", ())
+
+
+def _matches_terms(text: Optional[str], terms: List[Tuple[str, bool]]) -> bool:
+    """Whether every (term, is_prefix) pair matches a word of `text`."""
+    if not text:
+        return False
+    words = re.findall(r"\w+", text.lower())
+    return all(
+        any(word.startswith(term) if prefix else word == term for word in words)
+        for term, prefix in terms
+    )
+
+
+class MemoryStorage(StorageBackend):
+    """
+    Storage engine keeping everything in process memory.
+
+    Entities are dicts and each entity's history is a deque bounded by
+    `max_messages`, so memory stays flat however long a simulation runs.
+    Nothing survives a restart unless a snapshot path is configured, in which
+    case the whole store is written to disk every `snapshot_interval` seconds
+    (when it changed) and on close, and loaded again on connect.
+
+    Args:
+        max_messages: Messages kept per entity
+        snapshot_path: JSON snapshot file, or None to disable snapshots
+        snapshot_interval: Seconds between snapshots
+    """
+
+    name = "memory"
+
+    def __init__(
+        self,
+        max_messages: int = MEMORY_MAX_MESSAGES,
+        snapshot_path: Optional[str] = MEMORY_SNAPSHOT_PATH,
+        snapshot_interval: float = MEMORY_SNAPSHOT_INTERVAL,
+    ):
+        self.max_messages = max(1, max_messages)
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.snapshot_interval = snapshot_interval
+        self._connected = False
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._dirty = False
+        self.snapshots = 0
+        self.last_snapshot_ms = 0.0
+        self._clock = IngestClock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._vehicles: Dict[str, Dict[str, Any]] = {}
+        self._llms: Dict[str, Dict[str, Any]] = {}
+        self._veh2llm: Dict[str, str] = {}
+        self._latest_state: Dict[str, Dict[str, Any]] = {}
+        self._messages: Dict[str, Deque[Dict[str, Any]]] = {}
+
+    def _tables(self, entity_type: str) -> Dict[str, Dict[str, Any]]:
+        return self._vehicles if entity_type == "vehicle" else self._llms
+
+    # Lifecycle
+    async def connect(self) -> bool:
+        try:
+            if self.snapshot_path is not None and self.snapshot_path.exists():
+                self._load_snapshot()
+            if self.snapshot_path is not None and self.snapshot_interval > 0:
+                self._snapshot_task = asyncio.create_task(
+                    self._snapshot_loop(), name="memory-snapshot"
+                )
+            self._connected = True
+            logger.info("In-memory storage initialized successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to initialize in-memory storage: {e}")
+            return False
+
+    async def close(self) -> None:
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+            self._snapshot_task = None
+        if self.snapshot_path is not None and self._dirty:
+            await self.snapshot()
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    # Snapshots
+    async def snapshot(self) -> None:
+        """Write the whole store to the snapshot file."""
+        if self.snapshot_path is None:
+            return
+        started = time.perf_counter()
+        # Messages and states are never mutated in place, so shallow copies
+        # taken here are a consistent view for the writer thread.
+        payload = {
+            "vehicles": {key: dict(value) for key, value in self._vehicles.items()},
+            "llms": {key: dict(value) for key, value in self._llms.items()},
+            "veh2llm": dict(self._veh2llm),
+            "latest_state": dict(self._latest_state),
+            "messages": {key: list(value) for key, value in self._messages.items()},
+        }
+        self._dirty = False
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._write_snapshot, payload
+        )
+        self.snapshots += 1
+        self.last_snapshot_ms = (time.perf_counter() - started) * 1000
+
+    def _write_snapshot(self, payload: Dict[str, Any]) -> None:
+        tmp_path = self.snapshot_path.with_suffix(self.snapshot_path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _load_snapshot(self) -> None:
+        with open(self.snapshot_path) as f:
+            payload = json.load(f)
+        self._vehicles = payload.get("vehicles", {})
+        self._llms = payload.get("llms", {})
+        self._veh2llm = payload.get("veh2llm", {})
+        self._latest_state = payload.get("latest_state", {})
+        self._messages = {
+            key: deque(value, maxlen=self.max_messages)
+            for key, value in payload.get("messages", {}).items()
+        }
+        self._clock.advance_to(
+            max(
+                (
+                    history[-1].get("ingest_ns", 0)
+                    for history in self._messages.values()
+                ),
+                default=0,
+            )
+        )
+        logger.info(f"Loaded in-memory storage snapshot: {self.snapshot_path}")
+
+    async def _snapshot_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if not self._dirty:
+                continue
+            try:
+                await self.snapshot()
+            except Exception as e:
+                self._dirty = True
+                logger.error(f"Error writing in-memory storage snapshot: {e}")
+
+    # Message history
+    def _select_messages(
+        self, entity_id: str, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        messages = self._messages.get(entity_id)
+        if not messages:
+            return []
+        if limit is None:
+            return [dict(message) for message in messages]
+        if limit <= 0:
+            return []
+        newest = itertools.islice(reversed(messages), limit)
+        return [dict(message) for message in reversed(list(newest))]
+
+    def _append_message(
+        self,
+        entity_type: str,
+        entity_id: str,
+        message: Dict[str, Any],
+        status: Optional[str],
+        state: Optional[Dict[str, Any]],
+    ) -> None:
+        table = self._tables(entity_type)
+        if entity_id not in table:
+            table[entity_id] = {"status": "unknown", "last_seen": ""}
+            if entity_type == "llm":
+                table[entity_id]["vehicle_id"] = None
+        history = self._messages.get(entity_id)
+        if history is None:
+            history = self._messages[entity_id] = deque(maxlen=self.max_messages)
+        history.append(_normalize_message(message, self._clock.tick()))
+        if status is not None:
+            table[entity_id]["status"] = status
+        if state is None:
+            state = message.get("state")
+        if state:
+            self._latest_state[entity_id] = state
+        self._dirty = True
+
+    async def get_entity_messages(
+        self,
+        entity_id: str,
+        limit: Optional[int] = None,
+        include_archived: bool = False,
+    ) -> List[Dict[str, Any]]:
+        # Nothing is archived: history beyond max_messages is dropped
+        return self._select_messages(entity_id, limit)
+
+    async def get_recent_messages(
+        self, entity_type: str, per_entity: int = 5
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        return {
+            entity_id: self._select_messages(entity_id, per_entity)
+            for entity_id in self._tables(entity_type)
+        }
+
+    async def get_entities_messages(
+        self, entity_ids: List[str], limit: int
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        messages = {
+            entity_id: self._select_messages(entity_id, limit)
+            for entity_id in entity_ids
+        }
+        return {entity_id: found for entity_id, found in messages.items() if found}
+
+    async def get_message_history(
+        self,
+        room_id: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        start_ns: Optional[int] = None,
+        end_ns: Optional[int] = None,
+        limit: int = 1000,
+        after_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        if limit <= 0:
+            return []
+        if entity_id is not None:
+            histories = [(entity_id, self._messages.get(entity_id, ()))]
+        else:
+            histories = list(self._messages.items())
+        start = start_ns if start_ns is not None else 0
+        # One process hands out every ingest_ns, so it also identifies messages
+        matched = [
+            {**message, "entity_id": key, "message_id": message.get("ingest_ns", 0)}
+            for key, history in histories
+            for message in history
+            if (
+                message.get("ingest_ns", 0) > start
+                if after_id is not None
+                else message.get("ingest_ns", 0) >= start
+            )
+            and (end_ns is None or message.get("ingest_ns", 0) < end_ns)
+            and (room_id is None or _in_room(message, room_id))
+        ]
+        matched.sort(key=lambda message: message["message_id"])
+        return matched[:limit]
+
+    async def search_messages(
+        self,
+        query: str,
+        room_id: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        message_type: Optional[str] = None,
+        start_ns: Optional[int] = None,
+        end_ns: Optional[int] = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        # No index: histories are bounded by max_messages, so a scan is cheap
+        terms = search_terms(query)
+        if limit <= 0:
+            return []
+        if entity_id is not None:
+            histories = [(entity_id, self._messages.get(entity_id, ()))]
+        else:
+            histories = list(self._messages.items())
+        matched = []
+        for key, history in histories:
+            for message in history:
+                ingest_ns = message.get("ingest_ns", 0)
+                if (
+                    (room_id is None or _in_room(message, room_id))
+                    and (
+                        message_type is None or message["message_type"] == message_type
+                    )
+                    and (start_ns is None or ingest_ns >= start_ns)
+                    and (end_ns is None or ingest_ns < end_ns)
+                    and _matches_terms(message.get("message"), terms)
+                ):
+                    matched.append({**message, "entity_id": key})
+        matched.sort(key=lambda message: message.get("ingest_ns", 0), reverse=True)
+        return matched[:limit]
+
+    async def get_archived_messages(
+        self,
+        entity_id: str,
+        limit: Optional[int] = None,
+        message_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        return []
+
+    async def compact_message_history(self) -> int:
+        return 0
+
+    # Vehicle operations
+    def _vehicle_doc(self, vehicle_id: str) -> Dict[str, Any]:
+        vehicle = self._vehicles[vehicle_id]
+        return {
+            "_id": vehicle_id,
+            "status": vehicle["status"],
+            "last_seen": vehicle["last_seen"],
+            "state": self._latest_state.get(vehicle_id, {}),
+        }
+
+    async def get_all_vehicles(
+        self, messages_limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        return [
+            await self.find_vehicle(vehicle_id, messages_limit)
+            for vehicle_id in list(self._vehicles)
+        ]
+
+    async def find_vehicle(
+        self, vehicle_id: str, messages_limit: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        if vehicle_id not in self._vehicles:
+            return None
+        doc = self._vehicle_doc(vehicle_id)
+        doc["messages"] = self._select_messages(vehicle_id, messages_limit)
+        return doc
+
+    async def upsert_vehicle_message(
+        self,
+        vehicle_id: str,
+        message: Dict[str, Any],
+        status: Optional[str] = None,
+        state: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        self._append_message("vehicle", vehicle_id, message, status, state)
+        return True
+
+    async def get_latest_states(
+        self, entity_ids: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        return {
+            entity_id: self._latest_state[entity_id]
+            for entity_id in entity_ids
+            if entity_id in self._latest_state
+        }
+
+    async def update_vehicle_state(
+        self, vehicle_id: str, state: Dict[str, Any]
+    ) -> bool:
+        self._latest_state[vehicle_id] = state
+        self._dirty = True
+        return True
+
+    async def update_vehicle_status(self, vehicle_id: str, status: str) -> bool:
+        if vehicle_id in self._vehicles:
+            self._vehicles[vehicle_id]["status"] = status
+            self._dirty = True
+        return True
+
+    # LLM operations
+    def _llm_doc(self, llm_id: str) -> Dict[str, Any]:
+        llm = self._llms[llm_id]
+        return {
+            "_id": llm_id,
+            "status": llm["status"],
+            "last_seen": llm["last_seen"],
+            "vehicle_id": llm["vehicle_id"],
+        }
+
+    async def get_all_llms(
+        self, messages_limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        return [
+            await self.find_llm(llm_id, messages_limit) for llm_id in list(self._llms)
+        ]
+
+    async def find_llm(
+        self, llm_id: str, messages_limit: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        if llm_id not in self._llms:
+            return None
+        doc = self._llm_doc(llm_id)
+        doc["messages"] = self._select_messages(llm_id, messages_limit)
+        return doc
+
+    async def upsert_llm_message(
+        self, llm_id: str, message: Dict[str, Any], status: Optional[str] = None
+    ) -> bool:
+        self._append_message("llm", llm_id, message, status, None)
+        return True
+
+    async def update_llm_status(self, llm_id: str, status: str) -> bool:
+        if llm_id in self._llms:
+            self._llms[llm_id]["status"] = status
+            self._dirty = True
+        return True
+
+    async def assign_llm_to_vehicle(self, vehicle_id: str, llm_id: str) -> bool:
+        self._veh2llm[vehicle_id] = llm_id
+        if llm_id in self._llms:
+            self._llms[llm_id]["vehicle_id"] = vehicle_id
+        self._dirty = True
+        return True
+
+    # Whole-store operations
+    async def clear_all_data(self) -> bool:
+        self._reset()
+        self._dirty = True
+        logger.info("All in-memory data cleared")
+        return True
+
+    async def count_entities(self, entity_type: str) -> int:
+        return len(self._tables(entity_type))
+
+    async def find_documents(
+        self,
+        collection: str,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        projection: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        if collection == "vehicles":
+            docs = (self._vehicle_doc(key) for key in list(self._vehicles))
+        elif collection == "llms":
+            docs = (self._llm_doc(key) for key in list(self._llms))
+        elif collection == "veh2llm":
+            docs = (
+                {"vehicle_id": vehicle_id, "llm_id": llm_id}
+                for vehicle_id, llm_id in self._veh2llm.items()
+            )
+        else:
+            return []
+
+        with_messages = collection != "veh2llm" and wants_messages(projection)
+        results = []
+        for doc in docs:
+            if limit is not None and len(results) >= limit:
+                break
+            if not matches_filter(doc, filter_dict):
+                continue
+            if with_messages:
+                doc["messages"] = self._select_messages(doc["_id"])
+            elif collection != "veh2llm":
+                doc["messages"] = []
+            results.append(apply_projection(doc, projection) if projection else doc)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "vehicles": len(self._vehicles),
+            "llms": len(self._llms),
+            "messages": sum(len(history) for history in self._messages.values()),
+            "max_messages": self.max_messages,
+            "snapshot": {
+                "path": str(self.snapshot_path) if self.snapshot_path else None,
+                "interval": self.snapshot_interval,
+                "snapshots": self.snapshots,
+                "last_snapshot_ms": self.last_snapshot_ms,
+            },
+        }
@@ -0,0 +1,1878 @@
+import asyncio
+import fnmatch
+import functools
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from swarm_squad_ep2.api.storage.base import (
+    IngestClock,
+    StorageBackend,
+    apply_projection,
+    search_terms,
+    wants_messages,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Database file path
+DB_PATH = Path(__file__).parent.parent / "vehicle_sim.db"
+
+# Global writer connection
+_connection: Optional[sqlite3.Connection] = None
+
+# Schema setup and all writes run on this single thread, so they never block
+# the event loop and the writer connection is only ever used by one thread.
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
+
+# Number of read-only connections serving queries. In WAL mode they read
+# concurrently with each other and with the writer.
+READ_POOL_SIZE = int(os.environ.get("SWARM_SQUAD_DB_READ_POOL_SIZE", "4"))
+
+# Write-behind settings. Writes are queued and committed in groups: a batch is
+# flushed once it holds WRITE_BATCH_SIZE operations or WRITE_BATCH_INTERVAL
+# seconds after its first operation arrived.
+WRITE_BATCH_SIZE = int(os.environ.get("SWARM_SQUAD_DB_BATCH_SIZE", "512"))
+WRITE_BATCH_INTERVAL = float(os.environ.get("SWARM_SQUAD_DB_BATCH_INTERVAL", "0.005"))
+
+# Durability/throughput trade-off for writes:
+#   "full"    - callers wait for their batch commit, fsync on every commit
+#   "normal"  - callers wait for their batch commit, WAL synchronous=NORMAL
+#               (survives application crashes, may lose the last batches on
+#               power loss)
+#   "relaxed" - callers return as soon as the write is queued
+DB_DURABILITY = os.environ.get("SWARM_SQUAD_DB_DURABILITY", "normal")
+_SYNCHRONOUS_PRAGMAS = {"full": "FULL", "normal": "NORMAL", "relaxed": "NORMAL"}
+
+# Entity kinds and the table holding their metadata
+ENTITY_TABLES = {"vehicle": "vehicles", "llm": "llms"}
+
+# Message keys stored in dedicated columns; anything else goes into `extra`
+_MESSAGE_COLUMNS = (
+    "timestamp",
+    "room_id",
+    "message",
+    "message_type",
+    "state",
+    "ingest_ns",
+)
+
+# Server-side ingest time of every stored message, in epoch nanoseconds
+_clock = IngestClock()
+
+
+def get_db_connection() -> sqlite3.Connection:
+    """Get or create the writer database connection."""
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(str(DB_PATH), check_same_thread=False)
+        _connection.row_factory = sqlite3.Row  # Enable dict-like access
+        # Enable WAL mode for better concurrency
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute(
+            f"PRAGMA synchronous={_SYNCHRONOUS_PRAGMAS.get(DB_DURABILITY, 'NORMAL')}"
+        )
+        logger.info(f"Connected to SQLite database: {DB_PATH}")
+    return _connection
+
+
+def _init_schema() -> None:
+    """Create tables and indexes if they don't exist."""
+    conn = get_db_connection()
+
+    # Create tables if they don't exist
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vehicles (
+            id TEXT PRIMARY KEY,
+            status TEXT DEFAULT 'unknown',
+            last_seen TEXT DEFAULT '',
+            state TEXT DEFAULT '{}'
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llms (
+            id TEXT PRIMARY KEY,
+            status TEXT DEFAULT 'unknown',
+            last_seen TEXT DEFAULT '',
+            vehicle_id TEXT DEFAULT NULL
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS veh2llm (
+            vehicle_id TEXT PRIMARY KEY,
+            llm_id TEXT NOT NULL
+        )
+    """)
+
+    # One row per message; appends are plain inserts. `timestamp` has no
+    # declared type so client values (ISO strings or epoch floats) round-trip.
+    # `ingest_ns` is assigned by the server and is what history is ordered by.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity_id TEXT NOT NULL,
+            entity_type TEXT NOT NULL,
+            room_id TEXT,
+            timestamp,
+            message TEXT,
+            message_type TEXT,
+            state TEXT DEFAULT '{}',
+            extra TEXT DEFAULT NULL,
+            ingest_ns INTEGER
+        )
+    """)
+    _migrate_ingest_time(conn)
+    conn.execute("DROP INDEX IF EXISTS idx_messages_room_entity_ts")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_room_ingest
+        ON messages (room_id, ingest_ns)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_entity_ingest
+        ON messages (entity_id, ingest_ns)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_entity_id
+        ON messages (entity_id, id)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_entity_type_id
+        ON messages (entity_id, message_type, id)
+    """)
+
+    # Extra rooms of messages published to several rooms. The message row is
+    # stored once under its first room; the others are listed here so room
+    # queries find it without duplicating the message.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_rooms (
+            message_id INTEGER NOT NULL,
+            room_id TEXT NOT NULL,
+            ingest_ns INTEGER NOT NULL,
+            PRIMARY KEY (message_id, room_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_message_rooms_room_ingest
+        ON message_rooms (room_id, ingest_ns)
+    """)
+
+    # Full-text index over message text. It stores no copy of the text (rows
+    # are read back from `messages`) and is maintained by the same writes
+    # that insert, archive or clear messages.
+    has_fts = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+    ).fetchone()
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+            message, content = 'messages', content_rowid = 'id'
+        )
+    """)
+    if not has_fts:
+        conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+    # Latest state of each entity, written in the same transaction as the
+    # message that carried it so reads never depend on history length
+    has_latest_state = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'latest_state'"
+    ).fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS latest_state (
+            entity_id TEXT PRIMARY KEY,
+            entity_type TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL
+        )
+    """)
+    if not has_latest_state:
+        _seed_latest_state(conn)
+
+    # Compressed segments of messages moved out of the hot table by retention
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_archive (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity_id TEXT NOT NULL,
+            entity_type TEXT NOT NULL,
+            message_type TEXT,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            first_ingest_ns INTEGER,
+            last_ingest_ns INTEGER,
+            count INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+    """)
+    columns = {
+        row["name"] for row in conn.execute("PRAGMA table_info(message_archive)")
+    }
+    for column, legacy, id_column in (
+        ("first_ingest_ns", "first_created_at", "first_id"),
+        ("last_ingest_ns", "last_created_at", "last_id"),
+    ):
+        if column in columns:
+            continue
+        conn.execute(f"ALTER TABLE message_archive ADD COLUMN {column} INTEGER")
+        if legacy in columns:
+            conn.execute(
+                f"UPDATE message_archive SET {column} = "
+                f"CAST({legacy} * 1e9 AS INTEGER) + {id_column}"
+            )
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_message_archive_entity_last_id
+        ON message_archive (entity_id, last_id)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_message_archive_first_ingest
+        ON message_archive (first_ingest_ns)
+    """)
+
+    _migrate_legacy_messages(conn)
+    conn.commit()
+
+    last_ingest = conn.execute(
+        "SELECT MAX(ingest_ns) FROM messages UNION ALL "
+        "SELECT MAX(last_ingest_ns) FROM message_archive"
+    ).fetchall()
+    _clock.advance_to(max(row[0] or 0 for row in last_ingest))
+
+
+def _migrate_ingest_time(conn: sqlite3.Connection) -> None:
+    """
+    Add the `ingest_ns` column to an older messages table.
+
+    Rows written with a `created_at` epoch-seconds column keep that time;
+    older rows get the current time plus their id so they stay in id order.
+    """
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(messages)")}
+    if "ingest_ns" in columns:
+        return
+    conn.execute("ALTER TABLE messages ADD COLUMN ingest_ns INTEGER")
+    if "created_at" in columns:
+        conn.execute(
+            "UPDATE messages SET ingest_ns = CAST(created_at * 1e9 AS INTEGER) + id "
+            "WHERE created_at IS NOT NULL"
+        )
+    conn.execute(
+        "UPDATE messages SET ingest_ns = ? + id WHERE ingest_ns IS NULL",
+        (time.time_ns(),),
+    )
+
+
+def _seed_latest_state(conn: sqlite3.Connection) -> None:
+    """
+    Fill a new latest_state table from existing data: the vehicles.state
+    column first, then the last message carrying a state for each entity.
+    """
+    now = time.time()
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO latest_state (entity_id, entity_type, state, updated_at)
+        SELECT id, 'vehicle', state, ? FROM vehicles
+        WHERE state IS NOT NULL AND state NOT IN ('', '{}')
+        """,
+        (now,),
+    )
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO latest_state (entity_id, entity_type, state, updated_at)
+        SELECT entity_id, entity_type, state, COALESCE(ingest_ns / 1e9, ?)
+        FROM messages WHERE id IN (
+            SELECT MAX(id) FROM messages
+            WHERE state IS NOT NULL AND state NOT IN ('', '{}')
+            GROUP BY entity_id
+        )
+        """,
+        (now,),
+    )
+
+
+def _migrate_legacy_messages(conn: sqlite3.Connection) -> None:
+    """
+    Move messages from the old per-entity JSON `messages` column into the
+    `messages` table.
+
+    Databases created before the messages table existed kept the whole history
+    of an entity in one JSON array. The rows are copied once and the legacy
+    column is emptied so the migration is a no-op on later startups.
+    """
+    for entity_type, table in ENTITY_TABLES.items():
+        columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if "messages" not in columns:
+            continue
+
+        cursor = conn.execute(
+            f"SELECT id, messages FROM {table} WHERE messages IS NOT NULL "
+            "AND messages != '[]'"
+        )
+        migrated = 0
+        for row in cursor.fetchall():
+            try:
+                messages = json.loads(row["messages"])
+            except (TypeError, ValueError):
+                logger.warning(f"Skipping unreadable legacy messages for {row['id']}")
+                continue
+            for message in messages:
+                _insert_message(conn, row["id"], entity_type, message)
+                migrated += 1
+            conn.execute(
+                f"UPDATE {table} SET messages = '[]' WHERE id = ?", (row["id"],)
+            )
+
+        if migrated:
+            logger.info(f"Migrated {migrated} legacy {entity_type} messages")
+
+
+def _close_connection() -> None:
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+        logger.info("Closed SQLite database connection")
+
+
+async def _run_in_writer(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking database call on the writer thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _write_executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+# Read-only connection pool
+class ReadConnectionPool:
+    """
+    Fixed-size pool of read-only SQLite connections.
+
+    Queries run on a thread pool with one thread per connection, so readers
+    never queue behind the writer thread or its commits. Wait time counts from
+    the moment a query is submitted until it holds a connection.
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.size, thread_name_prefix="sqlite-read"
+        )
+        self.in_use = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"{DB_PATH.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only=1")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self.size:
+                conn = self._open()
+                self._connections.append(conn)
+                return conn
+        return self._idle.get()
+
+    def _execute(
+        self, submitted: float, func: Callable[..., Any], args: tuple, kwargs: dict
+    ) -> Any:
+        conn = self._acquire()
+        waited = time.perf_counter() - submitted
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        try:
+            return func(conn, *args, **kwargs)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._idle.put(conn)
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run func(conn, *args, **kwargs) with a pooled read connection."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._execute, time.perf_counter(), func, args, kwargs
+        )
+
+    def close(self) -> None:
+        """Close all idle connections; they are reopened on demand."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._idle = queue.Queue()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": len(self._connections),
+                "in_use": self.in_use,
+                "acquired": self.acquired,
+                "avg_wait_ms": (
+                    self.total_wait / self.acquired * 1000 if self.acquired else 0.0
+                ),
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+_read_pool = ReadConnectionPool(READ_POOL_SIZE)
+
+
+def _read_query(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Turn a blocking query method taking a connection after `self` into a
+    coroutine method that runs it with a pooled read connection.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+        return await _read_pool.run(functools.partial(func, self), *args, **kwargs)
+
+    return wrapper
+
+
+# Group-commit write queue
+WriteOp = Callable[..., None]
+
+
+class WriteBehindQueue:
+    """
+    Single writer that drains queued write operations and commits them in
+    batches.
+
+    Each operation runs inside its own savepoint so a failing operation only
+    rejects its own caller, while the whole batch shares one commit (and one
+    fsync). Callers await a future that resolves once their batch is durable.
+    """
+
+    def __init__(self, batch_size: int, batch_interval: float):
+        self.batch_size = max(1, batch_size)
+        self.batch_interval = batch_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.operations = 0
+        self.max_batch = 0
+        self.errors = 0
+        # Transactions committed; one per batch
+        self.commits = 0
+        # Operations queued but not committed yet
+        self.uncommitted = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """Start the writer task on the running event loop."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name="db-write-behind")
+
+    async def stop(self) -> None:
+        """Commit everything still queued and stop the writer task."""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def submit(self, op: WriteOp, *args: Any) -> asyncio.Future:
+        """Queue a write operation and return a future for its commit."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, args, future))
+        self.uncommitted += 1
+        return future
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "durability": DB_DURABILITY,
+            "pending": self._queue.qsize() if self._queue else 0,
+            "uncommitted": self.uncommitted,
+            "batches": self.batches,
+            "operations": self.operations,
+            "max_batch": self.max_batch,
+            "errors": self.errors,
+            "commits": self.commits,
+        }
+
+    def _drain(self, batch: List[Tuple[WriteOp, tuple, asyncio.Future]]) -> None:
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < self.batch_size and self.batch_interval > 0:
+                # Give concurrent producers a chance to join this batch
+                await asyncio.sleep(self.batch_interval)
+                self._drain(batch)
+            try:
+                outcomes = await _run_in_writer(self._commit, batch)
+                self._resolve(batch, outcomes)
+            finally:
+                self.uncommitted -= len(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _commit(
+        self, batch: List[Tuple[WriteOp, tuple, asyncio.Future]]
+    ) -> List[Optional[BaseException]]:
+        """Apply and commit a batch on the database thread."""
+        conn = get_db_connection()
+        outcomes: List[Optional[BaseException]] = []
+        try:
+            # sqlite3 does not open a transaction for SAVEPOINT, which would
+            # then start and commit a transaction of its own per operation
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            for op, args, _ in batch:
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    op(conn, *args)
+                    conn.execute("RELEASE write_op")
+                    outcomes.append(None)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    outcomes.append(e)
+            conn.commit()
+            self.commits += 1
+        except Exception as e:
+            logger.error(f"Error committing write batch: {e}")
+            conn.rollback()
+            outcomes = [e] * len(batch)
+        return outcomes
+
+    def _resolve(
+        self,
+        batch: List[Tuple[WriteOp, tuple, asyncio.Future]],
+        outcomes: List[Optional[BaseException]],
+    ) -> None:
+        """Complete the callers' futures once their batch is committed."""
+        self.batches += 1
+        self.operations += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        for (_, _, future), error in zip(batch, outcomes):
+            if error is not None:
+                self.errors += 1
+                if DB_DURABILITY == "relaxed":
+                    logger.error(f"Queued write failed: {error}")
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(True)
+            else:
+                future.set_exception(error)
+
+
+_write_queue = WriteBehindQueue(WRITE_BATCH_SIZE, WRITE_BATCH_INTERVAL)
+
+
+async def _submit_write(op: WriteOp, *args: Any) -> None:
+    """
+    Run a write operation through the group-commit queue.
+
+    Falls back to an immediate commit when the writer is not running, e.g. in
+    scripts that use the database without the API lifespan.
+    """
+    if not _write_queue.running:
+        await _run_in_writer(_write_now, op, *args)
+        return
+
+    future = _write_queue.submit(op, *args)
+    if DB_DURABILITY == "relaxed":
+        # Errors are logged by the writer; mark them as retrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return
+    await future
+
+
+def _write_now(op: WriteOp, *args: Any) -> None:
+    conn = get_db_connection()
+    op(conn, *args)
+    conn.commit()
+
+
+# Message storage helpers
+def _insert_message(
+    conn: sqlite3.Connection, entity_id: str, entity_type: str, message: Dict[str, Any]
+) -> None:
+    """
+    Append a single message row for an entity.
+
+    A message published to several rooms carries them all in `rooms`; it is
+    stored under `room_id` and indexed under the others in message_rooms.
+    """
+    extra = {k: v for k, v in message.items() if k not in _MESSAGE_COLUMNS}
+    ingest_ns = _clock.tick()
+    cursor = conn.execute(
+        """
+        INSERT INTO messages
+            (entity_id, entity_type, room_id, timestamp, message, message_type,
+             state, extra, ingest_ns)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            entity_id,
+            entity_type,
+            message.get("room_id"),
+            message.get("timestamp"),
+            message.get("message"),
+            message.get("message_type"),
+            json.dumps(message.get("state") or {}),
+            json.dumps(extra) if extra else None,
+            ingest_ns,
+        ),
+    )
+    other_rooms = [
+        room for room in message.get("rooms") or () if room != message.get("room_id")
+    ]
+    if other_rooms:
+        conn.executemany(
+            "INSERT OR IGNORE INTO message_rooms (message_id, room_id, ingest_ns) "
+            "VALUES (?, ?, ?)",
+            [(cursor.lastrowid, room, ingest_ns) for room in other_rooms],
+        )
+    if message.get("message"):
+        conn.execute(
+            "INSERT INTO messages_fts (rowid, message) VALUES (?, ?)",
+            (cursor.lastrowid, message["message"]),
+        )
+
+
+def _row_to_message(row: Any) -> Dict[str, Any]:
+    """
+    Rebuild the message dict stored by `_insert_message` from a table row or
+    an archived row dict.
+    """
+    message = {
+        "timestamp": row["timestamp"],
+        "message": row["message"],
+        "message_type": row["message_type"],
+        "state": json.loads(row["state"]) if row["state"] else {},
+    }
+    if row["room_id"] is not None:
+        message["room_id"] = row["room_id"]
+    if row["extra"]:
+        message.update(json.loads(row["extra"]))
+    message["ingest_ns"] = row["ingest_ns"]
+    return message
+
+
+def _select_entity_messages(
+    conn: sqlite3.Connection, entity_id: str, limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Return the last `limit` messages of an entity (all if None), oldest first."""
+    if limit is None:
+        cursor = conn.execute(
+            "SELECT * FROM messages WHERE entity_id = ? ORDER BY id", (entity_id,)
+        )
+        return [_row_to_message(row) for row in cursor.fetchall()]
+
+    if limit <= 0:
+        return []
+    cursor = conn.execute(
+        "SELECT * FROM messages WHERE entity_id = ? ORDER BY id DESC LIMIT ?",
+        (entity_id, limit),
+    )
+    return [_row_to_message(row) for row in reversed(cursor.fetchall())]
+
+
+def _write_entity_message(
+    conn: sqlite3.Connection,
+    entity_type: str,
+    entity_id: str,
+    message: Dict[str, Any],
+    status: Optional[str] = None,
+    state: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Create the entity row if needed and append one message to it.
+
+    The latest state becomes `state` if given, else the message state when it
+    has one.
+    """
+    table = ENTITY_TABLES[entity_type]
+    conn.execute(f"INSERT OR IGNORE INTO {table} (id) VALUES (?)", (entity_id,))
+    _insert_message(conn, entity_id, entity_type, message)
+    if status is not None:
+        conn.execute(f"UPDATE {table} SET status = ? WHERE id = ?", (status, entity_id))
+    if state is None:
+        state = message.get("state")
+    if state:
+        _write_latest_state(conn, entity_type, entity_id, state)
+
+
+def _write_latest_state(
+    conn: sqlite3.Connection, entity_type: str, entity_id: str, state: Dict[str, Any]
+) -> None:
+    conn.execute(
+        """
+        INSERT INTO latest_state (entity_id, entity_type, state, updated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (entity_id) DO UPDATE SET
+            state = excluded.state, updated_at = excluded.updated_at
+        """,
+        (entity_id, entity_type, json.dumps(state), time.time()),
+    )
+
+
+def _write_entity_status(
+    conn: sqlite3.Connection, entity_type: str, entity_id: str, status: str
+) -> None:
+    conn.execute(
+        f"UPDATE {ENTITY_TABLES[entity_type]} SET status = ? WHERE id = ?",
+        (status, entity_id),
+    )
+
+
+def _write_clear_all(conn: sqlite3.Connection) -> None:
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('delete-all')")
+    conn.execute("DELETE FROM messages")
+    conn.execute("DELETE FROM message_rooms")
+    conn.execute("DELETE FROM message_archive")
+    conn.execute("DELETE FROM latest_state")
+    conn.execute("DELETE FROM vehicles")
+    conn.execute("DELETE FROM llms")
+    conn.execute("DELETE FROM veh2llm")
+
+
+# Vehicle rows
+_VEHICLE_QUERY = """
+    SELECT v.id, v.status, v.last_seen, s.state
+    FROM vehicles v LEFT JOIN latest_state s ON s.entity_id = v.id
+"""
+
+
+def _row_to_vehicle(
+    conn: sqlite3.Connection, row: sqlite3.Row, messages_limit: Optional[int]
+) -> Dict[str, Any]:
+    return {
+        "_id": row["id"],
+        "messages": _select_entity_messages(conn, row["id"], messages_limit),
+        "status": row["status"],
+        "last_seen": row["last_seen"],
+        "state": json.loads(row["state"]) if row["state"] else {},
+    }
+
+
+# LLM rows
+def _row_to_llm(
+    conn: sqlite3.Connection, row: sqlite3.Row, messages_limit: Optional[int]
+) -> Dict[str, Any]:
+    return {
+        "_id": row["id"],
+        "messages": _select_entity_messages(conn, row["id"], messages_limit),
+        "status": row["status"],
+        "last_seen": row["last_seen"],
+        "vehicle_id": row["vehicle_id"],
+    }
+
+
+# Retention and archiving
+class RetentionPolicy:
+    """
+    How much history to keep hot for matching message streams.
+
+    A stream is the messages of one entity with one message type. Messages
+    beyond the newest `max_messages`, or older than `max_age` seconds, expire
+    and are moved into compressed archive segments.
+
+    Args:
+        entity: Glob pattern matched against the entity ID (e.g. "v*")
+        message_type: Glob pattern matched against the message type, or None
+            for any type
+        max_messages: Number of newest messages to keep hot, or None
+        max_age: Seconds of history to keep hot, or None
+    """
+
+    def __init__(
+        self,
+        entity: str = "*",
+        message_type: Optional[str] = None,
+        max_messages: Optional[int] = None,
+        max_age: Optional[float] = None,
+    ):
+        self.entity = entity
+        self.message_type = message_type
+        self.max_messages = max_messages
+        self.max_age = max_age
+
+    def matches(self, entity_id: str, message_type: Optional[str]) -> bool:
+        if not fnmatch.fnmatchcase(entity_id, self.entity):
+            return False
+        if self.message_type is None:
+            return True
+        return fnmatch.fnmatchcase(message_type or "", self.message_type)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "entity": self.entity,
+            "message_type": self.message_type,
+            "max_messages": self.max_messages,
+            "max_age": self.max_age,
+        }
+
+
+def _load_retention_policies() -> List[RetentionPolicy]:
+    """
+    Read policies from SWARM_SQUAD_RETENTION, a JSON list of RetentionPolicy
+    keyword arguments, e.g.
+    '[{"message_type": "alert", "max_age": 86400}, {"max_messages": 500}]'.
+    """
+    raw = os.environ.get("SWARM_SQUAD_RETENTION")
+    if not raw:
+        return [RetentionPolicy(max_messages=1000)]
+    try:
+        return [RetentionPolicy(**policy) for policy in json.loads(raw)]
+    except (TypeError, ValueError) as e:
+        logger.error(f"Invalid SWARM_SQUAD_RETENTION, retention disabled: {e}")
+        return []
+
+
+# Ordered retention policies; the first one matching a stream applies
+_retention_policies = _load_retention_policies()
+
+# Seconds between compaction passes
+RETENTION_INTERVAL = float(os.environ.get("SWARM_SQUAD_RETENTION_INTERVAL", "60"))
+
+# Expired messages are archived in full segments of this many rows, so a stream
+# may hold up to ARCHIVE_SEGMENT_SIZE - 1 expired rows until the next segment
+# fills up.
+ARCHIVE_SEGMENT_SIZE = int(os.environ.get("SWARM_SQUAD_ARCHIVE_SEGMENT_SIZE", "500"))
+
+# Upper bound of segments written per pass, to keep each pass from holding the
+# writer thread for long.
+_MAX_SEGMENTS_PER_PASS = 20
+
+
+def set_retention_policies(policies: List[RetentionPolicy]) -> None:
+    """Replace the retention policies used by later compaction passes."""
+    global _retention_policies
+    _retention_policies = list(policies)
+
+
+def get_retention_policies() -> List[RetentionPolicy]:
+    """Get the retention policies in match order."""
+    return list(_retention_policies)
+
+
+def _find_policy(
+    entity_id: str, message_type: Optional[str]
+) -> Optional[RetentionPolicy]:
+    for policy in _retention_policies:
+        if policy.matches(entity_id, message_type):
+            return policy
+    return None
+
+
+def _expired_cutoff(
+    conn: sqlite3.Connection,
+    entity_id: str,
+    message_type: Optional[str],
+    count: int,
+    policy: RetentionPolicy,
+    now: int,
+) -> int:
+    """Return the highest expired message id of a stream, or 0."""
+    cutoff = 0
+    if policy.max_messages is not None and count > policy.max_messages:
+        row = conn.execute(
+            "SELECT id FROM messages WHERE entity_id = ? AND message_type IS ? "
+            "ORDER BY id DESC LIMIT 1 OFFSET ?",
+            (entity_id, message_type, max(0, policy.max_messages)),
+        ).fetchone()
+        cutoff = row["id"]
+    if policy.max_age is not None:
+        row = conn.execute(
+            "SELECT MAX(id) FROM messages WHERE entity_id = ? AND message_type IS ? "
+            "AND ingest_ns < ?",
+            (entity_id, message_type, now - int(policy.max_age * 1e9)),
+        ).fetchone()
+        cutoff = max(cutoff, row[0] or 0)
+    return cutoff
+
+
+def _archive_segment(conn: sqlite3.Connection, rows: List[sqlite3.Row]) -> None:
+    """Compress rows of one stream into an archive segment and delete them."""
+    first, last = rows[0], rows[-1]
+    data = zlib.compress(json.dumps([dict(row) for row in rows]).encode())
+    conn.execute(
+        """
+        INSERT INTO message_archive
+            (entity_id, entity_type, message_type, first_id, last_id,
+             first_ingest_ns, last_ingest_ns, count, data)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            first["entity_id"],
+            first["entity_type"],
+            first["message_type"],
+            first["id"],
+            last["id"],
+            first["ingest_ns"],
+            last["ingest_ns"],
+            len(rows),
+            data,
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO messages_fts (messages_fts, rowid, message) "
+        "VALUES ('delete', ?, ?)",
+        [(row["id"], row["message"]) for row in rows if row["message"]],
+    )
+    conn.executemany(
+        "DELETE FROM message_rooms WHERE message_id = ?",
+        [(row["id"],) for row in rows if _row_rooms(row)],
+    )
+    conn.execute(
+        "DELETE FROM messages WHERE id BETWEEN ? AND ? AND entity_id = ? "
+        "AND message_type IS ?",
+        (first["id"], last["id"], first["entity_id"], first["message_type"]),
+    )
+
+
+def _row_rooms(row: Any) -> List[str]:
+    """Rooms a stored row was published to besides its `room_id`."""
+    if not row["extra"]:
+        return []
+    return json.loads(row["extra"]).get("rooms") or []
+
+
+def _in_room(row: Dict[str, Any], room_id: str) -> bool:
+    return row["room_id"] == room_id or room_id in _row_rooms(row)
+
+
+def _decode_segment(data: bytes) -> List[Dict[str, Any]]:
+    rows = json.loads(zlib.decompress(data))
+    for row in rows:
+        # Segments archived before ingest_ns existed carry created_at
+        if "ingest_ns" not in row:
+            created_at = row.get("created_at")
+            row["ingest_ns"] = int(created_at * 1e9) + row["id"] if created_at else 0
+    return rows
+
+
+class RetentionCompactor:
+    """
+    Background task that applies the retention policies.
+
+    Each pass runs on the writer thread, between write batches, and commits
+    after every segment so readers never see a message in both the hot table
+    and the archive. Every worker of a server compacts the same database, so
+    a segment's rows are selected only once its write lock is taken: rows
+    another worker archived meanwhile are gone by then. `on_archive` is
+    called with the number of messages a periodic pass archived, if any.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.on_archive: Optional[Callable[[int], None]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.passes = 0
+        self.segments = 0
+        self.archived = 0
+        self.last_pass_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """Start periodic compaction on the running event loop."""
+        if self.running or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run(), name="db-retention")
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def compact(self) -> int:
+        """Run one compaction pass now and return the number of archived rows."""
+        return await _run_in_writer(self._compact_pass)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policies": [policy.to_dict() for policy in _retention_policies],
+            "passes": self.passes,
+            "segments": self.segments,
+            "archived": self.archived,
+            "last_pass_ms": self.last_pass_ms,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                archived = await self.compact()
+            except Exception as e:
+                logger.error(f"Error compacting message history: {e}")
+                continue
+            if archived and self.on_archive is not None:
+                self.on_archive(archived)
+
+    def _compact_pass(self) -> int:
+        started = time.perf_counter()
+        conn = get_db_connection()
+        now = time.time_ns()
+        budget = _MAX_SEGMENTS_PER_PASS
+        archived = 0
+
+        streams = conn.execute(
+            "SELECT entity_id, message_type, COUNT(*) AS count FROM messages "
+            "GROUP BY entity_id, message_type"
+        ).fetchall()
+        for stream in streams:
+            if budget <= 0:
+                break
+            entity_id, message_type = stream["entity_id"], stream["message_type"]
+            policy = _find_policy(entity_id, message_type)
+            if policy is None:
+                continue
+            cutoff = _expired_cutoff(
+                conn, entity_id, message_type, stream["count"], policy, now
+            )
+            while cutoff and budget > 0:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = conn.execute(
+                        "SELECT * FROM messages WHERE entity_id = ? "
+                        "AND message_type IS ? AND id <= ? ORDER BY id LIMIT ?",
+                        (entity_id, message_type, cutoff, ARCHIVE_SEGMENT_SIZE),
+                    ).fetchall()
+                    if len(rows) < ARCHIVE_SEGMENT_SIZE:
+                        conn.rollback()
+                        break
+                    _archive_segment(conn, rows)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                budget -= 1
+                archived += len(rows)
+                self.segments += 1
+
+        self.passes += 1
+        self.archived += archived
+        self.last_pass_ms = (time.perf_counter() - started) * 1000
+        return archived
+
+
+_compactor = RetentionCompactor(RETENTION_INTERVAL)
+
+
+def _select_with_archive(
+    conn: sqlite3.Connection, entity_id: str, limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Return the last `limit` rows of an entity across the hot table and its
+    archive segments, oldest first.
+    """
+    if limit is not None and limit <= 0:
+        return []
+    query = "SELECT * FROM messages WHERE entity_id = ? ORDER BY id DESC"
+    params: Tuple[Any, ...] = (entity_id,)
+    if limit is not None:
+        query += " LIMIT ?"
+        params += (limit,)
+    rows = [dict(row) for row in conn.execute(query, params)]
+    segments = conn.execute(
+        "SELECT last_id, data FROM message_archive WHERE entity_id = ? "
+        "ORDER BY last_id DESC",
+        (entity_id,),
+    )
+    return _merge_segments(rows, segments, limit)
+
+
+def _merge_segments(
+    rows: List[Dict[str, Any]], segments: Any, limit: Optional[int]
+) -> List[Dict[str, Any]]:
+    """
+    Add archived rows to `rows` and return the last `limit`, oldest first.
+
+    Segments must come newest first; once `limit` rows are newer than a
+    segment's last message, older segments cannot contribute.
+    """
+    for segment in segments:
+        if limit is not None and len(rows) >= limit:
+            rows.sort(key=lambda row: row["id"], reverse=True)
+            del rows[limit:]
+            if rows[-1]["id"] > segment["last_id"]:
+                break
+        rows.extend(_decode_segment(segment["data"]))
+
+    rows.sort(key=lambda row: row["id"])
+    return rows if limit is None else rows[-limit:]
+
+
+def _select_history(
+    conn: sqlite3.Connection,
+    room_id: Optional[str],
+    entity_id: Optional[str],
+    start_ns: Optional[int],
+    end_ns: Optional[int],
+    limit: int,
+    after_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Return the first `limit` rows of a room and/or entity ingested in
+    [start_ns, end_ns) across the hot table and archive segments, ordered
+    by (ingest_ns, id). With `after_id`, rows start after (start_ns,
+    after_id) instead.
+    """
+    if limit <= 0:
+        return []
+    after = (start_ns or 0, after_id) if after_id is not None else None
+
+    def window(ingest_column: str, id_column: str) -> Tuple[str, List[Any]]:
+        conditions, params = ["1 = 1"], []
+        if after is not None:
+            conditions.append(f"({ingest_column}, {id_column}) > (?, ?)")
+            params.extend(after)
+        elif start_ns is not None:
+            conditions.append(f"{ingest_column} >= ?")
+            params.append(start_ns)
+        for condition, value in (
+            ("m.entity_id = ?", entity_id),
+            (f"{ingest_column} < ?", end_ns),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        return " AND ".join(conditions), params
+
+    where, params = window("m.ingest_ns", "m.id")
+    query = f"SELECT m.* FROM messages m WHERE {where}"
+    if room_id is not None:
+        # Rows stored under the room plus rows published to it as an extra
+        # room, each side read in index order up to the limit
+        room_where, room_params = window("r.ingest_ns", "r.message_id")
+        query = (
+            f"SELECT * FROM ({query} AND m.room_id = ? "
+            "ORDER BY m.ingest_ns, m.id LIMIT ?) UNION ALL "
+            "SELECT * FROM (SELECT m.* FROM message_rooms r "
+            "JOIN messages m ON m.id = r.message_id "
+            f"WHERE r.room_id = ? AND {room_where} "
+            "ORDER BY r.ingest_ns, r.message_id LIMIT ?)"
+        )
+        params = [*params, room_id, limit, room_id, *room_params, limit]
+    rows = [
+        dict(row)
+        for row in conn.execute(
+            f"{query} ORDER BY ingest_ns, id LIMIT ?", (*params, limit)
+        )
+    ]
+
+    # Segments overlapping the window, oldest first; once `limit` rows were
+    # ingested before a segment starts, later segments cannot contribute
+    query = "SELECT first_ingest_ns, data FROM message_archive WHERE 1 = 1"
+    segment_params: List[Any] = []
+    if entity_id is not None:
+        query += " AND entity_id = ?"
+        segment_params.append(entity_id)
+    if start_ns is not None:
+        query += " AND last_ingest_ns >= ?"
+        segment_params.append(start_ns)
+    if end_ns is not None:
+        query += " AND first_ingest_ns < ?"
+        segment_params.append(end_ns)
+    segments = conn.execute(query + " ORDER BY first_ingest_ns", segment_params)
+    for segment in segments:
+        if len(rows) >= limit:
+            rows.sort(key=_history_order)
+            del rows[limit:]
+            if rows[-1]["ingest_ns"] < segment["first_ingest_ns"]:
+                break
+        rows.extend(
+            row
+            for row in _decode_segment(segment["data"])
+            if (room_id is None or _in_room(row, room_id))
+            and (
+                _history_order(row) > after
+                if after is not None
+                else start_ns is None or row["ingest_ns"] >= start_ns
+            )
+            and (end_ns is None or row["ingest_ns"] < end_ns)
+        )
+
+    rows.sort(key=_history_order)
+    return rows[:limit]
+
+
+def _history_order(row: Dict[str, Any]) -> Tuple[int, int]:
+    return row["ingest_ns"], row["id"]
+
+
+def _select_search(
+    conn: sqlite3.Connection,
+    query: str,
+    room_id: Optional[str],
+    entity_id: Optional[str],
+    message_type: Optional[str],
+    start_ns: Optional[int],
+    end_ns: Optional[int],
+    limit: int,
+) -> List[sqlite3.Row]:
+    """
+    Return the newest `limit` hot rows matching a search query and filters.
+
+    The index is walked newest first (message ids follow ingest order), so a
+    query stops as soon as `limit` rows pass the filters instead of ranking
+    every match.
+    """
+    match = " ".join(
+        f'"{term}"*' if prefix else f'"{term}"' for term, prefix in search_terms(query)
+    )
+    conditions, params = ["messages_fts MATCH ?"], [match]
+    if room_id is not None:
+        conditions.append(
+            "(m.room_id = ? OR EXISTS (SELECT 1 FROM message_rooms r "
+            "WHERE r.message_id = m.id AND r.room_id = ?))"
+        )
+        params.extend([room_id, room_id])
+    for column, value in (
+        ("m.entity_id = ?", entity_id),
+        ("m.message_type = ?", message_type),
+        ("m.ingest_ns >= ?", start_ns),
+        ("m.ingest_ns < ?", end_ns),
+    ):
+        if value is not None:
+            conditions.append(column)
+            params.append(value)
+    return conn.execute(
+        f"""
+        SELECT m.* FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+        WHERE {" AND ".join(conditions)}
+        ORDER BY messages_fts.rowid DESC LIMIT ?
+        """,
+        (*params, limit),
+    ).fetchall()
+
+
+# Document queries for the collection shim
+_COLLECTIONS = {
+    "vehicles": (
+        _VEHICLE_QUERY,
+        {"_id": "v.id", "status": "v.status", "last_seen": "v.last_seen"},
+    ),
+    "llms": (
+        "SELECT id, status, last_seen, vehicle_id FROM llms",
+        {
+            "_id": "id",
+            "status": "status",
+            "last_seen": "last_seen",
+            "vehicle_id": "vehicle_id",
+        },
+    ),
+    "veh2llm": (
+        "SELECT vehicle_id, llm_id FROM veh2llm",
+        {"vehicle_id": "vehicle_id", "llm_id": "llm_id"},
+    ),
+}
+
+
+def _compile_filter(
+    filter_dict: Optional[Dict[str, Any]], columns: Dict[str, str]
+) -> Tuple[str, List[Any]]:
+    """
+    Translate a MongoDB-style filter into a SQL WHERE clause.
+
+    Supports equality, `$in`, `$nin` and `$ne` on the collection's columns.
+
+    Raises:
+        ValueError: If a field or operator cannot be translated
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    for field, condition in (filter_dict or {}).items():
+        column = columns.get(field)
+        if column is None:
+            raise ValueError(f"Unsupported filter field: {field}")
+        if not isinstance(condition, dict):
+            clauses.append(f"{column} = ?")
+            params.append(condition)
+            continue
+        for operator, value in condition.items():
+            if operator in ("$in", "$nin"):
+                values = list(value)
+                if not values:
+                    clauses.append("0" if operator == "$in" else "1")
+                    continue
+                negate = "NOT " if operator == "$nin" else ""
+                placeholders = ", ".join("?" * len(values))
+                clauses.append(f"{column} {negate}IN ({placeholders})")
+                params.extend(values)
+            elif operator == "$ne":
+                clauses.append(f"{column} IS NOT ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+def _write_veh2llm(conn: sqlite3.Connection, vehicle_id: str, llm_id: str) -> None:
+    conn.execute(
+        """
+        INSERT INTO veh2llm (vehicle_id, llm_id) VALUES (?, ?)
+        ON CONFLICT (vehicle_id) DO UPDATE SET llm_id = excluded.llm_id
+        """,
+        (vehicle_id, llm_id),
+    )
+    conn.execute("UPDATE llms SET vehicle_id = ? WHERE id = ?", (vehicle_id, llm_id))
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Storage engine backed by the SQLite database at DB_PATH.
+
+    Writes go through the group-commit queue on the writer thread, reads use
+    the read-only connection pool and retention runs in the background.
+    """
+
+    name = "sqlite"
+
+    async def connect(self) -> bool:
+        """
+        Initialize SQLite database with required tables.
+
+        Returns:
+            bool: True if connection was successful, False otherwise
+        """
+        try:
+            await _run_in_writer(_init_schema)
+            await _write_queue.start()
+            _compactor.on_archive = self._archived
+            await _compactor.start()
+            logger.info("SQLite database initialized successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to connect to SQLite database: {str(e)}")
+            return False
+
+    async def close(self) -> None:
+        """Flush pending writes and close SQLite database connection."""
+        await _compactor.stop()
+        await _write_queue.stop()
+        _read_pool.close()
+        await _run_in_writer(_close_connection)
+
+    def is_connected(self) -> bool:
+        """
+        Check if database connection is available.
+
+        Returns:
+            bool: True if connected, False otherwise
+        """
+        return _connection is not None
+
+    def has_uncommitted_writes(self) -> bool:
+        # Only relaxed writes return before their commit
+        return DB_DURABILITY == "relaxed" and _write_queue.uncommitted > 0
+
+    def _archived(self, archived: int) -> None:
+        if self.on_change is not None:
+            self.on_change()
+
+    @_read_query
+    def get_entity_messages(
+        self,
+        conn: sqlite3.Connection,
+        entity_id: str,
+        limit: Optional[int] = None,
+        include_archived: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the most recent messages of a vehicle or LLM, oldest first.
+
+        Args:
+            entity_id: Vehicle or LLM identifier
+            limit: Maximum number of messages to return, or None for all
+            include_archived: Also look in archive segments when the hot table
+                holds fewer than `limit` messages
+
+        Returns:
+            List of message dicts
+        """
+        try:
+            if include_archived:
+                return [
+                    _row_to_message(row)
+                    for row in _select_with_archive(conn, entity_id, limit)
+                ]
+            return _select_entity_messages(conn, entity_id, limit)
+        except Exception as e:
+            logger.error(f"Error getting messages for {entity_id}: {e}")
+            return []
+
+    @_read_query
+    def get_recent_messages(
+        self, conn: sqlite3.Connection, entity_type: str, per_entity: int = 5
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get the last `per_entity` messages of every vehicle or LLM.
+
+        Args:
+            entity_type: "vehicle" or "llm"
+            per_entity: Number of messages to return for each entity
+
+        Returns:
+            Dict mapping entity IDs to their recent messages, oldest first
+        """
+        try:
+            cursor = conn.execute(f"SELECT id FROM {ENTITY_TABLES[entity_type]}")
+            return {
+                row["id"]: _select_entity_messages(conn, row["id"], per_entity)
+                for row in cursor.fetchall()
+            }
+        except Exception as e:
+            logger.error(f"Error getting recent {entity_type} messages: {e}")
+            return {}
+
+    @_read_query
+    def get_entities_messages(
+        self, conn: sqlite3.Connection, entity_ids: List[str], limit: int
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get the last `limit` messages of several vehicles or LLMs in one query.
+
+        Returns:
+            Dict mapping entity IDs to their messages, oldest first; IDs
+            without messages are omitted
+        """
+        if not entity_ids or limit <= 0:
+            return {}
+        try:
+            entity_ids = list(dict.fromkeys(entity_ids))
+            # Each entity's last IDs come from its index, then rows by rowid
+            values = ", ".join(["(?)"] * len(entity_ids))
+            cursor = conn.execute(
+                f"WITH ids (entity_id) AS (VALUES {values}) "
+                "SELECT m.* FROM ids JOIN messages m ON m.id IN ("
+                "SELECT id FROM messages WHERE entity_id = ids.entity_id "
+                "ORDER BY id DESC LIMIT ?) ORDER BY m.id",
+                (*entity_ids, limit),
+            )
+            messages: Dict[str, List[Dict[str, Any]]] = {}
+            for row in cursor:
+                messages.setdefault(row["entity_id"], []).append(_row_to_message(row))
+            return messages
+        except Exception as e:
+            logger.error(f"Error getting messages of {len(entity_ids)} entities: {e}")
+            return {}
+
+    @_read_query
+    def get_message_history(
+        self,
+        conn: sqlite3.Connection,
+        room_id: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        start_ns: Optional[int] = None,
+        end_ns: Optional[int] = None,
+        limit: int = 1000,
+        after_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get messages of a room and/or entity by ingest time, oldest first.
+
+        Args:
+            room_id: Only return messages posted to this room
+            entity_id: Only return messages of this vehicle or LLM
+            start_ns: Inclusive lower bound on ingest_ns
+            end_ns: Exclusive upper bound on ingest_ns
+            limit: Maximum number of (oldest) messages to return
+            after_id: Start after the message (start_ns, after_id) instead
+
+        Returns:
+            List of message dicts, each with its entity_id and message_id
+        """
+        try:
+            rows = _select_history(
+                conn, room_id, entity_id, start_ns, end_ns, limit, after_id
+            )
+            return [
+                {
+                    **_row_to_message(row),
+                    "entity_id": row["entity_id"],
+                    "message_id": row["id"],
+                }
+                for row in rows
+            ]
+        except Exception as e:
+            logger.error(f"Error getting message history: {e}")
+            return []
+
+    @_read_query
+    def search_messages(
+        self,
+        conn: sqlite3.Connection,
+        query: str,
+        room_id: Optional[str] = None,
+        entity_id: Optional[str] = None,
+        message_type: Optional[str] = None,
+        start_ns: Optional[int] = None,
+        end_ns: Optional[int] = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """
+        Full-text search over the text of hot messages, newest first.
+
+        Args:
+            query: Terms that must all appear; "term*" matches a prefix
+            room_id: Only return messages posted to this room
+            entity_id: Only return messages of this vehicle or LLM
+            message_type: Only return messages of this type
+            start_ns: Inclusive lower bound on ingest_ns
+            end_ns: Exclusive upper bound on ingest_ns
+            limit: Maximum number of (newest) messages to return
+
+        Returns:
+            List of message dicts, each with its entity_id
+
+        Raises:
+            ValueError: If the query has no searchable terms
+        """
+        if limit <= 0:
+            return []
+        rows = _select_search(
+            conn, query, room_id, entity_id, message_type, start_ns, end_ns, limit
+        )
+        return [{**_row_to_message(row), "entity_id": row["entity_id"]} for row in rows]
+
+    # Vehicle operations
+    @_read_query
+    def get_all_vehicles(
+        self, conn: sqlite3.Connection, messages_limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Get all vehicles from database.
+
+        Args:
+            messages_limit: Number of recent messages to attach per vehicle,
+                or None for the full history
+        """
+        try:
+            cursor = conn.execute(_VEHICLE_QUERY)
+            return [
+                _row_to_vehicle(conn, row, messages_limit) for row in cursor.fetchall()
+            ]
+        except Exception as e:
+            logger.error(f"Error getting vehicles: {e}")
+            return []
+
+    @_read_query
+    def find_vehicle(
+        self,
+        conn: sqlite3.Connection,
+        vehicle_id: str,
+        messages_limit: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Find a specific vehicle by ID."""
+        try:
+            cursor = conn.execute(_VEHICLE_QUERY + " WHERE v.id = ?", (vehicle_id,))
+            row = cursor.fetchone()
+            if row:
+                return _row_to_vehicle(conn, row, messages_limit)
+            return None
+        except Exception as e:
+            logger.error(f"Error finding vehicle {vehicle_id}: {e}")
+            return None
+
+    async def upsert_vehicle_message(
+        self,
+        vehicle_id: str,
+        message: Dict[str, Any],
+        status: Optional[str] = None,
+        state: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """
+        Add a message to a vehicle, creating the vehicle if it doesn't exist.
+
+        If status is given, the vehicle status is updated in the same write. The
+        latest state becomes `state`, or the message state when it has one.
+        """
+        try:
+            await _submit_write(
+                _write_entity_message, "vehicle", vehicle_id, message, status, state
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error upserting vehicle message for {vehicle_id}: {e}")
+            return False
+
+    @_read_query
+    def get_latest_states(
+        self, conn: sqlite3.Connection, entity_ids: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the latest state of several vehicles or LLMs in one query.
+
+        Returns:
+            Dict mapping entity IDs to their state; IDs without state are omitted
+        """
+        if not entity_ids:
+            return {}
+        try:
+            placeholders = ", ".join("?" * len(entity_ids))
+            cursor = conn.execute(
+                "SELECT entity_id, state FROM latest_state "
+                f"WHERE entity_id IN ({placeholders})",
+                list(entity_ids),
+            )
+            return {row["entity_id"]: json.loads(row["state"]) for row in cursor}
+        except Exception as e:
+            logger.error(f"Error getting latest states: {e}")
+            return {}
+
+    async def update_vehicle_state(
+        self, vehicle_id: str, state: Dict[str, Any]
+    ) -> bool:
+        """Replace the latest state of a vehicle without adding a message."""
+        try:
+            await _submit_write(_write_latest_state, "vehicle", vehicle_id, state)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating vehicle state for {vehicle_id}: {e}")
+            return False
+
+    async def update_vehicle_status(self, vehicle_id: str, status: str) -> bool:
+        """Update vehicle status."""
+        try:
+            await _submit_write(_write_entity_status, "vehicle", vehicle_id, status)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating vehicle status for {vehicle_id}: {e}")
+            return False
+
+    # LLM operations
+    @_read_query
+    def get_all_llms(
+        self, conn: sqlite3.Connection, messages_limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Get all LLMs from database.
+
+        Args:
+            messages_limit: Number of recent messages to attach per LLM,
+                or None for the full history
+        """
+        try:
+            cursor = conn.execute("SELECT * FROM llms")
+            return [_row_to_llm(conn, row, messages_limit) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting LLMs: {e}")
+            return []
+
+    @_read_query
+    def find_llm(
+        self,
+        conn: sqlite3.Connection,
+        llm_id: str,
+        messages_limit: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Find a specific LLM by ID."""
+        try:
+            cursor = conn.execute("SELECT * FROM llms WHERE id = ?", (llm_id,))
+            row = cursor.fetchone()
+            if row:
+                return _row_to_llm(conn, row, messages_limit)
+            return None
+        except Exception as e:
+            logger.error(f"Error finding LLM {llm_id}: {e}")
+            return None
+
+    async def upsert_llm_message(
+        self, llm_id: str, message: Dict[str, Any], status: Optional[str] = None
+    ) -> bool:
+        """
+        Add a message to an LLM, creating the LLM if it doesn't exist.
+
+        If status is given, the LLM status is updated in the same write.
+        """
+        try:
+            await _submit_write(_write_entity_message, "llm", llm_id, message, status)
+            return True
+        except Exception as e:
+            logger.error(f"Error upserting LLM message for {llm_id}: {e}")
+            return False
+
+    async def update_llm_status(self, llm_id: str, status: str) -> bool:
+        """Update LLM status."""
+        try:
+            await _submit_write(_write_entity_status, "llm", llm_id, status)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating LLM status for {llm_id}: {e}")
+            return False
+
+    # Clear database operations
+    async def clear_all_data(self) -> bool:
+        """Clear all data from the database."""
+        try:
+            await _submit_write(_write_clear_all)
+            logger.info("All database data cleared")
+            return True
+        except Exception as e:
+            logger.error(f"Error clearing database: {e}")
+            return False
+
+    @_read_query
+    def count_entities(self, conn: sqlite3.Connection, entity_type: str) -> int:
+        """Count vehicles or LLMs without loading them."""
+        try:
+            cursor = conn.execute(f"SELECT COUNT(*) FROM {ENTITY_TABLES[entity_type]}")
+            return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error counting {entity_type} entities: {e}")
+            return 0
+
+    # Retention and archiving
+    async def compact_message_history(self) -> int:
+        """
+        Archive expired messages now instead of waiting for the next pass.
+
+        Returns:
+            Number of messages moved into archive segments
+        """
+        return await _compactor.compact()
+
+    @_read_query
+    def get_archived_messages(
+        self,
+        conn: sqlite3.Connection,
+        entity_id: str,
+        limit: Optional[int] = None,
+        message_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get archived messages of a vehicle or LLM, oldest first.
+
+        Args:
+            entity_id: Vehicle or LLM identifier
+            limit: Maximum number of (most recent) messages to return, or None
+            message_type: Only return messages of this type
+
+        Returns:
+            List of message dicts
+        """
+        try:
+            if limit is not None and limit <= 0:
+                return []
+            query = "SELECT last_id, data FROM message_archive WHERE entity_id = ?"
+            params: Tuple[Any, ...] = (entity_id,)
+            if message_type is not None:
+                query += " AND message_type = ?"
+                params += (message_type,)
+            segments = conn.execute(query + " ORDER BY last_id DESC", params)
+            return [
+                _row_to_message(row) for row in _merge_segments([], segments, limit)
+            ]
+        except Exception as e:
+            logger.error(f"Error getting archived messages for {entity_id}: {e}")
+            return []
+
+    # Document queries for the collection shim
+    @_read_query
+    def find_documents(
+        self,
+        conn: sqlite3.Connection,
+        collection: str,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        projection: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Query a collection with the filter evaluated in SQL.
+
+        Messages are only loaded when the projection keeps them, so fetching IDs
+        or state of a few vehicles does not decode any history.
+
+        Args:
+            collection: "vehicles", "llms" or "veh2llm"
+            filter_dict: MongoDB-style filter (equality, $in, $nin, $ne)
+            projection: MongoDB-style projection, or None for whole documents
+            limit: Maximum number of documents, or None for all
+
+        Returns:
+            List of documents
+
+        Raises:
+            ValueError: If the filter cannot be translated to SQL
+        """
+        if collection not in _COLLECTIONS:
+            return []
+        query, columns = _COLLECTIONS[collection]
+        where, params = _compile_filter(filter_dict, columns)
+        query += where
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        messages_limit = None if wants_messages(projection) else 0
+        docs = []
+        for row in conn.execute(query, params).fetchall():
+            if collection == "vehicles":
+                doc = _row_to_vehicle(conn, row, messages_limit)
+            elif collection == "llms":
+                doc = _row_to_llm(conn, row, messages_limit)
+            else:
+                doc = {"vehicle_id": row["vehicle_id"], "llm_id": row["llm_id"]}
+            docs.append(apply_projection(doc, projection) if projection else doc)
+        return docs
+
+    async def assign_llm_to_vehicle(self, vehicle_id: str, llm_id: str) -> bool:
+        """Map a vehicle to its LLM agent, replacing any previous mapping."""
+        try:
+            await _submit_write(_write_veh2llm, vehicle_id, llm_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error assigning LLM {llm_id} to vehicle {vehicle_id}: {e}")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Get counters of the write queue, read pool and retention."""
+        return {
+            "backend": self.name,
+            "write_queue": _write_queue.stats(),
+            "read_pool": _read_pool.stats(),
+            "retention": _compactor.stats(),
+        }
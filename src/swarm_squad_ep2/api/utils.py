@@ -1,5 +1,7 @@
+import asyncio
+import logging
 import math
-from typing import List, Set, Tuple, Type, TypeVar
+from typing import List, Optional, Set, Tuple, Type, TypeVar
 
 from fastapi import WebSocket
 from sqlalchemy import select
@@ -7,6 +9,8 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 T = TypeVar("T")
 
+logger = logging.getLogger(__name__)
+
 
 class ConnectionManager:
     """Manages WebSocket connections"""
@@ -29,6 +33,91 @@ class ConnectionManager:
             await connection.send_json(message)
 
 
+class EventLoopBlockedError(AssertionError):
+    """Raised when the event loop was blocked for longer than allowed."""
+
+
+class EventLoopBlockGuard:
+    """
+    Detects event loop stalls by measuring how late a periodic heartbeat wakes up.
+
+    Use it as an async context manager around code that must not block the loop,
+    e.g. in tests:
+
+        async with EventLoopBlockGuard(threshold=0.05):
+            await upsert_vehicle_message("v1", message)
+
+    On exit it raises EventLoopBlockedError if any stall exceeded the threshold.
+    With raise_on_exit=False it only logs a warning per stall, which is suited
+    for monitoring a running server.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.1,
+        interval: float = 0.01,
+        raise_on_exit: bool = True,
+    ):
+        """
+        Args:
+            threshold: Maximum tolerated stall in seconds
+            interval: Heartbeat period in seconds
+            raise_on_exit: Raise EventLoopBlockedError on exit instead of
+                only logging stalls
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.raise_on_exit = raise_on_exit
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _monitor(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.stalls += 1
+                logger.warning(f"Event loop blocked for {lag * 1000:.1f} ms")
+
+    async def start(self) -> None:
+        """Start watching the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._monitor())
+            # Let the heartbeat take its first timestamp
+            await asyncio.sleep(0)
+
+    async def stop(self) -> None:
+        """Stop watching and raise if a stall exceeded the threshold."""
+        if self._task is not None:
+            # One more tick so a stall right before stop() is measured
+            await asyncio.sleep(self.interval)
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.raise_on_exit and self.max_lag > self.threshold:
+            raise EventLoopBlockedError(
+                f"Event loop was blocked for {self.max_lag * 1000:.1f} ms "
+                f"(threshold {self.threshold * 1000:.1f} ms)"
+            )
+
+    async def __aenter__(self) -> "EventLoopBlockGuard":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is not None:
+            # Don't mask the original error
+            self.raise_on_exit = False
+        await self.stop()
+
+
 async def get_nearby_entities(
     session: AsyncSession,
     model: Type[T],
@@ -0,0 +1,263 @@
+"""
+Compact binary encoding of telemetry frames for WebSocket subscribers.
+
+Clients opt in by offering the `swarm.v1` subprotocol on `/ws`. Vehicle
+updates are then sent as binary frames of packed little-endian fields
+instead of JSON; every other frame (alerts, LLM messages, acks, "pong")
+stays JSON text.
+
+Strings such as entity IDs, room IDs, message types and statuses are
+interned: each is sent once in an INTERN frame and referenced by a 16-bit
+ID afterwards. IDs are assigned by one table shared by all connections, so
+a state frame is encoded once per broadcast; each connection is sent the
+definitions it has not seen yet before the frame that needs them.
+
+Frames start with a kind byte:
+
+    INTERN  <B kind=1><H first_id><H count> then count × <H length><utf-8>
+    STATE   <B kind=2><H room><H entity><H message_type><H status><I seq>
+            <d timestamp><d latitude><d longitude><f speed><f battery>
+    BATCH   <B kind=3><H count> then count × <I length><frame>
+
+`seq` is the frame's sequence number in its room and `timestamp` epoch
+seconds (NaN if unknown); the rendered message text is not sent. Latitude
+and longitude are doubles, since a float keeps only about a metre near
+±180°. A STATE frame is 45 bytes. Lengths in BATCH frames are 32-bit, as
+a batch may carry an INTERN frame with many definitions.
+"""
+
+import math
+import struct
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional
+
+SUBPROTOCOL = "swarm.v1"
+
+KIND_INTERN = 1
+KIND_STATE = 2
+KIND_BATCH = 3
+
+_INTERN_HEADER = struct.Struct("<BHH")
+_BATCH_HEADER = struct.Struct("<BH")
+_LENGTH = struct.Struct("<H")
+_BATCH_LENGTH = struct.Struct("<I")
+_STATE = struct.Struct("<BHHHHIdddff")
+
+# Interned IDs are 16-bit, as are the lengths of interned strings
+MAX_INTERNED = 0xFFFF
+MAX_INTERNED_LENGTH = 0xFFFF
+
+_STATE_FIELDS = ("latitude", "longitude", "speed", "battery")
+
+
+class BinaryFrame(NamedTuple):
+    """An encoded binary frame and the highest interned ID it references."""
+
+    data: bytes
+    max_id: int
+
+
+class InternTable:
+    """Strings of binary frames and their 16-bit IDs, in assignment order."""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def intern(self, value: str) -> int:
+        """
+        Get the ID of a string, assigning the next one if it is new.
+
+        Raises:
+            OverflowError: If all 16-bit IDs are taken, or the string is too
+                long to intern
+        """
+        string_id = self._ids.get(value)
+        if string_id is None:
+            if len(self.strings) >= MAX_INTERNED:
+                raise OverflowError("Intern table is full")
+            if len(value.encode("utf-8")) > MAX_INTERNED_LENGTH:
+                raise OverflowError("String is too long to intern")
+            string_id = self._ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def encode_definitions(self, start: int) -> bytes:
+        """Encode an INTERN frame defining the IDs from `start` onwards."""
+        strings = self.strings[start:]
+        parts = [_INTERN_HEADER.pack(KIND_INTERN, start, len(strings))]
+        for value in strings:
+            encoded = value.encode("utf-8")
+            parts.append(_LENGTH.pack(len(encoded)))
+            parts.append(encoded)
+        return b"".join(parts)
+
+
+def encode_batch(frames: List[bytes]) -> bytes:
+    """Encode several binary frames, in order, as one BATCH frame."""
+    parts = [_BATCH_HEADER.pack(KIND_BATCH, len(frames))]
+    for frame in frames:
+        parts.append(_BATCH_LENGTH.pack(len(frame)))
+        parts.append(frame)
+    return b"".join(parts)
+
+
+def _epoch_seconds(timestamp: Any) -> float:
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return math.nan
+
+
+def encode_state(
+    message: Dict[str, Any], room: str, table: InternTable, seq: int = 0
+) -> Optional[BinaryFrame]:
+    """
+    Encode a vehicle update as a STATE frame for one room.
+
+    Args:
+        message: Message to encode
+        room: Room the frame is sent to
+        table: Intern table of the receiving connections
+        seq: Sequence number of the message in the room
+
+    Returns:
+        The frame, or None if the message must be sent as JSON: alerts,
+        messages without an entity, and states missing a numeric field
+    """
+    message_type = message.get("message_type") or ""
+    entity_id = message.get("entity_id")
+    state = message.get("state")
+    if entity_id is None or "alert" in message_type or not isinstance(state, dict):
+        return None
+    values = [state.get(field) for field in _STATE_FIELDS]
+    if not all(
+        isinstance(value, (int, float)) and not isinstance(value, bool)
+        for value in values
+    ):
+        return None
+    try:
+        ids = (
+            table.intern(room),
+            table.intern(entity_id),
+            table.intern(message_type),
+            table.intern(str(state.get("status", ""))),
+        )
+    except OverflowError:
+        return None
+    data = _STATE.pack(
+        KIND_STATE,
+        *ids,
+        seq & 0xFFFFFFFF,
+        _epoch_seconds(message.get("timestamp")),
+        *values,
+    )
+    return BinaryFrame(data, max(ids))
+
+
+class Decoder:
+    """Decodes the binary frames of one connection."""
+
+    def __init__(self):
+        self.strings: List[Optional[str]] = []
+
+    def decode(self, data: bytes) -> Optional[Dict[str, Any]]:
+        """
+        Decode a binary frame other than a BATCH.
+
+        Returns:
+            A STATE frame as a message dict shaped like the JSON broadcasts,
+            or None for INTERN frames, which only update the decoder
+
+        Raises:
+            ValueError: If the frame is malformed or of an unknown kind
+        """
+        if not data:
+            raise ValueError("Empty binary frame")
+        kind = data[0]
+        try:
+            if kind == KIND_INTERN:
+                self._define(data)
+                return None
+            if kind == KIND_STATE:
+                return self._state(data)
+        except struct.error as e:
+            raise ValueError(f"Malformed binary frame: {e}") from e
+        raise ValueError(f"Unknown binary frame kind {kind}")
+
+    def decode_all(self, data: bytes) -> List[Dict[str, Any]]:
+        """
+        Decode a binary frame of any kind into its messages, in order.
+
+        Raises:
+            ValueError: If the frame is malformed or of an unknown kind
+        """
+        if not data or data[0] != KIND_BATCH:
+            message = self.decode(data)
+            return [message] if message is not None else []
+        messages = []
+        try:
+            _, count = _BATCH_HEADER.unpack_from(data)
+            offset = _BATCH_HEADER.size
+            for _ in range(count):
+                (length,) = _BATCH_LENGTH.unpack_from(data, offset)
+                offset += _BATCH_LENGTH.size
+                messages.extend(self.decode_all(data[offset : offset + length]))
+                offset += length
+        except struct.error as e:
+            raise ValueError(f"Malformed binary frame: {e}") from e
+        return messages
+
+    def _define(self, data: bytes) -> None:
+        _, start, count = _INTERN_HEADER.unpack_from(data)
+        if len(self.strings) < start + count:
+            self.strings.extend([None] * (start + count - len(self.strings)))
+        offset = _INTERN_HEADER.size
+        for string_id in range(start, start + count):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            offset += _LENGTH.size
+            self.strings[string_id] = data[offset : offset + length].decode("utf-8")
+            offset += length
+
+    def _lookup(self, string_id: int) -> str:
+        if string_id >= len(self.strings) or self.strings[string_id] is None:
+            raise ValueError(f"Undefined interned string {string_id}")
+        return self.strings[string_id]
+
+    def _state(self, data: bytes) -> Dict[str, Any]:
+        (
+            _,
+            room,
+            entity,
+            message_type,
+            status,
+            seq,
+            timestamp,
+            latitude,
+            longitude,
+            speed,
+            battery,
+        ) = _STATE.unpack(data)
+        return {
+            "room_id": self._lookup(room),
+            "seq": seq,
+            "entity_id": self._lookup(entity),
+            "message_type": self._lookup(message_type),
+            "timestamp": (
+                datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+                if not math.isnan(timestamp)
+                else None
+            ),
+            "state": {
+                "latitude": latitude,
+                "longitude": longitude,
+                "speed": speed,
+                "battery": battery,
+                "status": self._lookup(status),
+            },
+        }
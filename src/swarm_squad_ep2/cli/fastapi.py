@@ -2,9 +2,11 @@
 FastAPI command for running the backend server.
 """
 
+import os
 import signal
 import subprocess
 import sys
+import tempfile
 from typing import Any, Optional
 
 from swarm_squad_ep2.cli.utils import (
@@ -26,7 +28,14 @@ class FastAPIProcessManager:
         self.process: Optional[subprocess.Popen] = None
 
     def start_process(
-        self, host: str, port: int, reload: bool, project_root, dev_mode: bool
+        self,
+        host: str,
+        port: int,
+        reload: bool,
+        project_root,
+        dev_mode: bool,
+        storage: Optional[str] = None,
+        workers: int = 1,
     ) -> bool:
         """Start the FastAPI process."""
         try:
@@ -44,6 +53,20 @@ class FastAPIProcessManager:
                 cwd = project_root
                 env = dict(subprocess.os.environ)
 
+            if storage:
+                env["SWARM_SQUAD_STORAGE"] = storage
+
+            if workers > 1:
+                # Workers relay broadcasts to each other's subscribers over a
+                # Unix socket bus, one per server port
+                env["SWARM_SQUAD_BUS"] = "unix"
+                env.setdefault(
+                    "SWARM_SQUAD_BUS_PATH",
+                    os.path.join(tempfile.gettempdir(), f"swarm-squad-bus-{port}.sock"),
+                )
+                # Each worker's read cache only sees its own writes
+                env.setdefault("SWARM_SQUAD_READ_CACHE_SIZE", "0")
+
             self.process = subprocess.Popen(
                 [
                     sys.executable,
@@ -55,7 +78,8 @@ class FastAPIProcessManager:
                     "--port",
                     str(port),
                 ]
-                + (["--reload"] if reload else []),
+                + (["--reload"] if reload else [])
+                + (["--workers", str(workers)] if workers > 1 else []),
                 cwd=cwd,
                 env=env,
                 stdout=subprocess.PIPE,
@@ -120,6 +144,19 @@ def fastapi_command(args: Any) -> int:
     host = args.host
     port = args.port
     reload = args.reload and not args.no_reload
+    storage = getattr(args, "storage", None)
+    workers = getattr(args, "workers", 1)
+
+    if workers < 1:
+        print_error("--workers must be at least 1")
+        return 1
+    if workers > 1:
+        if (storage or os.environ.get("SWARM_SQUAD_STORAGE")) == "memory":
+            print_error("The memory storage backend cannot be shared by workers")
+            return 1
+        if reload:
+            print_warning("Auto-reload is not supported with workers; disabling it")
+            reload = False
 
     # Check if port is in use
     if is_port_in_use(port, host):
@@ -139,6 +176,9 @@ def fastapi_command(args: Any) -> int:
     print_info(f"  Host: {host}")
     print_info(f"  Port: {port}")
     print_info(f"  Reload: {reload}")
+    print_info(f"  Workers: {workers}")
+    if storage:
+        print_info(f"  Storage: {storage}")
     print_info(f"  Project Root: {project_root}")
 
     # Create process manager
@@ -159,7 +199,7 @@ def fastapi_command(args: Any) -> int:
         print_info("Press Ctrl+C to stop the server")
 
         if not process_manager.start_process(
-            host, port, reload, project_root, dev_mode
+            host, port, reload, project_root, dev_mode, storage, workers
         ):
             return 1
 
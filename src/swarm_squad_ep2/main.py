@@ -137,6 +137,18 @@ Examples:
         action="store_true",
         help="Disable auto-reload",
     )
+    fastapi_parser.add_argument(
+        "--storage",
+        choices=["sqlite", "memory"],
+        default=None,
+        help="Storage backend (default: $SWARM_SQUAD_STORAGE or sqlite)",
+    )
+    fastapi_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes; more than 1 disables auto-reload (default: 1)",
+    )
     fastapi_parser.set_defaults(func=fastapi_command)
 
     # WebUI command
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark the CPU cost of WebSocket broadcasts as subscribers grow.
+
+Broadcasts simulator-like vehicle updates to several rooms through the
+RoomConnectionManager, with in-process fake WebSockets as subscribers, and
+reports CPU time per message for the encode-once path next to the previous
+path that let every subscriber encode its own copy.
+
+Usage:
+    python -m swarm_squad_ep2.scripts.benchmark_broadcast --subscribers 1,10,100,1000
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+# Add the src directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from swarm_squad_ep2.api.connections import (
+    RoomConnectionManager,
+    conflation_key,
+)
+
+
+class FakeWebSocket:
+    """Subscriber that encodes like Starlette's WebSocket and discards frames."""
+
+    client = None
+
+    def __init__(self):
+        self.frames = 0
+
+    async def accept(self, subprotocol: Optional[str] = None):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def send_text(self, data: str):
+        self.frames += 1
+
+    async def send_json(self, data):
+        await self.send_text(
+            json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        )
+
+
+class PerSubscriberManager(RoomConnectionManager):
+    """The previous broadcast path: each subscriber's writer encodes the dict."""
+
+    async def broadcast_to_rooms(self, message: dict, rooms: List[str]):
+        for room in rooms:
+            connections = self.active_connections.get(room)
+            if not connections:
+                continue
+            payload = {**message, "room_id": room}
+            key = conflation_key(payload)
+            for connection in connections:
+                client = self.clients.get(connection)
+                if client is not None:
+                    client.offer(payload, key)
+
+
+def make_message(i: int) -> dict:
+    """A vehicle update shaped like the ones the simulator sends."""
+    return {
+        "timestamp": "2025-01-01T00:00:00",
+        "entity_id": "v1",
+        "room_id": "v1",
+        "message": f"Vehicle v1 update {i}: moving at 42.0 km/h, battery 87.5%",
+        "message_type": "vehicle_update",
+        "state": {
+            "latitude": 40.7128 + i * 1e-6,
+            "longitude": -74.006,
+            "speed": 42.0,
+            "battery": 87.5,
+            "status": "moving",
+            "heading": 90.0,
+        },
+    }
+
+
+async def run_case(
+    manager_cls, subscribers: int, messages: int, rooms: List[str], batch: int
+) -> float:
+    """Return CPU seconds per message for one manager and subscriber count."""
+    # Large queues so no frame is dropped and every subscriber gets every frame
+    manager = manager_cls(queue_size=batch * len(rooms) + 1, policy="drop_oldest")
+    sockets = [FakeWebSocket() for _ in range(subscribers)]
+    for i, ws in enumerate(sockets):
+        await manager.connect(ws, [rooms[i % len(rooms)]])
+
+    start = time.process_time()
+    for i in range(messages):
+        await manager.broadcast_to_rooms(make_message(i), rooms)
+        if (i + 1) % batch == 0:
+            # Let the writer tasks drain their queues
+            while any(client.depth for client in manager.clients.values()):
+                await asyncio.sleep(0)
+    while any(client.depth for client in manager.clients.values()):
+        await asyncio.sleep(0)
+    elapsed = time.process_time() - start
+
+    delivered = sum(ws.frames for ws in sockets)
+    assert delivered == messages * subscribers, (delivered, messages * subscribers)
+    for ws in sockets:
+        manager.disconnect(ws)
+    return elapsed / messages
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--subscribers",
+        default="1,10,100,1000",
+        help="Comma-separated subscriber counts (default: 1,10,100,1000)",
+    )
+    parser.add_argument(
+        "--messages", type=int, default=500, help="Messages per case (default: 500)"
+    )
+    parser.add_argument(
+        "--rooms",
+        default="v1,vl1,master-vehicles",
+        help="Comma-separated target rooms; subscribers are spread across them",
+    )
+    parser.add_argument(
+        "--batch", type=int, default=50, help="Messages between drains (default: 50)"
+    )
+    args = parser.parse_args()
+
+    rooms = args.rooms.split(",")
+    counts = [int(n) for n in args.subscribers.split(",")]
+
+    print(f"{args.messages} messages to {len(rooms)} rooms ({', '.join(rooms)})\n")
+    print(
+        f"{'subscribers':>11}  {'per-subscriber':>16}  {'encode-once':>16}  {'speedup':>7}"
+    )
+    for count in counts:
+        before = await run_case(
+            PerSubscriberManager, count, args.messages, rooms, args.batch
+        )
+        after = await run_case(
+            RoomConnectionManager, count, args.messages, rooms, args.batch
+        )
+        print(
+            f"{count:>11}  {before * 1e6:>11.1f} µs/msg  {after * 1e6:>11.1f} µs/msg"
+            f"  {before / after:>6.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -13,9 +13,9 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from swarm_squad_ep2.api.database import (
     clear_all_data,
+    close_db_connection,
     connect_to_db,
-    get_all_llms,
-    get_all_vehicles,
+    count_entities,
 )
 
 
@@ -29,31 +29,32 @@ async def clear_database():
 
     print("✓ Connected to SQLite database")
 
-    # Count existing records
-    vehicles = await get_all_vehicles()
-    llms = await get_all_llms()
-    
-    vehicle_count = len(vehicles)
-    llm_count = len(llms)
+    try:
+        # Count existing records
+        vehicle_count = await count_entities("vehicle")
+        llm_count = await count_entities("llm")
 
-    print("\nFound:")
-    print(f"  - {vehicle_count} vehicles")
-    print(f"  - {llm_count} LLMs")
+        print("\nFound:")
+        print(f"  - {vehicle_count} vehicles")
+        print(f"  - {llm_count} LLMs")
 
-    if vehicle_count == 0 and llm_count == 0:
-        print("\n✓ Database is already clean!")
-        return
+        if vehicle_count == 0 and llm_count == 0:
+            print("\n✓ Database is already clean!")
+            return
+
+        # Clear all data
+        print("\nClearing database...")
+        success = await clear_all_data()
 
-    # Clear all data
-    print("\nClearing database...")
-    success = await clear_all_data()
-    
-    if success:
-        print(f"  ✓ Deleted {vehicle_count} vehicles")
-        print(f"  ✓ Deleted {llm_count} LLMs")
-        print("\n🎉 Database cleared successfully!")
-    else:
-        print("❌ Failed to clear database")
+        if success:
+            print(f"  ✓ Deleted {vehicle_count} vehicles")
+            print(f"  ✓ Deleted {llm_count} LLMs")
+            print("\n🎉 Database cleared successfully!")
+        else:
+            print("❌ Failed to clear database")
+    finally:
+        # Flush queued writes before exiting
+        await close_db_connection()
 
 
 if __name__ == "__main__":
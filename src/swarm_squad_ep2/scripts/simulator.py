@@ -2,6 +2,7 @@ import asyncio
 import json
 import math
 import random
+from contextlib import nullcontext
 from datetime import datetime, timezone
 
 from swarm_squad_ep2.api.models import MessageType
@@ -133,9 +134,18 @@ class Vehicle:
 class VehicleSimulator:
     """Manages multiple vehicles and their communication."""
 
-    def __init__(self, num_vehicles: int = 3):
-        """Initialize simulator with specified number of vehicles."""
+    def __init__(self, num_vehicles: int = 3, stream: bool = True):
+        """
+        Initialize simulator with specified number of vehicles.
+
+        With `stream`, telemetry is published over one WebSocket with batched
+        acks instead of a POST per update; it falls back to POST when the
+        server does not let the simulator publish, e.g. without a token.
+        """
         self.client = SwarmClient()
+        self.stream = stream
+        self.publisher = None
+        self.reported_failures = 0
         self.vehicles = {}
 
         # Create vehicles
@@ -149,53 +159,69 @@ class VehicleSimulator:
             vehicle.update()
             message = vehicle.to_message()
 
-            # Get list of rooms to broadcast to
-            broadcast_rooms = (
-                [
-                    vehicle.v2v_room_id,  # Vehicle's own V2V room
-                    vehicle.veh2llm_room_id,  # Vehicle-to-LLM communication room
-                    "master-vehicles",  # Master vehicle room for aggregation
-                ]
-                + vehicle.get_neighbor_rooms()
-            )  # Rooms of nearby vehicles
-
-            # Send messages to all rooms concurrently
-            send_tasks = []
-            for room_id in set(broadcast_rooms):
-                task = self.client.send_message(
-                    room_id=room_id,
+            # Get list of rooms to broadcast to, own room first
+            broadcast_rooms = list(
+                dict.fromkeys(
+                    [
+                        vehicle.v2v_room_id,  # Vehicle's own V2V room
+                        vehicle.veh2llm_room_id,  # Vehicle-to-LLM communication room
+                        "master-vehicles",  # Master vehicle room for aggregation
+                    ]
+                    + vehicle.get_neighbor_rooms()  # Rooms of nearby vehicles
+                )
+            )
+
+            # Publish once; the server stores it once and fans it out
+            if self.publisher is not None and self.publisher.authorized:
+                result = await self.publisher.publish(
+                    broadcast_rooms,
+                    vehicle.id,
+                    message["message"],
+                    message["message_type"],
+                    message["state"],
+                )
+            else:
+                result = await self.client.send_message_to_rooms(
+                    room_ids=broadcast_rooms,
                     entity_id=vehicle.id,
                     content=message["message"],
                     message_type=message["message_type"],
                     state=message["state"],
                 )
-                send_tasks.append(task)
-            
-            # Wait for all sends to complete
-            results = await asyncio.gather(*send_tasks, return_exceptions=True)
-            
-            # Log results
-            for i, result in enumerate(results):
-                room_id = list(set(broadcast_rooms))[i]
-                if isinstance(result, Exception):
-                    print(f"Failed to send message for vehicle {vehicle.id} to room {room_id}: {result}")
-                elif result:
-                    print(f"\n[{room_id}] {message['message']}")
-                    print("State:", json.dumps(message["state"], indent=2))
-                else:
-                    print(f"Failed to send message for vehicle {vehicle.id} to room {room_id}")
-                    
+
+            # Log result
+            if result:
+                print(f"\n[{', '.join(broadcast_rooms)}] {message['message']}")
+                print("State:", json.dumps(message["state"], indent=2))
+            else:
+                print(
+                    f"Failed to send message for vehicle {vehicle.id} "
+                    f"to rooms {broadcast_rooms}"
+                )
+
         except Exception as e:
             print(f"Error updating vehicle {vehicle.id}: {e}")
 
+    def _report_publish_failures(self):
+        """Print streamed messages the server rejected since the last report."""
+        if self.publisher is None:
+            return
+        failed = self.publisher.failed - self.reported_failures
+        if failed:
+            print(f"Server rejected {failed} streamed message(s)")
+            self.reported_failures = self.publisher.failed
+            if not self.publisher.authorized:
+                print("Not authorized to stream; sending telemetry over HTTP")
+
     async def run(self):
         """Run the simulation."""
         print("Starting vehicle simulation...")
         print(f"Simulating {len(self.vehicles)} vehicles")
         print("Press Ctrl+C to stop")
-        
+
         # Wait for the API to be ready before starting simulation
         import aiohttp
+
         max_wait = 30  # Wait up to 30 seconds
         wait_time = 0
         while wait_time < max_wait:
@@ -209,13 +235,19 @@ class VehicleSimulator:
                 print(f"Waiting for FastAPI server... ({wait_time}s)")
                 await asyncio.sleep(2)
                 wait_time += 2
-        
+
         if wait_time >= max_wait:
             print("⚠ Warning: FastAPI server may not be ready, continuing anyway...")
 
         while True:  # Outer loop for reconnection
             try:
-                async with self.client:
+                # Telemetry goes over one publish socket, or HTTP without it
+                async with (
+                    self.client,
+                    (
+                        self.client.publish_stream() if self.stream else nullcontext()
+                    ) as self.publisher,
+                ):
                     # Create initial LLM entities for each vehicle
                     print("Creating LLM entities...")
                     for vehicle_id in self.vehicles.keys():
@@ -225,10 +257,13 @@ class VehicleSimulator:
                             entity_id=llm_id,
                             content=f"LLM {llm_id} initialized and ready for vehicle {vehicle_id}",
                             message_type="llm_response",
-                            state={"status": "active", "vehicle_id": vehicle_id}
+                            state={"status": "active", "vehicle_id": vehicle_id},
                         )
                         print(f"Created LLM entity: {llm_id}")
-                    
+
+                    if self.publisher is not None:
+                        print("Streaming telemetry over WebSocket")
+
                     while True:  # Inner loop for simulation
                         try:
                             # Process all vehicles concurrently
@@ -236,9 +271,10 @@ class VehicleSimulator:
                             for vehicle in self.vehicles.values():
                                 task = self._update_vehicle(vehicle)
                                 tasks.append(task)
-                            
+
                             # Execute all vehicle updates concurrently
                             await asyncio.gather(*tasks, return_exceptions=True)
+                            self._report_publish_failures()
 
                             # Wait before next update
                             await asyncio.sleep(0.25)  # Update 4x more frequently
@@ -4,18 +4,18 @@ import json
 from swarm_squad_ep2.scripts.utils.client import SwarmClient
 
 
-async def monitor_room(client: SwarmClient, room_id: str):
-    """Monitor messages in a specific room."""
+async def monitor_rooms(client: SwarmClient, room_ids: list):
+    """Monitor messages of several rooms over one read-only event stream."""
 
     async def message_handler(data):
-        print(f"\n[{room_id}] {data['message']}")
+        print(f"\n[{data['room_id']}] {data['message']}")
         if "state" in data and data["state"]:
             print(f"State: {json.dumps(data['state'], indent=2)}")
 
     try:
-        await client.subscribe_to_room(room_id, message_handler)
+        await client.stream_rooms(room_ids, message_handler)
     except Exception as e:
-        print(f"Error monitoring room {room_id}: {e}")
+        print(f"Error monitoring rooms {', '.join(room_ids)}: {e}")
 
 
 async def main():
@@ -27,7 +27,7 @@ async def main():
     v2l_room = "vl1"  # Vehicle 1's Vehicle-to-LLM room
     l2l_room = "l1"  # Vehicle 1's LLM room
 
-    print("Starting WebSocket clients...")
+    print("Starting event stream client...")
     print("This will connect to Vehicle 1's rooms:")
     print("- V2V Room (v1): Vehicle-to-Vehicle communication")
     print("- V2L Room (vl1): Vehicle-to-LLM communication")
@@ -36,12 +36,8 @@ async def main():
 
     async with client:
         try:
-            # Connect to all rooms concurrently
-            await asyncio.gather(
-                monitor_room(client, v2v_room),
-                monitor_room(client, v2l_room),
-                monitor_room(client, l2l_room),
-            )
+            # One stream carries all rooms
+            await monitor_rooms(client, [v2v_room, v2l_room, l2l_room])
         except KeyboardInterrupt:
             print("\nStopping clients...")
         except Exception as e:
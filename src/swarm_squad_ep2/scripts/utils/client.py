@@ -1,15 +1,196 @@
 import asyncio
 import json
 import logging
+import os
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import Any, Awaitable, Callable, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 import aiohttp
 
+from swarm_squad_ep2.api.wire import SUBPROTOCOL, Decoder
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
 
+def unpack_batch(data: Any) -> List[Any]:
+    """Get the messages of a received JSON frame, which may be a batch array."""
+    return data if isinstance(data, list) else [data]
+
+
+class PublishStream:
+    """
+    Publishes messages over one WebSocket instead of a POST per message.
+
+    Messages are sent without waiting for replies; those sent in the same
+    event loop iteration go out as one frame. The server stores them and
+    acks them in batches. Messages are kept until acked and resent after a
+    reconnect, so the server may see a message twice but never loses one.
+    Messages the server rejects are logged and counted in `failed`; once it
+    refuses to let this client publish at all, `authorized` turns False
+    and publish() raises PermissionError.
+
+    Args:
+        client: Client whose server to publish to
+        token: Publish token; defaults to $SWARM_SQUAD_PUBLISH_TOKEN
+        max_unacked: Messages sent but not acked before publish() waits
+    """
+
+    def __init__(
+        self,
+        client: "SwarmClient",
+        token: Optional[str] = None,
+        max_unacked: int = 1024,
+    ):
+        self.client = client
+        self.token = token or os.environ.get("SWARM_SQUAD_PUBLISH_TOKEN")
+        self.max_unacked = max_unacked
+        self._unacked: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._outbox: List[Dict[str, Any]] = []
+        self._next_id = 0
+        self._has_outbox = asyncio.Event()
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._task: Optional[asyncio.Task] = None
+        self.acked = 0
+        self.failed = 0
+        self.authorized = True
+
+    @property
+    def pending(self) -> int:
+        """Messages not acked yet."""
+        return len(self._unacked)
+
+    async def __aenter__(self) -> "PublishStream":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Stop publishing; messages not acked yet are abandoned."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(
+        self,
+        room_ids: List[str],
+        entity_id: str,
+        content: str,
+        message_type: str,
+        state: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """
+        Queue a message for several rooms, like send_message_to_rooms().
+
+        Returns:
+            The message's ID, echoed in the server's ack
+
+        Raises:
+            PermissionError: If the server does not let this client publish
+        """
+        if not self.authorized:
+            raise PermissionError("Not authorized to publish; set a publish token")
+        while len(self._unacked) >= self.max_unacked:
+            self._has_room.clear()
+            await self._has_room.wait()
+        self._next_id += 1
+        frame = {
+            "action": "publish",
+            "id": self._next_id,
+            "room_ids": list(room_ids),
+            "entity_id": entity_id,
+            "content": content,
+            "message_type": message_type,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "state": state if state is not None else {},
+        }
+        self._unacked[self._next_id] = frame
+        self._outbox.append(frame)
+        self._has_outbox.set()
+        return self._next_id
+
+    async def _run(self) -> None:
+        """Keep the socket open, resending what was not acked on reconnect."""
+        url = f"{self.client.ws_url}/ws"
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        while True:
+            try:
+                if not self.client.session and not await self.client.connect():
+                    await asyncio.sleep(self.client.retry_delay * 2)
+                    continue
+                async with self.client.session.ws_connect(
+                    url,
+                    headers=headers,
+                    heartbeat=self.client.heartbeat_interval,
+                    timeout=self.client.ws_timeout,
+                ) as ws:
+                    logger.info("Publish stream connected")
+                    self._outbox = list(self._unacked.values())
+                    if self._outbox:
+                        self._has_outbox.set()
+                    writer = asyncio.create_task(self._write(ws))
+                    try:
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                if msg.data == "ping":
+                                    await ws.send_str("pong")
+                                    continue
+                                self._handle_reply(msg.data)
+                            elif msg.type == aiohttp.WSMsgType.ERROR:
+                                break
+                    finally:
+                        writer.cancel()
+                logger.warning("Publish stream closed; reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Publish stream error: {e}")
+            await asyncio.sleep(self.client.retry_delay)
+
+    async def _write(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        while True:
+            await self._has_outbox.wait()
+            self._has_outbox.clear()
+            frames, self._outbox = self._outbox, []
+            await ws.send_json(frames if len(frames) > 1 else frames[0])
+
+    def _handle_reply(self, data: str) -> None:
+        try:
+            reply = json.loads(data)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(reply, dict) or reply.get("action") != "publish":
+            return
+        if reply.get("type") == "ack":
+            for message_id in reply.get("ids", []):
+                if self._unacked.pop(message_id, None) is not None:
+                    self.acked += 1
+        elif reply.get("type") == "error" and reply.get("status") == 403:
+            if self.authorized:
+                logger.error(f"Server refused publishing: {reply.get('detail')}")
+                self.authorized = False
+            # Nothing sent will be accepted; give up on all of it
+            self.failed += len(self._unacked)
+            self._unacked.clear()
+            self._outbox.clear()
+        elif reply.get("type") == "error":
+            logger.error(
+                f"Server rejected message {reply.get('id')}: {reply.get('detail')}"
+            )
+            if self._unacked.pop(reply.get("id"), None) is not None:
+                self.failed += 1
+        if len(self._unacked) < self.max_unacked:
+            self._has_room.set()
+
+
 class SwarmClient:
     """Client for connecting to the Swarm Squad API and WebSocket services."""
 
@@ -27,7 +208,7 @@ class SwarmClient:
         # Connection settings
         self.max_retries = 3
         self.retry_delay = 1  # seconds
-        self.heartbeat_interval = 25  # seconds (less than server's 30s)
+        self.heartbeat_interval = 25  # seconds between WebSocket protocol pings
         self.ws_timeout = 60  # seconds
 
     def get_db(self):
@@ -120,6 +301,34 @@ class SwarmClient:
             message_type: Type of message
             state: Optional state data to include
 
+        Returns:
+            Dict with server response or None if sending failed
+        """
+        return await self.send_message_to_rooms(
+            [room_id], entity_id, content, message_type, state
+        )
+
+    async def send_message_to_rooms(
+        self,
+        room_ids: List[str],
+        entity_id: str,
+        content: str,
+        message_type: str,
+        state: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Send one message to several rooms with automatic retries.
+
+        The server stores the message once and broadcasts it to every room,
+        instead of storing a copy per room as separate sends would.
+
+        Args:
+            room_ids: Target room identifiers; the first is the primary room
+            entity_id: Source entity identifier
+            content: Message content
+            message_type: Type of message
+            state: Optional state data to include
+
         Returns:
             Dict with server response or None if sending failed
         """
@@ -130,7 +339,7 @@ class SwarmClient:
                 return None
 
         message_data = {
-            "room_id": room_id,
+            "room_ids": list(room_ids),
             "entity_id": entity_id,
             "content": content,
             "message_type": message_type,
@@ -141,7 +350,7 @@ class SwarmClient:
         retries = 0
         while retries < self.max_retries:
             try:
-                logger.debug(f"Sending message to {room_id}: {content}")
+                logger.debug(f"Sending message to {', '.join(room_ids)}: {content}")
                 async with self.session.post(
                     f"{self.base_url}/messages/",
                     json=message_data,
@@ -168,16 +377,101 @@ class SwarmClient:
         logger.error("Failed to send message after maximum retries")
         return None
 
+    def publish_stream(
+        self, token: Optional[str] = None, max_unacked: int = 1024
+    ) -> PublishStream:
+        """
+        Open a stream publishing messages over one WebSocket, see PublishStream.
+
+        Use it as an async context manager:
+
+            async with client.publish_stream() as stream:
+                await stream.publish(["v1", "vl1"], "v1", "...", "vehicle_update")
+        """
+        return PublishStream(self, token, max_unacked)
+
+    async def update_subscriptions(
+        self,
+        ws: aiohttp.ClientWebSocketResponse,
+        action: str,
+        room_ids: Optional[List[str]] = None,
+        request_id: Optional[Any] = None,
+        max_rate: Optional[float] = None,
+        since: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """
+        Change the rooms of an open WebSocket without reconnecting.
+
+        The server answers with an ack (or error) frame of `type` "ack",
+        echoing `request_id` and listing the connection's subscribed rooms.
+
+        Args:
+            ws: Open WebSocket connection to the /ws endpoint
+            action: "subscribe", "unsubscribe" or "list"
+            room_ids: Rooms to subscribe to or unsubscribe from
+            request_id: Optional ID echoed in the acknowledgement
+            max_rate: On subscribe, most updates per second per entity to
+                receive from these rooms; superseded states are skipped
+            since: On subscribe, last `seq` seen per room, to be replayed
+                the messages missed since
+        """
+        control: Dict[str, Any] = {"action": action}
+        if room_ids is not None:
+            control["rooms"] = room_ids
+        if request_id is not None:
+            control["id"] = request_id
+        if max_rate is not None:
+            control["max_rate"] = max_rate
+        if since:
+            control["since"] = since
+        await ws.send_json(control)
+
     async def subscribe_to_room(
-        self, room_id: str, callback: Callable[[Dict[str, Any]], Awaitable[None]]
+        self,
+        room_id: str,
+        callback: Callable[[Dict[str, Any]], Awaitable[None]],
+        binary: bool = False,
+        batch_ms: Optional[float] = None,
+        on_gap: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
     ) -> None:
         """
         Subscribe to WebSocket updates from a room with automatic reconnection.
 
+        On reconnect, the messages published while disconnected are replayed
+        from the server's buffer, resuming after the last `seq` received.
+
         Args:
             room_id: Room identifier to subscribe to
             callback: Async function to call with received messages
+            binary: Request the compact binary encoding of vehicle updates;
+                they are decoded into the same message dicts, without the
+                rendered message text
+            batch_ms: Let the server batch messages for up to this many
+                milliseconds; batches are unpacked before `callback`
+            on_gap: Async function to call with the server's "gap" frame
+                when missed messages could not all be replayed; they can be
+                fetched from /messages/history
         """
+        url = f"{self.ws_url}/ws?rooms={room_id}"
+        if batch_ms:
+            url += f"&batch_ms={batch_ms}"
+        last_seq: Optional[int] = None
+
+        async def deliver(data: Any) -> None:
+            nonlocal last_seq
+            if isinstance(data, dict):
+                if data.get("type") == "gap":
+                    logger.warning(
+                        f"Missed messages in {room_id} after seq {data['since']} "
+                        f"could not all be replayed (buffer starts at {data['first']})"
+                    )
+                    if on_gap is not None:
+                        await on_gap(data)
+                    return
+                if "seq" in data:
+                    last_seq = data["seq"]
+            await callback(data)
+
         while True:  # Keep trying to reconnect
             try:
                 if not self.session:
@@ -191,66 +485,67 @@ class SwarmClient:
 
                 logger.info(f"Connecting to room: {room_id}")
                 async with self.session.ws_connect(
-                    f"{self.ws_url}/ws?rooms={room_id}",
+                    url if last_seq is None else f"{url}&since={last_seq}",
                     heartbeat=self.heartbeat_interval,
                     timeout=self.ws_timeout,
                     receive_timeout=self.ws_timeout,
+                    protocols=(SUBPROTOCOL,) if binary else (),
                 ) as ws:
                     logger.info(f"Connected to room: {room_id}")
+                    # Interned strings are per connection
+                    decoder = Decoder() if ws.protocol == SUBPROTOCOL else None
 
-                    # Create a lock for receive operations
-                    receive_lock = asyncio.Lock()
-
-                    # Start heartbeat task
-                    heartbeat_task = asyncio.create_task(
-                        self._heartbeat_loop(ws, receive_lock)
-                    )
-
-                    try:
-                        while True:  # Keep receiving messages
-                            try:
-                                async with receive_lock:
-                                    msg = await ws.receive()
-
-                                if msg.type == aiohttp.WSMsgType.TEXT:
-                                    if msg.data == "pong":  # Skip heartbeat responses
-                                        continue
-                                    try:
-                                        data = json.loads(msg.data)
-                                        await callback(data)
-                                    except json.JSONDecodeError:
-                                        logger.warning(
-                                            f"Received invalid JSON: {msg.data[:50]}..."
-                                        )
-                                        continue
-                                    except Exception as e:
-                                        logger.error(
-                                            f"Error processing message in {room_id}: {e}"
-                                        )
-                                elif msg.type == aiohttp.WSMsgType.ERROR:
+                    while True:  # Keep receiving messages
+                        try:
+                            msg = await ws.receive()
+
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                # Answer the server's heartbeat
+                                if msg.data == "ping":
+                                    await ws.send_str("pong")
+                                    continue
+                                if msg.data == "pong":
+                                    continue
+                                try:
+                                    for data in unpack_batch(json.loads(msg.data)):
+                                        await deliver(data)
+                                except json.JSONDecodeError:
+                                    logger.warning(
+                                        f"Received invalid JSON: {msg.data[:50]}..."
+                                    )
+                                    continue
+                                except Exception as e:
+                                    logger.error(
+                                        f"Error processing message in {room_id}: {e}"
+                                    )
+                            elif (
+                                msg.type == aiohttp.WSMsgType.BINARY
+                                and decoder is not None
+                            ):
+                                try:
+                                    for data in decoder.decode_all(msg.data):
+                                        await deliver(data)
+                                except ValueError as e:
+                                    logger.warning(f"Invalid binary frame: {e}")
+                                except Exception as e:
                                     logger.error(
-                                        f"WebSocket error in {room_id}: {ws.exception()}"
+                                        f"Error processing message in {room_id}: {e}"
                                     )
-                                    break
-                                elif msg.type == aiohttp.WSMsgType.CLOSED:
-                                    logger.info(f"WebSocket closed for {room_id}")
-                                    break
-                            except asyncio.CancelledError:
-                                raise
-                            except Exception as e:
+                            elif msg.type == aiohttp.WSMsgType.ERROR:
                                 logger.error(
-                                    f"Error receiving message in {room_id}: {e}"
+                                    f"WebSocket error in {room_id}: {ws.exception()}"
                                 )
-                                if "Connection reset by peer" in str(e):
-                                    break
-                                await asyncio.sleep(0.1)  # Brief pause before retry
-                    finally:
-                        # Cancel heartbeat task
-                        heartbeat_task.cancel()
-                        try:
-                            await heartbeat_task
+                                break
+                            elif msg.type == aiohttp.WSMsgType.CLOSED:
+                                logger.info(f"WebSocket closed for {room_id}")
+                                break
                         except asyncio.CancelledError:
-                            pass
+                            raise
+                        except Exception as e:
+                            logger.error(f"Error receiving message in {room_id}: {e}")
+                            if "Connection reset by peer" in str(e):
+                                break
+                            await asyncio.sleep(0.1)  # Brief pause before retry
 
             except asyncio.CancelledError:
                 raise
@@ -259,40 +554,86 @@ class SwarmClient:
                 await asyncio.sleep(self.retry_delay)
                 continue  # Try to reconnect
 
-    async def _heartbeat_loop(
-        self, ws: aiohttp.ClientWebSocketResponse, receive_lock: asyncio.Lock
+    async def stream_rooms(
+        self,
+        room_ids: List[str],
+        callback: Callable[[Dict[str, Any]], Awaitable[None]],
+        on_gap: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
     ) -> None:
         """
-        Maintain heartbeat for WebSocket connection.
+        Receive messages of several rooms over the read-only /stream endpoint.
+
+        Server-Sent Events need no WebSocket handshake or heartbeat; the
+        server sends keep-alives. On reconnect the stream resumes in every
+        room after the last event received, via `Last-Event-ID`.
 
         Args:
-            ws: WebSocket connection to maintain
-            receive_lock: Lock to prevent heartbeat and message receipt conflicts
+            room_ids: Rooms to receive; entries ending in `*` are prefixes
+            callback: Async function to call with received messages
+            on_gap: Async function to call with the server's "gap" frame
+                when missed messages could not all be replayed
         """
-        try:
-            while True:
-                try:
-                    await asyncio.sleep(self.heartbeat_interval)
-                    await ws.send_str("ping")
-                    async with receive_lock:
-                        msg = await ws.receive()
-                        if msg.type != aiohttp.WSMsgType.TEXT or msg.data != "pong":
-                            logger.warning("Invalid heartbeat response")
-                            await ws.close()
-                            break
-                        logger.debug("Heartbeat successful")
-                except asyncio.CancelledError:
-                    raise
-                except Exception as e:
-                    logger.error(f"Heartbeat error: {e}")
-                    try:
-                        await ws.close()
-                    except Exception:
-                        pass
-                    break
-        except asyncio.CancelledError:
-            logger.debug("Heartbeat loop cancelled")
-            raise
+        url = f"{self.base_url}/stream?rooms={','.join(room_ids)}"
+        last_event_id: Optional[str] = None
+
+        while True:  # Keep trying to reconnect
+            try:
+                if not self.session:
+                    if not await self.connect():
+                        await asyncio.sleep(self.retry_delay * 2)
+                        continue
+
+                headers = {"Accept": "text/event-stream"}
+                if last_event_id:
+                    headers["Last-Event-ID"] = last_event_id
+                async with self.session.get(
+                    url,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(sock_read=self.ws_timeout),
+                ) as response:
+                    response.raise_for_status()
+                    logger.info(f"Streaming rooms: {', '.join(room_ids)}")
+                    event, data = None, []
+                    async for raw in response.content:
+                        line = raw.decode("utf-8").rstrip("\r\n")
+                        if line:
+                            field, _, value = line.partition(":")
+                            value = value[1:] if value.startswith(" ") else value
+                            if field == "id":
+                                last_event_id = value
+                            elif field == "event":
+                                event = value
+                            elif field == "data":
+                                data.append(value)
+                            continue
+                        # A blank line ends the event; comments carry no data
+                        if data:
+                            message = json.loads("\n".join(data))
+                            if event == "gap":
+                                after = (
+                                    "the last event"
+                                    if message["since"] is None
+                                    else f"seq {message['since']}"
+                                )
+                                logger.warning(
+                                    f"Missed messages in {message['room_id']} after "
+                                    f"{after} could not all be replayed"
+                                )
+                                if on_gap is not None:
+                                    await on_gap(message)
+                            else:
+                                try:
+                                    await callback(message)
+                                except Exception as e:
+                                    logger.error(f"Error processing message: {e}")
+                        event, data = None, []
+                logger.info("Stream closed by server")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Stream error for {', '.join(room_ids)}: {e}")
+            await asyncio.sleep(self.retry_delay)
 
     async def __aenter__(self):
         """Async context manager entry."""
@@ -7,7 +7,7 @@ import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 
-from swarm_squad_ep2.scripts.utils.client import SwarmClient
+from swarm_squad_ep2.scripts.utils.client import SwarmClient, unpack_batch
 
 
 # Provide a dummy create_simulation_resources function to avoid import errors
@@ -43,6 +43,8 @@ class VehicleVisualizer:
         self.connected = False
         self.last_update = {}
         self.ws_tasks = []
+        self.ws = None
+        self.last_seq = {}  # Last seq received per room, to resume after reconnects
 
         # Initialize vehicle data storage
         self.vehicles = {}
@@ -189,34 +191,69 @@ class VehicleVisualizer:
         except aiohttp.ClientError:
             return False
 
-    async def subscribe_to_vehicle(self, vehicle_id: str):
-        """Subscribe to a vehicle's room with automatic reconnection."""
+    async def subscribe_to_vehicles(self, vehicle_ids):
+        """Watch the vehicles' rooms over one connection, reconnecting as needed."""
         while True:
             try:
-                print(f"Connecting to vehicle {vehicle_id}...")
+                print(f"Connecting to vehicles {', '.join(vehicle_ids)}...")
                 await self.client.connect()
                 async with self.client.session.ws_connect(
-                    f"{self.client.ws_url}/ws?rooms={vehicle_id}",
+                    # Let the server batch updates into fewer frames
+                    f"{self.client.ws_url}/ws?batch_ms=50",
                     heartbeat=30,
                 ) as ws:
-                    print(f"✅ Connected to vehicle {vehicle_id}")
+                    self.ws = ws
+                    await self.client.update_subscriptions(
+                        ws, "subscribe", vehicle_ids, since=self.last_seq
+                    )
                     async for msg in ws:
                         if msg.type == aiohttp.WSMsgType.TEXT:
+                            # Answer the server's heartbeat
+                            if msg.data == "ping":
+                                await ws.send_str("pong")
+                                continue
                             try:
-                                data = json.loads(msg.data)
-                                # Process the message immediately
-                                await self.update_vehicle_data(data)
+                                for data in unpack_batch(json.loads(msg.data)):
+                                    if not isinstance(data, dict):
+                                        continue
+                                    kind = data.get("type")
+                                    if kind in ("ack", "error"):
+                                        print(f"Subscription {data['action']}: {data}")
+                                        continue
+                                    if kind == "gap":
+                                        print(f"Missed updates in {data['room_id']}")
+                                        continue
+                                    if "seq" in data:
+                                        self.last_seq[data["room_id"]] = data["seq"]
+                                    # Process the message immediately
+                                    await self.update_vehicle_data(data)
                                 # Force a redraw of the plot
                                 self.fig.canvas.draw_idle()
                                 self.fig.canvas.flush_events()
                             except Exception as e:
-                                print(f"Error processing message for {vehicle_id}: {e}")
+                                print(f"Error processing vehicle message: {e}")
                         elif msg.type == aiohttp.WSMsgType.ERROR:
-                            print(f"WebSocket error for {vehicle_id}: {ws.exception()}")
+                            print(f"WebSocket error: {ws.exception()}")
                             break
             except Exception as e:
-                print(f"Connection error for {vehicle_id}: {e}")
+                print(f"Connection error for vehicles: {e}")
                 await asyncio.sleep(1)
+            finally:
+                self.ws = None
+
+    async def watch_vehicle(self, vehicle_id: str):
+        """Add a vehicle to the open connection's subscriptions."""
+        if vehicle_id not in self.vehicles:
+            self.vehicles[vehicle_id] = {
+                "lat": [],
+                "lon": [],
+                "speed": [],
+                "battery": [],
+                "status": "unknown",
+            }
+            self.last_update[vehicle_id] = None
+        if self.ws is not None and not self.ws.closed:
+            await self.client.update_subscriptions(self.ws, "subscribe", [vehicle_id])
 
     async def update_vehicle_data(self, message):
         """Update vehicle data when receiving WebSocket messages."""
@@ -380,11 +417,9 @@ class VehicleVisualizer:
 
         # Create WebSocket connections first
         async with self.client:
-            # Start WebSocket tasks for each vehicle
-            for i in range(1, self.num_vehicles + 1):
-                vehicle_id = f"v{i}"
-                task = asyncio.create_task(self.subscribe_to_vehicle(vehicle_id))
-                self.ws_tasks.append(task)
+            # One WebSocket watches the rooms of all vehicles
+            task = asyncio.create_task(self.subscribe_to_vehicles(list(self.vehicles)))
+            self.ws_tasks.append(task)
 
             # Wait a moment for initial connections
             await asyncio.sleep(1)
@@ -23,6 +23,7 @@ export default function Page() {
     isConnected: wsConnected,
     messages: wsMessages,
     sendMessage,
+    updateRooms,
   } = useWebSocket();
 
   const currentRoom = allRooms.find((room) => room.id === currentRoomId);
@@ -123,6 +124,8 @@ export default function Page() {
               `Room count increased from ${allRooms.length} to ${rooms.length}, updating`,
             );
             setAllRooms(rooms);
+            // Watch the new rooms on the existing connection
+            updateRooms(rooms.map((room) => room.id));
 
             // Re-organize categories with new rooms
             const categories = [
@@ -168,7 +171,7 @@ export default function Page() {
       const interval = setInterval(loadRooms, 10000);
       return () => clearInterval(interval);
     }
-  }, [wsConnected, allRooms.length, isRefreshing]);
+  }, [wsConnected, allRooms.length, isRefreshing, updateRooms]);
 
   // Debug logging
   useEffect(() => {
@@ -32,6 +32,8 @@ export function useWebSocket() {
   const historicalMessagesLoaded = useRef(false);
   const roomsCached = useRef(false);
   const fetchingRooms = useRef(false); // Prevent concurrent room fetching
+  const subscribedRooms = useRef<string[]>([]); // Rooms acknowledged by the server
+  const controlId = useRef(0); // ID of the last control message sent
 
   // Fetch available rooms from API (with periodic refresh)
   const fetchAvailableRooms = useCallback(async () => {
@@ -184,6 +186,7 @@ export function useWebSocket() {
       return null;
     }
 
+    subscribedRooms.current = rooms;
     const websocketUrl = `ws://localhost:8000/ws?rooms=${rooms.join(",")}`;
     console.log("Connecting to WebSocket:", websocketUrl);
     console.log("Subscribing to rooms:", rooms);
@@ -197,23 +200,6 @@ export function useWebSocket() {
       setError(null);
       // Reset reconnection attempts on successful connection
       reconnectAttempts.current = 0;
-
-      // Start heartbeat to keep connection alive
-      const heartbeatInterval = setInterval(() => {
-        if (ws.readyState === WebSocket.OPEN) {
-          try {
-            ws.send(JSON.stringify("ping"));
-          } catch (error) {
-            console.error("Failed to send heartbeat:", error);
-            clearInterval(heartbeatInterval);
-          }
-        } else {
-          clearInterval(heartbeatInterval);
-        }
-      }, 25000); // Send heartbeat every 25 seconds
-
-      // Store interval reference to clean up later
-      (ws as any).heartbeatInterval = heartbeatInterval;
     };
 
     ws.onmessage = (event) => {
@@ -234,6 +220,15 @@ export function useWebSocket() {
           return;
         }
 
+        // Answer the server's heartbeat so it keeps the connection open
+        if (event.data === "ping") {
+          ws.send("pong");
+          return;
+        }
+        if (event.data === "pong") {
+          return;
+        }
+
         let data;
         try {
           data = JSON.parse(event.data);
@@ -254,6 +249,17 @@ export function useWebSocket() {
           return;
         }
 
+        // Handle acknowledgements of subscribe/unsubscribe/list
+        if (data && (data.type === "ack" || data.type === "error")) {
+          if (data.type === "error") {
+            console.error(`Subscription ${data.action} failed:`, data.detail);
+          } else {
+            console.log(`Subscription ${data.action} acknowledged:`, data.rooms);
+            subscribedRooms.current = data.subscribed;
+          }
+          return;
+        }
+
         console.log("Received WebSocket message:", data);
 
         // Handle both message formats (from API and real-time)
@@ -302,11 +308,6 @@ export function useWebSocket() {
       console.log("WebSocket disconnected:", event.code, event.reason);
       setIsConnected(false);
 
-      // Clean up heartbeat interval
-      if ((ws as any).heartbeatInterval) {
-        clearInterval((ws as any).heartbeatInterval);
-      }
-
       // Only attempt reconnect if it wasn't a manual close
       if (event.code !== 1000) {
         // Exponential backoff with jitter
@@ -323,7 +324,8 @@ export function useWebSocket() {
 
         setTimeout(() => {
           console.log("Attempting to reconnect...");
-          connectWebSocket(rooms);
+          // Reconnect to the rooms watched at the time of the disconnect
+          connectWebSocket(subscribedRooms.current);
         }, jitteredDelay);
       }
     };
@@ -361,10 +363,6 @@ export function useWebSocket() {
     return () => {
       isMounted = false;
       if (ws) {
-        // Clean up heartbeat interval
-        if ((ws as any).heartbeatInterval) {
-          clearInterval((ws as any).heartbeatInterval);
-        }
         // Close WebSocket connection
         if (ws.readyState === WebSocket.OPEN) {
           ws.close(1000, "Component unmounting");
@@ -373,6 +371,41 @@ export function useWebSocket() {
     };
   }, []); // Remove dependencies to prevent re-initialization
 
+  // Change the watched rooms on the open connection, without reconnecting
+  const updateRooms = useCallback(
+    (rooms: string[]) => {
+      if (!socket || socket.readyState !== WebSocket.OPEN) {
+        return false;
+      }
+      const current = new Set(subscribedRooms.current);
+      const wanted = new Set(rooms);
+      const added = rooms.filter((room) => !current.has(room));
+      const removed = subscribedRooms.current.filter(
+        (room) => !wanted.has(room),
+      );
+      if (added.length > 0) {
+        socket.send(
+          JSON.stringify({
+            action: "subscribe",
+            rooms: added,
+            id: ++controlId.current,
+          }),
+        );
+      }
+      if (removed.length > 0) {
+        socket.send(
+          JSON.stringify({
+            action: "unsubscribe",
+            rooms: removed,
+            id: ++controlId.current,
+          }),
+        );
+      }
+      return true;
+    },
+    [socket],
+  );
+
   // Send message function
   const sendMessage = useCallback(async (roomId: string, content: string) => {
     try {
@@ -434,5 +467,6 @@ export function useWebSocket() {
     error,
     availableRooms,
     sendMessage,
+    updateRooms,
   };
 }